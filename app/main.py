@@ -8,18 +8,24 @@ from __future__ import annotations
 
 import os
 import uuid
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Optional
 import json
 import logging
+import time
 
-import requests
 from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from services.llm.client import llm_metrics
 from services.predictor.heuristic import infer_from_hits
-from services.orch.rag import predict_with_llm
-from services.orch.llm_reranker import rerank_with_llm
+from services.orch.answer_cache import create_answer_cache
+from services.orch.http_pool import aclose_clients
+from services.orch.kb_transport import get_kb_transport
+from services.orch.pipeline import run_prediction_pipeline, stream_prediction_pipeline
+from services.orch.rerank_cache import get_rerank_cache
+from services.orch.rerankers import get_reranker
 
 
 APP_TITLE = "FixeatAI - Predictor de Fallas"
@@ -29,6 +35,10 @@ APP_DESCRIPTION = "Sistema inteligente de diagnóstico de fallas con RAG y LLM"
 MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:7070")
 TRACE_HEADER = os.getenv("X_TRACE_ID_HEADER", "X-Trace-Id")
 USE_LLM = os.getenv("USE_LLM", "true").lower() == "true"
+# Transporte a la KB: "http" (servidor MCP) o "inprocess" (demo_kb en este proceso)
+KB_TRANSPORT = get_kb_transport(MCP_SERVER_URL)
+# Cache semántico de diagnósticos (reportes casi idénticos del mismo equipo)
+ANSWER_CACHE = create_answer_cache()
 
 
 app = FastAPI(
@@ -49,6 +59,29 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def _warmup_inprocess_kb() -> None:
+    """Con KB_TRANSPORT=inprocess, carga modelo y Chroma en segundo plano."""
+    if KB_TRANSPORT.name == "inprocess" and os.getenv("KB_WARMUP_ON_STARTUP", "true").lower() == "true":
+        from services.kb.demo_kb import start_warmup
+
+        start_warmup()
+
+
+@app.on_event("startup")
+def _warmup_reranker() -> None:
+    """Carga el cross-encoder (RERANKER=cross-encoder) en segundo plano."""
+    reranker = get_reranker()
+    if USE_LLM and hasattr(reranker, "warmup"):
+        reranker.warmup()
+
+
+@app.on_event("shutdown")
+async def _close_http_pools() -> None:
+    """Cierra los pools HTTP compartidos hacia MCP y LLM."""
+    await aclose_clients()
+
+
 def build_response(
     data: Any,
     message: str = "OK",
@@ -73,6 +106,87 @@ def log_event(level: int, trace_id: Optional[str], event: str, **kwargs: Any) ->
     logging.log(level, json.dumps(payload, ensure_ascii=False))
 
 
+def _build_contextos(ranked_hits: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Contextos citables con la relevancia asignada por el re-ranker."""
+    return [
+        {
+            "fuente": hit["doc_id"],
+            "score": hit["score"],
+            "relevance_score": hit.get("llm_relevance_score", 0),
+            "confidence_label": hit.get("llm_confidence", "Media"),
+            "llm_explanation": hit.get("llm_explanation", ""),
+            "contexto": hit.get("context", hit.get("snippet", ""))[:1500],
+            "document_url": hit.get("document_url"),
+            "metadata": {
+                "page": hit.get("metadata", {}).get("page"),
+                "source": hit.get("metadata", {}).get("source"),
+                "brand": hit.get("metadata", {}).get("brand"),
+                "model": hit.get("metadata", {}).get("model"),
+                "source_file": hit.get("metadata", {}).get("source_file"),  # Nombre archivo original
+                "chunk_type": hit.get("metadata", {}).get("chunk_type"),  # Tipo de chunk
+            },
+        }
+        for hit in ranked_hits
+    ]
+
+
+def _build_basic_contextos(hits: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Contextos citables directo de los hits de la KB (sin re-ranking)."""
+    return [
+        {
+            "fuente": hit["doc_id"],
+            "score": hit["score"],
+            "contexto": hit.get("context", hit.get("snippet", ""))[:1500],
+            "document_url": hit.get("document_url"),
+            "metadata": {
+                "page": hit.get("metadata", {}).get("page"),
+                "source": hit.get("metadata", {}).get("source"),
+            }
+        }
+        for hit in hits
+    ]
+
+
+def _cached_answer(probe: Any, t_start: float) -> dict[str, Any]:
+    """Respuesta servida desde el cache semántico de respuestas."""
+    data = probe.data
+    print(f"⚡ Cache de respuestas: hit (similitud {probe.similarity:.3f})")
+    data["signals"].update({
+        "cache_hit": True,
+        "cache_similarity": round(probe.similarity, 4),
+        "kb_searches": 0,
+        "timings_ms": {"total": round((time.perf_counter() - t_start) * 1000, 1)},
+    })
+    return data
+
+
+def _attach_contextos(data: dict[str, Any], ranked_hits: list[dict[str, Any]], descripcion: str) -> None:
+    """Agrega `contextos` (y `fuentes` si faltan) a la respuesta del pipeline LLM."""
+    if ranked_hits:
+        # Construir contextos con información del re-ranker
+        data["contextos"] = _build_contextos(ranked_hits)
+        
+        # Log de top 3 para debugging
+        print(f"📊 Top 3 documentos según re-ranker:")
+        for i, ctx in enumerate(data["contextos"][:3], 1):
+            relevance = ctx.get('relevance_score', 0)
+            emoji = "🎯" if relevance >= 80 else "⭐" if relevance >= 60 else "📄"
+            print(f"  {emoji} {i}. {ctx['fuente'][:60]}")
+            print(f"     Relevancia: {relevance}% ({ctx['confidence_label']})")
+            if ctx.get('llm_explanation'):
+                print(f"     Razón: {ctx['llm_explanation'][:80]}...")
+        
+        # Actualizar fuentes
+        if "fuentes" not in data or not data["fuentes"]:
+            data["fuentes"] = [hit["doc_id"] for hit in ranked_hits[:10]]
+    else:
+        # Fallback: lista vacía pero con estructura válida
+        print(f"⚠️  ADVERTENCIA: No se encontraron documentos para '{descripcion}'")
+        data["contextos"] = []
+        if "fuentes" not in data:
+            data["fuentes"] = []
+
+
 class PredictRequest(BaseModel):
     """Request model para predicción de fallas."""
     cliente: dict
@@ -82,7 +196,7 @@ class PredictRequest(BaseModel):
 
 
 @app.post("/api/v1/predict-fallas")
-def predict_fallas(
+async def predict_fallas(
     req: PredictRequest,
     x_trace_id: Optional[str] = Header(default=None, alias=TRACE_HEADER),
 ) -> dict[str, Any]:
@@ -96,112 +210,59 @@ def predict_fallas(
     - Contextos citables del Knowledge Base
 
     Flujo:
-    1. Búsqueda híbrida en KB (semántica + keywords)
-    2. LLM Re-Ranker para ordenar por relevancia
-    3. Análisis con GPT-4o-mini usando RAG
-    4. Respuesta estructurada con protocolos de seguridad
+    1. Búsqueda híbrida en KB (semántica + keywords), una sola vez por request
+    2. Análisis con GPT-4o-mini usando RAG y re-ranking de los mismos hits
+       para ordenar `contextos` (cross-encoder local o LLM según `RERANKER`),
+       en paralelo por defecto
+       (ver `services.orch.pipeline`)
+    3. Respuesta estructurada con protocolos de seguridad
+
+    `signals.kb_searches` reporta cuántas búsquedas a la KB se ejecutaron y
+    `signals.timings_ms` la latencia de cada etapa. Con `signals.cache_hit`
+    el diagnóstico salió del cache semántico de respuestas
+    (`services.orch.answer_cache`) sin recuperar ni llamar al LLM.
+
+    Es asíncrono: MCP y LLM se llaman por pools HTTP compartidos
+    (`services.orch.http_pool`), sin retener un thread mientras se espera.
     """
-    if USE_LLM:
-        # Modo LLM: RAG Pipeline completo
-        data = predict_with_llm(MCP_SERVER_URL, req.descripcion_problema, req.equipo, top_k=10)
+    t_start = time.perf_counter()
+    probe = await ANSWER_CACHE.alookup(KB_TRANSPORT, req.descripcion_problema, req.equipo) if USE_LLM else None
+    if probe is not None and probe.hit:
+        # Reporte casi idéntico ya diagnosticado para este equipo con la KB actual
+        data = _cached_answer(probe, t_start)
+        hits = data.get("contextos", [])
+        kb_searches = 0
+    elif USE_LLM:
+        # Modo LLM: RAG Pipeline completo (diagnóstico y re-ranking según PREDICT_PIPELINE_MODE)
+        data = await run_prediction_pipeline(
+            MCP_SERVER_URL, req.descripcion_problema, req.equipo, top_k=10, transport=KB_TRANSPORT
+        )
         
-        # Usar los hits que ya recuperó predict_with_llm
-        hits = data.pop("_raw_hits", [])
-        
-        # GARANTIZAR que SIEMPRE haya contextos en la respuesta
-        if not hits or "contextos" not in data or not data.get("contextos"):
-            print(f"⚠️  No hay hits disponibles, haciendo búsqueda directa de contextos...")
-            try:
-                response = requests.post(
-                    f"{MCP_SERVER_URL}/tools/kb_search_hybrid",
-                    json={
-                        "query": req.descripcion_problema,
-                        "top_k": 10,
-                        "semantic_weight": 0.3,
-                        "keyword_weight": 0.7,
-                        "context_chars": 2000
-                    },
-                    timeout=15,
-                )
-                hits = response.json().get("hits", [])
-                print(f"✅ Búsqueda directa: {len(hits)} hits encontrados")
-            except Exception as e:
-                print(f"❌ Error en búsqueda directa de contextos: {e}")
-                hits = []
-
-        # APLICAR LLM RE-RANKER
-        if hits:
-            marca = req.equipo.get("marca") or req.equipo.get("brand") if req.equipo else None
-            modelo = req.equipo.get("modelo") or req.equipo.get("model") if req.equipo else None
-            
-            print(f"🤖 Aplicando LLM Re-Ranker (query: '{req.descripcion_problema[:50]}...')")
-            print(f"   Equipo: {marca or 'N/A'} {modelo or 'N/A'}")
-            print(f"   Candidatos: {len(hits)} documentos")
-            
-            # LLM analiza y ordena por relevancia REAL
-            ranked_hits = rerank_with_llm(
-                query=req.descripcion_problema,
-                candidates=hits,
-                marca=marca,
-                modelo=modelo,
-                top_k=10
-            )
-            
-            # Construir contextos con información del LLM re-ranker
-            data["contextos"] = [
-                {
-                    "fuente": hit["doc_id"],
-                    "score": hit["score"],
-                    "relevance_score": hit.get("llm_relevance_score", 0),
-                    "confidence_label": hit.get("llm_confidence", "Media"),
-                    "llm_explanation": hit.get("llm_explanation", ""),
-                    "contexto": hit.get("context", hit.get("snippet", ""))[:1500],
-                    "document_url": hit.get("document_url"),
-                    "metadata": {
-                        "page": hit.get("metadata", {}).get("page"),
-                        "source": hit.get("metadata", {}).get("source"),
-                        "brand": hit.get("metadata", {}).get("brand"),
-                        "model": hit.get("metadata", {}).get("model"),
-                        "source_file": hit.get("metadata", {}).get("source_file"),  # Nombre archivo original
-                        "chunk_type": hit.get("metadata", {}).get("chunk_type"),  # Tipo de chunk
-                    },
-                }
-                for hit in ranked_hits
-            ]
-            
-            # Log de top 3 para debugging
-            print(f"📊 Top 3 documentos según LLM:")
-            for i, ctx in enumerate(data["contextos"][:3], 1):
-                relevance = ctx.get('relevance_score', 0)
-                emoji = "🎯" if relevance >= 80 else "⭐" if relevance >= 60 else "📄"
-                print(f"  {emoji} {i}. {ctx['fuente'][:60]}")
-                print(f"     Relevancia LLM: {relevance}% ({ctx['confidence_label']})")
-                if ctx.get('llm_explanation'):
-                    print(f"     Razón: {ctx['llm_explanation'][:80]}...")
-            
-            # Actualizar fuentes
-            if "fuentes" not in data or not data["fuentes"]:
-                data["fuentes"] = [hit["doc_id"] for hit in ranked_hits[:10]]
-        else:
-            # Fallback: lista vacía pero con estructura válida
-            print(f"⚠️  ADVERTENCIA: No se encontraron documentos para '{req.descripcion_problema}'")
-            data["contextos"] = []
-            if "fuentes" not in data:
-                data["fuentes"] = []
+        # Hits de la única recuperación (boost de modelo incluido) y su orden según el re-ranker
+        data.pop("_raw_hits", [])
+        data.pop("_retrieval", None)
+        ranked_hits = data.pop("_ranked_hits", [])
+        hits = ranked_hits
+        kb_searches = data["signals"]["kb_searches"]
+
+        _attach_contextos(data, ranked_hits, req.descripcion_problema)
+        data["signals"]["cache_hit"] = False
+        if probe is not None:
+            ANSWER_CACHE.store(probe, data)
     else:
         # Modo sin LLM: heurística basada en KB
         hits = []
+        kb_searches = 1
         try:
-            response = requests.post(
-                f"{MCP_SERVER_URL}/tools/kb_search_extended",
-                json={
+            hits = await KB_TRANSPORT.asearch(
+                "kb_search_extended",
+                {
                     "query": req.descripcion_problema, 
                     "top_k": 10,
                     "context_chars": 2000
                 },
-                timeout=5,
+                stage="kb_fallback",
             )
-            hits = response.json().get("hits", [])
         except Exception as e:
             print(f"Warning: No se pudo obtener hits de KB: {e}")
             hits = []
@@ -212,31 +273,127 @@ def predict_fallas(
             "fallas_probables": preds,
             "fuentes": [h.get("doc_id") for h in hits],
             "feedback_coherencia": "Respuesta basada en análisis heurístico",
-            "contextos": [
-                {
-                    "fuente": hit["doc_id"],
-                    "score": hit["score"],
-                    "contexto": hit.get("context", hit.get("snippet", ""))[:1500],
-                    "document_url": hit.get("document_url"),
-                    "metadata": {
-                        "page": hit.get("metadata", {}).get("page"),
-                        "source": hit.get("metadata", {}).get("source"),
-                    }
-                }
-                for hit in hits[:10]
-            ]
+            "contextos": _build_basic_contextos(hits[:10]),
+            "signals": {"kb_searches": kb_searches},
         }
     
-    log_event(logging.INFO, x_trace_id, "predict_fallas", num_hits=len(hits), llm_used=USE_LLM)
+    log_event(
+        logging.INFO, x_trace_id, "predict_fallas",
+        num_hits=len(hits), llm_used=USE_LLM, kb_searches=kb_searches,
+        cache_hit=bool(probe is not None and probe.hit),
+    )
     return build_response(data=data, message="Predicción generada", code="OK", trace_id=x_trace_id)
 
 
+def _sse(event: str, payload: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _predict_events(req: PredictRequest, trace_id: str) -> AsyncIterator[str]:
+    """Eventos SSE de `/api/v1/predict-fallas/stream` (ver el endpoint)."""
+    t_start = time.perf_counter()
+    try:
+        probe = await ANSWER_CACHE.alookup(KB_TRANSPORT, req.descripcion_problema, req.equipo) if USE_LLM else None
+        if probe is not None and probe.hit:
+            data = _cached_answer(probe, t_start)
+        elif not USE_LLM:
+            data = (await predict_fallas(req, trace_id))["data"]
+        else:
+            data = {}
+            fallas_emitted = 0
+            async for event, payload in stream_prediction_pipeline(
+                MCP_SERVER_URL, req.descripcion_problema, req.equipo, top_k=10, transport=KB_TRANSPORT
+            ):
+                if event == "retrieval":
+                    yield _sse("retrieval", {
+                        "hits": _build_basic_contextos(payload["hits"]),
+                        "kb_searches": payload["kb_searches"],
+                    })
+                elif event == "falla":
+                    yield _sse("falla", {"index": fallas_emitted, "falla": payload})
+                    fallas_emitted += 1
+                elif event == "ranked_hits":
+                    yield _sse("contextos", {"contextos": _build_contextos(payload)})
+                elif event == "prediction":
+                    data = payload
+            data.pop("_raw_hits", None)
+            data.pop("_retrieval", None)
+            _attach_contextos(data, data.pop("_ranked_hits", []), req.descripcion_problema)
+            data["signals"]["cache_hit"] = False
+            if probe is not None:
+                ANSWER_CACHE.store(probe, data)
+
+        if not USE_LLM or (probe is not None and probe.hit):
+            # Respuesta ya completa (cache o heurística): se reemite con los mismos eventos.
+            # La rama del LLM ya los emitió mientras se generaban (también si no hubo probe)
+            yield _sse("contextos", {"contextos": data.get("contextos", [])})
+            for i, falla in enumerate(data.get("fallas_probables", [])):
+                yield _sse("falla", {"index": i, "falla": falla})
+
+        log_event(
+            logging.INFO, trace_id, "predict_fallas_stream",
+            num_hits=len(data.get("contextos", [])), llm_used=USE_LLM,
+            kb_searches=data.get("signals", {}).get("kb_searches"),
+            cache_hit=bool(probe is not None and probe.hit),
+        )
+        yield _sse("done", build_response(data=data, message="Predicción generada", code="OK", trace_id=trace_id))
+    except Exception as e:
+        print(f"❌ Error en predict-fallas/stream: {e}")
+        yield _sse("error", {"traceId": trace_id, "message": str(e)})
+
+
+@app.post("/api/v1/predict-fallas/stream")
+async def predict_fallas_stream(
+    req: PredictRequest,
+    x_trace_id: Optional[str] = Header(default=None, alias=TRACE_HEADER),
+) -> StreamingResponse:
+    """📡 Predictor de Fallas en streaming (Server-Sent Events).
+
+    Mismo pipeline que `/api/v1/predict-fallas`, pero entrega resultados a
+    medida que están listos en vez de esperar la respuesta completa:
+
+    - `retrieval`: hits de la KB (`{"hits", "kb_searches"}`), apenas termina la búsqueda
+    - `falla`: cada falla probable (`{"index", "falla"}`) en cuanto el LLM la
+      termina de escribir; solo las que citan fuentes
+    - `contextos`: contextos ordenados por el re-ranker
+    - `done`: respuesta estándar completa (`fallas_probables` validadas,
+      `signals`, `quality_metrics`, ...); es la versión autoritativa
+    - `error`: `{"traceId", "message"}` si algo falla a mitad del stream
+
+    Diagnóstico y re-ranking corren siempre en paralelo. Con cache hit o
+    `USE_LLM=false` se emiten `contextos`, `falla` y `done` de inmediato.
+    """
+    return StreamingResponse(
+        _predict_events(req, x_trace_id or str(uuid.uuid4())),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/health")
 def health() -> dict[str, Any]:
     """✅ Health check endpoint."""
     return {"status": "ok", "service": "fixeat-ai-predictor", "version": APP_VERSION}
 
 
+@app.get("/api/v1/answer-cache/stats")
+def answer_cache_stats() -> dict[str, Any]:
+    """📈 Métricas del cache semántico de respuestas."""
+    return ANSWER_CACHE.stats()
+
+
+@app.get("/api/v1/rerank-cache/stats")
+def rerank_cache_stats() -> dict[str, Any]:
+    """📈 Métricas del cache de re-ranking (hits, misses, invalidaciones por generación de KB)."""
+    return get_rerank_cache().stats()
+
+
+@app.get("/api/v1/llm/metrics")
+def llm_agent_metrics() -> dict[str, Any]:
+    """📈 Métricas por agente LLM (diagnosis, rerank, ...): latencia, tokens y errores."""
+    return llm_metrics()
+
+
 @app.get("/")
 def root() -> dict[str, Any]:
     """📋 Root endpoint con información del servicio."""
@@ -246,9 +403,12 @@ def root() -> dict[str, Any]:
         "description": APP_DESCRIPTION,
         "endpoints": {
             "predict": "/api/v1/predict-fallas",
+            "predict_stream": "/api/v1/predict-fallas/stream",
             "health": "/health",
             "docs": "/docs"
         },
         "mcp_server": MCP_SERVER_URL,
+        "kb_transport": KB_TRANSPORT.name,
+        "reranker": get_reranker().name,
         "llm_enabled": USE_LLM
     }
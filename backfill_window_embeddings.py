@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Script para precalcular embeddings de ventanas en una KB existente.
+
+Las colecciones ingestadas antes de `KB_PRECOMPUTE_WINDOWS` no tienen
+ventanas guardadas, por lo que `kb_search_extended` sigue calculándolas
+en cada búsqueda. Este script recorre la colección y las persiste en
+`$CHROMA_PATH/window_embeddings.sqlite3`.
+
+Uso:
+    python backfill_window_embeddings.py --chroma-path ./chroma_local            # Ver qué se haría
+    python backfill_window_embeddings.py --chroma-path ./chroma_local --apply    # Aplicar
+    python backfill_window_embeddings.py --apply --all                          # Recalcular todo
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precalcular embeddings de ventanas de match para la KB"
+    )
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Aplicar cambios (por defecto solo muestra qué se haría)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=200,
+        help="Documentos por lote de embeddings (default: 200)"
+    )
+    parser.add_argument(
+        "--chroma-path",
+        type=str,
+        default=None,
+        help="Path a ChromaDB (default: CHROMA_PATH env o /data/chroma)"
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Recalcular también documentos que ya tienen ventanas vigentes"
+    )
+
+    args = parser.parse_args()
+
+    # demo_kb lee CHROMA_PATH al importarse
+    if args.chroma_path:
+        os.environ["CHROMA_PATH"] = args.chroma_path
+    chroma_path = os.getenv("CHROMA_PATH", "/data/chroma")
+
+    print("=" * 80)
+    print("🪟 BACKFILL DE VENTANAS - FIXEAT AI")
+    print("=" * 80)
+    print(f"📂 ChromaDB: {chroma_path}")
+
+    from services.kb import demo_kb
+
+    collection = demo_kb._get_collection()
+    if not demo_kb._chroma_persistent:
+        print(f"❌ No se pudo abrir ChromaDB persistente en {chroma_path}")
+        sys.exit(1)
+
+    total = collection.count()
+    stored = demo_kb._get_window_store().stats()["docs"]
+    print(f"📊 Documentos en colección: {total:,}")
+    print(f"📊 Documentos con ventanas guardadas: {stored:,}")
+    print()
+
+    if not args.apply:
+        print("🔍 Este fue un DRY RUN. Para calcular las ventanas ejecuta:")
+        print(f"   python backfill_window_embeddings.py --chroma-path {chroma_path} --apply")
+        return
+
+    start = time.time()
+    result = demo_kb.backfill_window_embeddings(
+        batch_size=args.batch_size,
+        only_missing=not args.all,
+    )
+    elapsed = time.time() - start
+
+    print()
+    print("=" * 80)
+    print("✅ RESUMEN")
+    print("=" * 80)
+    print(f"Documentos revisados: {result['scanned']:,}")
+    print(f"Ventanas calculadas: {result['computed']:,}")
+    print(f"⏱️  Tiempo: {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
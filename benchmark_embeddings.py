@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Paridad y benchmark de los backends de embeddings de la KB.
+
+1. Paridad: similitud coseno entre los embeddings de cada backend y los de
+   `torch` (referencia) sobre el mismo conjunto de textos. Falla (exit 1) si
+   la similitud mínima queda bajo `--min-cosine`.
+2. Benchmark: throughput (textos/s) y latencia p50/p95 por batch para
+   tamaños de batch 1, 32 y 256.
+
+Uso:
+    python benchmark_embeddings.py
+    python benchmark_embeddings.py --backends torch,onnx-int8 --repeats 20
+    python benchmark_embeddings.py --chroma-path ./chroma_local   # textos reales de la KB
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from services.kb.embeddings import create_embedding_backend
+
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+
+SAMPLE_TEXTS = [
+    "Service 25: error en el generador de vapor, revisar sensor de nivel y válvula de llenado.",
+    "iCombi Classic muestra servicio 34 al iniciar el ciclo de limpieza CareControl.",
+    "Desconectar la alimentación eléctrica antes de retirar el panel lateral del horno.",
+    "The fan motor does not start; check the motor protection switch and wiring.",
+    "Laminadora SINMAG SM-520 con ruido excesivo en el rodillo inferior.",
+    "Reemplazar el filtro de aire y verificar la bomba de desagüe.",
+    "Error 42: temperatura de cámara fuera de rango, calibrar la sonda.",
+    "S_10 Humidity sensor fault in cooking cabinet, replace sensor B4.",
+]
+
+
+def load_texts(chroma_path: str | None, limit: int) -> list[str]:
+    """Textos de la KB si se indica un Chroma, si no una muestra fija."""
+    if not chroma_path:
+        reps = max(1, limit // len(SAMPLE_TEXTS))
+        return (SAMPLE_TEXTS * reps)[:limit]
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=chroma_path).get_or_create_collection("kb_tech")
+    docs = collection.get(limit=limit, include=["documents"])["documents"] or []
+    return [d for d in docs if d] or SAMPLE_TEXTS
+
+
+def check_parity(reference, candidate) -> dict:
+    import numpy as np
+
+    cos = np.sum(reference * candidate, axis=1)
+    return {"min": float(cos.min()), "mean": float(cos.mean())}
+
+
+def benchmark(backend, texts: list[str], batch_size: int, repeats: int) -> dict:
+    batch = (texts * (batch_size // max(1, len(texts)) + 1))[:batch_size]
+    backend.encode(batch, batch_size=batch_size)  # warmup
+    latencies = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        backend.encode(batch, batch_size=batch_size)
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    p95_idx = min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[p95_idx] * 1000,
+        "texts_per_s": batch_size / statistics.mean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridad y benchmark de backends de embeddings")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8", help="Backends separados por coma")
+    parser.add_argument("--batch-sizes", default="1,32,256", help="Tamaños de batch separados por coma")
+    parser.add_argument("--repeats", type=int, default=10, help="Repeticiones por medición (default: 10)")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Coseno mínimo aceptado vs torch")
+    parser.add_argument("--chroma-path", default=None, help="Usar textos de esta KB en vez de la muestra")
+    parser.add_argument("--parity-texts", type=int, default=256, help="Textos para la paridad (default: 256)")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",") if b.strip()]
+    texts = load_texts(args.chroma_path or os.getenv("BENCH_CHROMA_PATH"), args.parity_texts)
+
+    print("=" * 80)
+    print("🧪 BACKENDS DE EMBEDDINGS - PARIDAD Y BENCHMARK")
+    print("=" * 80)
+    print(f"Modelo: {MODEL_ID} | textos: {len(texts)} | repeticiones: {args.repeats}")
+    print()
+
+    loaded = {}
+    for name in backends:
+        t0 = time.perf_counter()
+        try:
+            loaded[name] = create_embedding_backend(MODEL_ID, name)
+        except Exception as e:
+            print(f"⚠️  Backend {name} no disponible: {e}")
+            continue
+        print(f"✅ {name} cargado en {time.perf_counter() - t0:.1f}s")
+
+    parity_ok = True
+    if "torch" in loaded:
+        reference = loaded["torch"].encode(texts, batch_size=32)
+        print()
+        print("📐 Paridad vs torch (coseno)")
+        for name, backend in loaded.items():
+            if name == "torch":
+                continue
+            result = check_parity(reference, backend.encode(texts, batch_size=32))
+            ok = result["min"] >= args.min_cosine
+            parity_ok &= ok
+            print(f"  {'✅' if ok else '❌'} {name:10s} min={result['min']:.5f} mean={result['mean']:.5f}")
+    else:
+        print("⚠️  Sin backend torch: se omite la paridad")
+
+    print()
+    print(f"{'backend':10s} {'batch':>6s} {'p50 ms':>10s} {'p95 ms':>10s} {'textos/s':>10s}")
+    for name, backend in loaded.items():
+        for batch_size in batch_sizes:
+            r = benchmark(backend, texts, batch_size, args.repeats)
+            print(f"{name:10s} {batch_size:6d} {r['p50_ms']:10.1f} {r['p95_ms']:10.1f} {r['texts_per_s']:10.1f}")
+
+    return 0 if parity_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
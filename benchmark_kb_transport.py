@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Benchmark de transporte a la KB: MCP por HTTP vs llamadas in-process.
+
+Ejecuta las mismas búsquedas híbridas (payload de `predict_with_llm`) con
+ambos transportes y reporta latencia p50/p95 por búsqueda. Para que la
+comparación sea justa, el servidor MCP debe apuntar al mismo `CHROMA_PATH`
+y correr con `KB_RESULT_CACHE_SIZE=0` (si no, el modo HTTP mide el cache).
+
+Uso:
+    CHROMA_PATH=./chroma_local KB_RESULT_CACHE_SIZE=0 uvicorn mcp.server_demo:app --port 7070 &
+    CHROMA_PATH=./chroma_local python benchmark_kb_transport.py --mcp-url http://localhost:7070
+    python benchmark_kb_transport.py --transports inprocess --repeats 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from services.orch.kb_transport import get_kb_transport
+from services.orch.rag import _hybrid_payload
+
+
+SAMPLE_QUERIES = [
+    "service 25 generador de vapor",
+    "iCombi Classic servicio 34 CareControl",
+    "ventilador no arranca ruido motor",
+    "error 42 temperatura de cámara",
+    "laminadora SM-520 rodillo inferior ruido",
+    "fuga de agua en la puerta del horno",
+    "sensor de humedad S_10",
+    "bomba de desagüe no funciona",
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def run(transport, queries: list[str], repeats: int, top_k: int) -> dict:
+    # Warmup: carga del modelo (in-process) y apertura de conexiones (HTTP)
+    await transport.asearch("kb_search_hybrid", _hybrid_payload(queries[0], top_k))
+    latencies = []
+    hits = 0
+    for _ in range(repeats):
+        for query in queries:
+            t0 = time.perf_counter()
+            result = await transport.asearch("kb_search_hybrid", _hybrid_payload(query, top_k))
+            latencies.append(time.perf_counter() - t0)
+            hits += len(result)
+    return {
+        "searches": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "avg_hits": hits / max(1, len(latencies)),
+    }
+
+
+async def main_async(args) -> int:
+    transports = [t.strip() for t in args.transports.split(",") if t.strip()]
+    print("=" * 80)
+    print("🧪 TRANSPORTE A LA KB - HTTP vs IN-PROCESS")
+    print("=" * 80)
+    print(f"MCP: {args.mcp_url} | CHROMA_PATH: {os.getenv('CHROMA_PATH', '/data/chroma')}")
+    print(f"Queries: {len(SAMPLE_QUERIES)} x {args.repeats} repeticiones, top_k={args.top_k}")
+    print()
+    print(f"{'transporte':12s} {'búsquedas':>10s} {'p50 ms':>10s} {'p95 ms':>10s} {'hits':>6s}")
+    for name in transports:
+        transport = get_kb_transport(args.mcp_url, name)
+        try:
+            r = await run(transport, SAMPLE_QUERIES, args.repeats, args.top_k)
+        except Exception as e:
+            print(f"⚠️  {name}: no disponible ({e})")
+            continue
+        print(f"{name:12s} {r['searches']:10d} {r['p50_ms']:10.1f} {r['p95_ms']:10.1f} {r['avg_hits']:6.1f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTTP vs in-process para búsquedas en la KB")
+    parser.add_argument("--mcp-url", default=os.getenv("MCP_SERVER_URL", "http://localhost:7070"))
+    parser.add_argument("--transports", default="http,inprocess", help="Transportes separados por coma")
+    parser.add_argument("--repeats", type=int, default=10, help="Repeticiones del set de queries (default: 10)")
+    parser.add_argument("--top-k", type=int, default=10, help="top_k de predict_with_llm (default: 10)")
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
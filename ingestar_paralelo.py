@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""Ingesta masiva en paralelo hacia el MCP.
+
+A diferencia de `ingestar_via_api.py` / `ingestar_batch.py` (un PDF a la vez,
+`sleep` entre items y una conexión nueva por request):
+
+- Un pool acotado de workers (`--workers`) descarga y envía documentos en
+  paralelo sobre una sola `requests.Session` con pool de conexiones.
+- La concurrencia hacia el MCP es adaptativa (AIMD): sube de a uno mientras
+  las respuestas son exitosas y se reduce a la mitad ante 429/5xx o errores de
+  conexión, respetando `Retry-After`. El request rechazado se reintenta.
+- Reporta el throughput mientras corre (docs/s, páginas/s, chunks/s).
+
+Modos:
+- `pages` (default): descarga el PDF, lo separa por páginas (como
+  `ingestar_pdfs.py --by-page`) y envía lotes de `--batch-size` páginas.
+- `url`: el MCP descarga la URL (`kb_ingest` con `urls`); no reporta páginas.
+
+Con `--jobs` cada request se encola en `/tools/kb_ingest/jobs` y se consulta
+su estado hasta que termina: el MCP procesa como mucho `INGEST_JOB_WORKERS`
+ingestas a la vez y no hace falta un timeout de minutos por request.
+
+Uso:
+    python ingestar_paralelo.py --urls urls.txt --workers 8
+    python ingestar_paralelo.py --mode url --auto-curate --auto-learn
+    python ingestar_paralelo.py --mcp-url http://localhost:7070 --max-concurrency 4
+    python ingestar_paralelo.py --jobs --workers 16
+"""
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class AdaptiveLimiter:
+    """Límite de requests simultáneos al MCP con aumento aditivo / reducción multiplicativa."""
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1) -> None:
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = min(self.maximum, max(minimum, initial))
+        self.in_flight = 0
+        self.reductions = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        # +1 por cada "ventana" completa de respuestas exitosas
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_backpressure(self, pause_seconds: float) -> None:
+        with self._cond:
+            new_limit = max(self.minimum, self.limit // 2)
+            if new_limit < self.limit:
+                self.reductions += 1
+                print(f"🐢 Backpressure del MCP: concurrencia {self.limit} → {new_limit}, pausa {pause_seconds:.1f}s")
+            self.limit = new_limit
+            self._successes = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + pause_seconds)
+
+
+class Throughput:
+    """Totales acumulados y tasas desde el inicio."""
+
+    def __init__(self, total_docs: int) -> None:
+        self.total_docs = total_docs
+        self.docs = 0
+        self.failed = 0
+        self.pages = 0
+        self.chunks = 0
+        self.skipped = 0
+        self.retries = 0
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, ok: bool, pages: int = 0, chunks: int = 0, skipped: int = 0) -> None:
+        with self._lock:
+            if ok:
+                self.docs += 1
+            else:
+                self.failed += 1
+            self.pages += pages
+            self.chunks += chunks
+            self.skipped += skipped
+
+    def add_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def line(self, limiter: Optional[AdaptiveLimiter] = None) -> str:
+        elapsed = max(1e-6, time.perf_counter() - self.start)
+        done = self.docs + self.failed
+        text = (
+            f"[{done}/{self.total_docs}] {self.docs / elapsed:.2f} docs/s · "
+            f"{self.pages / elapsed:.1f} págs/s · {self.chunks / elapsed:.1f} chunks/s"
+        )
+        if limiter is not None:
+            text += f" · concurrencia {limiter.limit}"
+        return text
+
+
+def crear_sesion(pool_size: int) -> requests.Session:
+    """Sesión compartida por todos los workers (conexiones keep-alive reutilizadas)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "FixeatAI-ingesta/0.1"
+    return session
+
+
+def _retry_after(response: Optional[requests.Response], attempt: int) -> float:
+    if response is not None:
+        try:
+            return max(0.5, float(response.headers.get("Retry-After", "")))
+        except ValueError:
+            pass
+    return min(30.0, 1.0 * 2 ** attempt)
+
+
+def post_ingest(
+    session: requests.Session,
+    limiter: AdaptiveLimiter,
+    stats: Throughput,
+    mcp_url: str,
+    payload: Dict[str, Any],
+    timeout: float,
+    max_retries: int,
+    endpoint: str = "/tools/kb_ingest",
+) -> Dict[str, Any]:
+    """POST a `endpoint` respetando el límite adaptativo; reintenta ante 429/5xx."""
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        response = None
+        try:
+            response = session.post(f"{mcp_url}{endpoint}", json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error: Exception = e
+        else:
+            if response.status_code not in RETRYABLE_STATUS:
+                # Solo un 2xx cuenta para subir la concurrencia; un 4xx no se reintenta
+                response.raise_for_status()
+                limiter.on_success()
+                return response.json()
+            error = RuntimeError(f"HTTP {response.status_code}")
+        finally:
+            limiter.release()
+
+        if attempt == max_retries:
+            raise error
+        stats.add_retry()
+        limiter.on_backpressure(_retry_after(response, attempt))
+    raise RuntimeError("sin intentos")  # inalcanzable
+
+
+def esperar_job(session: requests.Session, mcp_url: str, job_id: str, timeout: float, poll_every: float) -> Dict[str, Any]:
+    """Consulta `/tools/kb_ingest/jobs/{id}` hasta que el trabajo termina; retorna su resultado."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = session.get(f"{mcp_url}/tools/kb_ingest/jobs/{job_id}", timeout=30)
+            response.raise_for_status()
+            job = response.json()
+        except (requests.ConnectionError, requests.Timeout):
+            job = {"status": "unknown"}  # MCP reiniciando: el trabajo sigue en la cola
+        if job["status"] == "done":
+            return job.get("result") or {}
+        if job["status"] == "failed":
+            raise RuntimeError(f"trabajo {job_id} falló: {job.get('error')}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"trabajo {job_id} sin terminar tras {timeout:.0f}s ({job['status']})")
+        time.sleep(poll_every)
+
+
+def enviar(payload: Dict[str, Any], args: argparse.Namespace, session: requests.Session,
+           limiter: AdaptiveLimiter, stats: Throughput) -> Dict[str, Any]:
+    """Ingesta síncrona o, con `--jobs`, encolada y esperada por polling."""
+    if not args.jobs:
+        return post_ingest(session, limiter, stats, args.mcp_url, payload,
+                           timeout=args.timeout, max_retries=args.retries)
+    job = post_ingest(session, limiter, stats, args.mcp_url, payload,
+                      timeout=60, max_retries=args.retries, endpoint="/tools/kb_ingest/jobs")
+    return esperar_job(session, args.mcp_url, job["job_id"], args.job_timeout, args.poll_every)
+
+
+def descargar(session: requests.Session, url: str, timeout: float, max_retries: int) -> bytes:
+    """Descarga con reintentos y backoff exponencial ante 429/5xx."""
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code not in RETRYABLE_STATUS:
+                response.raise_for_status()
+                return response.content
+            error: Exception = RuntimeError(f"HTTP {response.status_code}")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response, error = None, e
+        if attempt == max_retries:
+            raise error
+        time.sleep(_retry_after(response, attempt))
+    raise RuntimeError("sin intentos")  # inalcanzable
+
+
+def procesar_url(url: str, args: argparse.Namespace, session: requests.Session,
+                 limiter: AdaptiveLimiter, stats: Throughput) -> Dict[str, Any]:
+    """Descarga + envío de un documento. Retorna páginas y chunks ingresados."""
+    filename = url.split("/")[-1]
+
+    if args.mode == "url":
+        result = enviar(
+            {"urls": [url], "auto_curate": args.auto_curate, "auto_learn_taxonomy": args.auto_learn},
+            args, session, limiter, stats,
+        )
+        return {
+            "filename": filename,
+            "pages": 0,
+            "chunks": result.get("ingested", 0),
+            "skipped": result.get("kb", {}).get("skipped", 0),
+        }
+
+    import ingestar_pdfs
+
+    data = descargar(session, url, timeout=args.timeout, max_retries=args.retries)
+    stem = Path(filename).stem
+    documentos, total_paginas = ingestar_pdfs.documentos_por_pagina(
+        data, stem, ingestar_pdfs.inferir_metadata(stem, None, url)
+    )
+    chunks = skipped = 0
+    for i in range(0, len(documentos), args.batch_size):
+        result = enviar(
+            {
+                "docs": documentos[i:i + args.batch_size],
+                "auto_curate": args.auto_curate,
+                "auto_learn_taxonomy": args.auto_learn,
+            },
+            args, session, limiter, stats,
+        )
+        chunks += result.get("ingested", 0)
+        skipped += result.get("kb", {}).get("skipped", 0)
+    return {"filename": filename, "pages": total_paginas, "chunks": chunks, "skipped": skipped}
+
+
+def cargar_urls(path: Optional[str]) -> List[str]:
+    if path:
+        lines = Path(path).read_text(encoding="utf-8").splitlines()
+        urls = [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+    else:
+        from ingestar_via_api import URLS as urls
+    return list(dict.fromkeys(urls))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", help="Archivo con una URL por línea (default: lista de ingestar_via_api.py)")
+    parser.add_argument("--mcp-url", default="http://localhost:7070")
+    parser.add_argument("--mode", choices=("pages", "url"), default="pages")
+    parser.add_argument("--workers", type=int, default=8, help="Documentos en proceso simultáneo")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="Máximo de requests simultáneos al MCP (default: --workers)")
+    parser.add_argument("--initial-concurrency", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=10, help="Páginas por request en modo pages")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--report-every", type=float, default=10.0, help="Segundos entre reportes de throughput")
+    parser.add_argument("--jobs", action="store_true", help="Encolar en /tools/kb_ingest/jobs y esperar por polling")
+    parser.add_argument("--job-timeout", type=float, default=3600, help="Espera máxima por trabajo con --jobs")
+    parser.add_argument("--poll-every", type=float, default=2.0, help="Segundos entre consultas de estado con --jobs")
+    parser.add_argument("--auto-curate", action="store_true")
+    parser.add_argument("--auto-learn", action="store_true")
+    args = parser.parse_args()
+
+    urls = cargar_urls(args.urls)
+    max_concurrency = args.max_concurrency or args.workers
+    limiter = AdaptiveLimiter(initial=args.initial_concurrency, maximum=max_concurrency)
+    stats = Throughput(len(urls))
+    session = crear_sesion(pool_size=args.workers + max_concurrency)
+
+    print("=" * 80)
+    print("🚀 INGESTA PARALELA")
+    print("=" * 80)
+    print(f"📊 Total de documentos: {len(urls)}")
+    print(f"🔗 MCP URL: {args.mcp_url} (modo {args.mode}{', trabajos en cola' if args.jobs else ''})")
+    print(f"👷 Workers: {args.workers} · concurrencia MCP {args.initial_concurrency} → máx {max_concurrency}")
+    print("=" * 80)
+
+    fallidos: List[str] = []
+    finished = threading.Event()
+
+    def reporter() -> None:
+        while not finished.wait(args.report_every):
+            print(f"📈 {stats.line(limiter)}")
+
+    threading.Thread(target=reporter, name="throughput-reporter", daemon=True).start()
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(procesar_url, url, args, session, limiter, stats): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    result = future.result()
+                    stats.add(True, pages=result["pages"], chunks=result["chunks"], skipped=result["skipped"])
+                    print(
+                        f"✅ {result['filename']}: {result['pages']} págs, {result['chunks']} chunks "
+                        f"({result['skipped']} sin cambios) · {stats.line()}"
+                    )
+                except Exception as e:
+                    stats.add(False)
+                    fallidos.append(url)
+                    print(f"❌ {url.split('/')[-1]}: {str(e)[:150]} · {stats.line()}")
+    finally:
+        finished.set()
+        session.close()
+
+    elapsed = time.perf_counter() - stats.start
+    print("\n" + "=" * 80)
+    print("🏁 INGESTA COMPLETADA")
+    print("=" * 80)
+    print(f"✅ Exitosos: {stats.docs}/{len(urls)}")
+    print(f"❌ Fallidos: {stats.failed}/{len(urls)}")
+    print(f"📄 Páginas: {stats.pages} · 📦 Chunks: {stats.chunks} ({stats.skipped} sin cambios, no re-embebidos)")
+    print(f"🔁 Reintentos: {stats.retries} · reducciones de concurrencia: {limiter.reductions}")
+    print(f"⏱️  Tiempo total: {elapsed / 60:.1f} min · {stats.line()}")
+    for url in fallidos:
+        print(f"   - {url}")
+    print("=" * 80)
+    return 0 if not fallidos else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -115,6 +115,63 @@ def ingestar_pdf(archivo_path: str, metadata: dict = None, original_url: str = N
         return False
 
 
+def inferir_metadata(nombre_sin_ext: str, metadata: dict = None, source: str = None) -> dict:
+    """Metadatos base inferidos del nombre del archivo (ej: "SINMAG_SM520_manual").
+
+    Args:
+        nombre_sin_ext: Nombre del archivo sin extensión
+        metadata: Metadatos explícitos (tienen prioridad)
+        source: URL original o ruta del archivo
+    """
+    metadata = dict(metadata or {})
+    partes = nombre_sin_ext.split("_")
+
+    if len(partes) >= 2 and not metadata.get("brand"):
+        metadata["brand"] = partes[0]
+    if len(partes) >= 2 and not metadata.get("model"):
+        metadata["model"] = partes[1]
+    if "manual" in nombre_sin_ext.lower() and not metadata.get("doc_type"):
+        metadata["doc_type"] = "manual"
+    if source:
+        metadata["source"] = source
+    metadata.setdefault("language", "es")
+    return metadata
+
+
+def documentos_por_pagina(pdf_bytes: bytes, nombre_sin_ext: str, metadata: dict) -> tuple:
+    """Un documento por página con texto (PyMuPDF; pypdf si no está instalado).
+
+    Returns:
+        (documentos, total_paginas)
+    """
+    textos: List[str] = []
+    if PYMUPDF_AVAILABLE:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            textos = [pagina.get_text("text") for pagina in doc]
+    else:
+        import io
+        from pypdf import PdfReader
+
+        textos = [pagina.extract_text() or "" for pagina in PdfReader(io.BytesIO(pdf_bytes)).pages]
+
+    total_paginas = len(textos)
+    documentos = []
+    for num_pagina, texto in enumerate(textos, 1):
+        # Saltar páginas vacías
+        if not texto.strip():
+            continue
+        metadata_pagina = metadata.copy()
+        metadata_pagina["page"] = num_pagina  # Páginas empiezan en 1
+        metadata_pagina["total_pages"] = total_paginas
+        metadata_pagina["chunk_type"] = "page"
+        documentos.append({
+            "id": f"{nombre_sin_ext}_page_{num_pagina}",
+            "text": texto,
+            "metadata": metadata_pagina,
+        })
+    return documentos, total_paginas
+
+
 def ingestar_pdf_por_paginas(archivo_path: str, metadata: dict = None, original_url: str = None) -> bool:
     """Ingesta un PDF procesando cada página como documento separado.
     
@@ -136,64 +193,14 @@ def ingestar_pdf_por_paginas(archivo_path: str, metadata: dict = None, original_
         print(f"❌ Archivo no encontrado: {archivo}")
         return False
     
-    # Metadatos base
-    if metadata is None:
-        metadata = {}
-    
-    # Inferir metadatos del nombre del archivo
-    nombre_sin_ext = archivo.stem
-    partes = nombre_sin_ext.split("_")
-    
-    if len(partes) >= 2 and not metadata.get("brand"):
-        metadata["brand"] = partes[0]
-    if len(partes) >= 2 and not metadata.get("model"):
-        metadata["model"] = partes[1]
-    if "manual" in nombre_sin_ext.lower() and not metadata.get("doc_type"):
-        metadata["doc_type"] = "manual"
-    
-    # Forzar URL original si está disponible (prioridad sobre ruta local)
-    if original_url:
-        metadata["source"] = original_url
-    else:
-        metadata.setdefault("source", str(archivo))
-    metadata.setdefault("language", "es")
+    metadata = inferir_metadata(archivo.stem, metadata, original_url or str(archivo))
     
     print(f"📄 Procesando PDF por páginas: {archivo.name}...")
     
     try:
-        # Abrir PDF con PyMuPDF
-        doc = fitz.open(archivo_path)
-        total_paginas = len(doc)
+        documentos, total_paginas = documentos_por_pagina(archivo.read_bytes(), archivo.stem, metadata)
         print(f"   Total de páginas: {total_paginas}")
         
-        documentos = []
-        
-        # Procesar cada página
-        for num_pagina in range(total_paginas):
-            pagina = doc[num_pagina]
-            texto = pagina.get_text("text")
-            
-            # Saltar páginas vacías
-            if not texto.strip():
-                continue
-            
-            # Crear metadata específica de página
-            metadata_pagina = metadata.copy()
-            metadata_pagina["page"] = num_pagina + 1  # Páginas empiezan en 1
-            metadata_pagina["total_pages"] = total_paginas
-            metadata_pagina["chunk_type"] = "page"
-            
-            # Crear documento para esta página
-            doc_id = f"{archivo.stem}_page_{num_pagina + 1}"
-            
-            documentos.append({
-                "id": doc_id,
-                "text": texto,
-                "metadata": metadata_pagina
-            })
-        
-        doc.close()
-        
         print(f"   Páginas procesadas: {len(documentos)}")
         
         # Enviar documentos en lotes (para no sobrecargar el endpoint)
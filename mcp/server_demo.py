@@ -6,8 +6,9 @@ No implementa auth ni rate limiting; usar solo en desarrollo.
 from __future__ import annotations
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Any, List, Optional
+from typing import Any, Iterable, Iterator, List, Optional
 import hashlib
 import json
 import os
@@ -23,13 +24,32 @@ from services.kb.demo_kb import (
     kb_search_extended, 
     kb_search_hybrid,
     ingest_docs, 
-    get_all_documents
+    get_all_documents,
+    embed_queries,
+    get_kb_generation,
+    get_query_cache_stats,
+    iter_kb_search_batch,
+    readiness_status,
+    start_warmup,
 )
+from services.kb.ingest_jobs import IngestJobQueue, iter_stage, job_stage, report_progress
+from services.kb.pdf_extract import PdfExtractionError, iter_pdf_pages, shutdown_pool
+from services.kb.result_cache import SearchResultCache
 from services.taxonomy.auto_learner import TaxonomyAutoLearner
-from services.llm.client import LLMClient
+from services.llm.client import get_llm_client
 
 
 app = FastAPI(title="MCP Demo Server")
+
+# Cache de respuestas de búsqueda; se invalida completo cuando una ingesta cambia la KB
+_result_cache = SearchResultCache(
+    endpoints=["kb_search", "kb_search_extended", "kb_search_hybrid"],
+    generation=get_kb_generation,
+    max_entries=int(os.getenv("KB_RESULT_CACHE_SIZE", "512")),
+    max_bytes=int(float(os.getenv("KB_RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("KB_RESULT_CACHE_TTL", "600")),
+)
+
 @app.get("/tools/taxonomy")
 def get_taxonomy() -> dict:
     return _TAXONOMY
@@ -65,6 +85,17 @@ class KBSearchExtendedRequest(BaseModel):
     highlight_terms: bool = True  # NUEVO: Fase 3 - highlighting de términos
 
 
+@app.on_event("startup")
+def _warmup_kb() -> None:
+    """Carga modelo y Chroma en segundo plano para no bloquear el bind del puerto.
+
+    Mientras tanto `/ready` responde 503. Con KB_WARMUP_ON_STARTUP=false la
+    carga ocurre en la primera request.
+    """
+    if os.getenv("KB_WARMUP_ON_STARTUP", "true").lower() == "true":
+        start_warmup()
+
+
 @app.on_event("startup")
 def _seed_data() -> None:
     # Solo para desarrollo - deshabilitar en producción
@@ -76,11 +107,23 @@ def _seed_data() -> None:
         )
 
 
+@app.on_event("shutdown")
+def _shutdown_pdf_pool() -> None:
+    shutdown_pool()
+
+
 @app.post("/tools/kb_search")
 def tool_kb_search(req: KBSearchRequest) -> dict:
     """Búsqueda semántica en KB (versión original)."""
+    params = req.model_dump()
+    cached = _result_cache.get("kb_search", params)
+    if cached is not None:
+        return cached
+    generation = _result_cache.current_generation()
     hits = kb_search(req.query, req.top_k, req.where)
-    return {"hits": hits}
+    response = {"hits": hits, "kb_generation": generation}
+    _result_cache.put("kb_search", params, response, generation=generation)
+    return response
 
 
 @app.post("/tools/kb_search_extended")
@@ -100,7 +143,13 @@ def tool_kb_search_extended(req: KBSearchExtendedRequest) -> dict:
         - metadata: Metadata enriquecida con posiciones
         - full_text: Texto completo (si include_full_text=True)
     """
+    params = req.model_dump()
+    cached = _result_cache.get("kb_search_extended", params)
+    if cached is not None:
+        cached["query"] = req.query
+        return cached
     try:
+        generation = _result_cache.current_generation()
         hits = kb_search_extended(
             query=req.query,
             top_k=req.top_k,
@@ -109,13 +158,16 @@ def tool_kb_search_extended(req: KBSearchExtendedRequest) -> dict:
             include_full_text=req.include_full_text,
             highlight_terms=req.highlight_terms
         )
-        return {
+        response = {
             "hits": hits,
             "query": req.query,
             "context_chars": req.context_chars,
             "total_hits": len(hits),
-            "highlighting_enabled": req.highlight_terms
+            "highlighting_enabled": req.highlight_terms,
+            "kb_generation": generation,
         }
+        _result_cache.put("kb_search_extended", params, response, generation=generation)
+        return response
     except Exception as e:
         # Log error y retornar respuesta con error pero sin romper
         print(f"Error en kb_search_extended: {e}")
@@ -134,6 +186,7 @@ class KBSearchHybridRequest(BaseModel):
     semantic_weight: float = 0.5
     keyword_weight: float = 0.5
     context_chars: int = 2000
+    fusion: Optional[str] = None  # "weighted" | "rrf" (default: env KB_HYBRID_FUSION)
 
 
 @app.post("/tools/kb_search_hybrid")
@@ -150,6 +203,7 @@ def tool_kb_search_hybrid(req: KBSearchHybridRequest) -> dict:
         semantic_weight: Peso para score semántico (default 0.5)
         keyword_weight: Peso para score de keywords (default 0.5)
         context_chars: Caracteres de contexto ampliado
+        fusion: "weighted" o "rrf" (Reciprocal Rank Fusion denso + BM25)
         
     Returns:
         Dict con hits híbridos que incluyen:
@@ -159,25 +213,37 @@ def tool_kb_search_hybrid(req: KBSearchHybridRequest) -> dict:
         - error_codes_found: Códigos de error detectados en la query
         - context, metadata, document_url, etc.
     """
+    params = req.model_dump()
+    params["fusion"] = req.fusion or os.getenv("KB_HYBRID_FUSION", "weighted")
+    cached = _result_cache.get("kb_search_hybrid", params)
+    if cached is not None:
+        cached["query"] = req.query
+        return cached
     try:
+        generation = _result_cache.current_generation()
         hits = kb_search_hybrid(
             query=req.query,
             top_k=req.top_k,
             where=req.where,
             semantic_weight=req.semantic_weight,
             keyword_weight=req.keyword_weight,
-            context_chars=req.context_chars
+            context_chars=req.context_chars,
+            fusion=req.fusion
         )
-        return {
+        response = {
             "hits": hits,
             "query": req.query,
             "total_hits": len(hits),
             "search_type": "hybrid",
+            "fusion": req.fusion or os.getenv("KB_HYBRID_FUSION", "weighted"),
             "weights": {
                 "semantic": req.semantic_weight,
                 "keyword": req.keyword_weight
-            }
+            },
+            "kb_generation": generation,
         }
+        _result_cache.put("kb_search_hybrid", params, response, generation=generation)
+        return response
     except Exception as e:
         print(f"Error en kb_search_hybrid: {e}")
         import traceback
@@ -189,6 +255,84 @@ def tool_kb_search_hybrid(req: KBSearchHybridRequest) -> dict:
         }
 
 
+class KBBatchQuery(BaseModel):
+    query: str
+    top_k: int = 10
+    where: Optional[dict[str, Any]] = None
+
+
+class KBSearchBatchRequest(BaseModel):
+    """Request para búsqueda de muchas queries en una sola llamada."""
+    queries: List[KBBatchQuery]
+    mode: str = "hybrid"  # "hybrid" | "extended"
+    semantic_weight: float = 0.5
+    keyword_weight: float = 0.5
+    context_chars: int = 2000
+    fusion: Optional[str] = None
+    highlight_terms: bool = False  # solo mode="extended"
+    stream: bool = False  # NDJSON: una línea por query a medida que se resuelve
+
+
+@app.post("/tools/kb_search_batch")
+def tool_kb_search_batch(req: KBSearchBatchRequest):
+    """Búsqueda por lotes para jobs masivos (re-scoring de tickets, bootstrap de taxonomía).
+
+    Codifica todas las queries en un solo batch del modelo y consulta Chroma
+    con múltiples embeddings (una llamada por filtro `where` distinto).
+    Los resultados salen en el orden de entrada.
+
+    Returns:
+        Con stream=false: {"results": [...], "total_queries": N}
+        Con stream=true: NDJSON (application/x-ndjson), un objeto por query:
+        {"index", "query", "hits", "total_hits"} o {"index", "query", "hits": [], "error"}
+    """
+    try:
+        results = iter_kb_search_batch(
+            [q.model_dump() for q in req.queries],
+            mode=req.mode,
+            context_chars=req.context_chars,
+            semantic_weight=req.semantic_weight,
+            keyword_weight=req.keyword_weight,
+            fusion=req.fusion,
+            highlight_terms=req.highlight_terms,
+        )
+        if req.stream:
+            lines = (json.dumps(item, ensure_ascii=False, default=str) + "\n" for item in results)
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+        items = list(results)
+        return {"results": items, "total_queries": len(items), "mode": req.mode}
+    except Exception as e:
+        print(f"Error en kb_search_batch: {e}")
+        return {"results": [], "error": str(e), "total_queries": len(req.queries)}
+
+
+class KBEmbedRequest(BaseModel):
+    texts: List[str]
+
+
+@app.post("/tools/kb_embed")
+def tool_kb_embed(req: KBEmbedRequest):
+    """Embeddings normalizados de textos con el modelo de la KB (usa el cache de queries).
+
+    Incluye `kb_generation` para que los caches del lado de la API se invaliden
+    cuando cambia la KB.
+    """
+    try:
+        return embed_queries(req.texts)
+    except Exception as e:
+        print(f"Error en kb_embed: {e}")
+        return {"embeddings": [], "error": str(e)}
+
+
+@app.get("/tools/kb_cache/stats")
+def tool_kb_cache_stats() -> dict:
+    """Estadísticas de los caches de la KB (hits, misses, evictions, hit_rate)."""
+    return {
+        "query_embeddings": get_query_cache_stats(),
+        "search_results": _result_cache.stats(),
+    }
+
+
 class DBQueryRequest(BaseModel):
     sql: str
     params: Optional[list[Any]] = None
@@ -261,28 +405,19 @@ def _extract_text_from_html(html: str) -> str:
 
 
 def _extract_text_from_pdf(data: bytes) -> str:
+    """Texto completo del PDF (extraído en el pool de procesos, ver `services.kb.pdf_extract`)."""
     try:
-        from pypdf import PdfReader
-        buff = io.BytesIO(data)
-        reader = PdfReader(buff)
-        texts: list[str] = []
-        for page in reader.pages:
-            try:
-                texts.append(page.extract_text() or "")
-            except Exception:
-                continue
-        if any(texts): # Si pypdf extrajo algo, usarlo
-            return "\n".join(t.strip() for t in texts if t)
-    except Exception:
-        pass # Fallback a pdfminer.six si pypdf falla o no está instalado
-
-    try:
-        from pdfminer.high_level import extract_text as pdfminer_extract_text
-        return pdfminer_extract_text(io.BytesIO(data))
-    except Exception:
+        return "\n".join(t.strip() for t in iter_pdf_pages(data) if t and t.strip())
+    except PdfExtractionError as e:
+        print(f"❌ Error extrayendo PDF: {e}")
         return ""
 
 
+def _is_pdf(filename: Optional[str], mime_type: Optional[str]) -> bool:
+    inferred = (mime_type or _infer_mime_from_name(filename) or "").lower()
+    return "pdf" in inferred or (filename or "").lower().endswith(".pdf")
+
+
 def _extract_text_from_docx(data: bytes) -> str:
     try:
         import docx  # python-docx
@@ -323,7 +458,7 @@ def _infer_mime_from_name(filename: Optional[str]) -> Optional[str]:
 def _extract_text_from_binary(data: bytes, filename: Optional[str], mime_type: Optional[str]) -> str:
     inferred = mime_type or _infer_mime_from_name(filename) or ""
     inferred = inferred.lower()
-    if "pdf" in inferred or (filename or "").lower().endswith(".pdf"):
+    if _is_pdf(filename, mime_type):
         return _extract_text_from_pdf(data)
     if "word" in inferred or "docx" in inferred or (filename or "").lower().endswith(".docx"):
         return _extract_text_from_docx(data)
@@ -337,17 +472,25 @@ def _extract_text_from_binary(data: bytes, filename: Optional[str], mime_type: O
 def _chunk_text(text: str, size: int = 1200, overlap: int = 200) -> List[str]:
     if not text:
         return []
-    chunks: List[str] = []
-    start = 0
-    n = len(text)
-    while start < n:
-        end = min(start + size, n)
-        chunk = text[start:end]
-        chunks.append(chunk)
-        if end >= n:
-            break
-        start = end - overlap
-    return chunks
+    return list(_iter_chunk_text([text], size, overlap))
+
+
+def _iter_chunk_text(parts: Iterable[str], size: int = 1200, overlap: int = 200) -> Iterator[str]:
+    """Como `_chunk_text("\n".join(parts))`, pero emite cada chunk apenas hay texto suficiente.
+
+    Permite chunkear las páginas de un PDF a medida que se extraen.
+    """
+    buffer = ""
+    started = False
+    for part in parts:
+        buffer += ("\n" if started else "") + part
+        started = True
+        # Solo se corta si hay texto después del chunk (si no, es el último)
+        while len(buffer) > size:
+            yield buffer[:size]
+            buffer = buffer[size - overlap:]
+    if buffer:
+        yield buffer
 
 
 def _quality_score(text: str) -> float:
@@ -367,11 +510,18 @@ def _fingerprint(text: str) -> str:
     return "sha256:" + hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
 
 
-def _build_canonical_items(base_id: str, text: str, base_metadata: dict[str, Any]) -> List[CanonicalDoc]:
+def _build_canonical_items(
+    base_id: str,
+    text: str,
+    base_metadata: dict[str, Any],
+    chunks: Optional[List[str]] = None,
+    start_index: int = 0,
+) -> List[CanonicalDoc]:
     canonical: List[CanonicalDoc] = []
-    chunks = _chunk_text(text)
+    if chunks is None:
+        chunks = _chunk_text(text)
     now_iso = datetime.utcnow().isoformat() + "Z"
-    for idx, chunk in enumerate(chunks):
+    for idx, chunk in enumerate(chunks, start_index):
         md = {
             **(base_metadata or {}),
             "source_type": base_metadata.get("source_type", "unknown"),
@@ -569,8 +719,18 @@ def _extract_entities_from_text(text: str) -> dict[str, str]:
 
 
 def _prepare_ingest_docs_from_inputs(
-    docs: Optional[List[IngestDoc]], urls: Optional[List[str]], url_headers: Optional[dict[str, str]]
+    docs: Optional[List[IngestDoc]],
+    urls: Optional[List[str]],
+    url_headers: Optional[dict[str, str]],
+    pdf_sources: Optional[List[dict[str, Any]]] = None,
 ) -> List[dict[str, Any]]:
+    """Texto de cada doc/archivo/URL de entrada.
+
+    Args:
+        pdf_sources: Si se pasa una lista, los PDFs no se extraen aquí: se
+            agregan a ella como {"id", "data", "metadata"} para ingerirlos en
+            streaming (`_stream_ingest_pdf`)
+    """
     prepared: list[dict[str, Any]] = []
     # desde docs/archivos
     if docs:
@@ -579,7 +739,11 @@ def _prepare_ingest_docs_from_inputs(
             if d.file_base64:
                 try:
                     binary = base64.b64decode(d.file_base64)
-                    extracted = _extract_text_from_binary(binary, d.filename, d.mime_type)
+                    if pdf_sources is not None and not text_content and _is_pdf(d.filename, d.mime_type):
+                        pdf_sources.append({"id": d.id or d.filename or "doc", "data": binary, "metadata": d.metadata or {}})
+                        continue
+                    with job_stage("extract"):
+                        extracted = _extract_text_from_binary(binary, d.filename, d.mime_type)
                     text_content = (text_content + "\n" + extracted).strip() if text_content else extracted
                 except Exception:
                     pass
@@ -599,23 +763,33 @@ def _prepare_ingest_docs_from_inputs(
                 headers = {"User-Agent": "Mozilla/5.0 (compatible; FixeatAI/0.1; +https://fixeat.ai)", "Accept": "*/*"}
                 if url_headers:
                     headers.update(url_headers)
-                resp = requests.get(url, timeout=15, headers=headers)
+                with job_stage("download"):
+                    resp = requests.get(url, timeout=15, headers=headers)
+                    content = resp.content
                 if resp.status_code >= 400:
                     continue
                 content_type = resp.headers.get("Content-Type", "").lower()
-                if "text/html" in content_type or url.lower().endswith((".html", ".htm")):
-                    text = _extract_text_from_html(resp.text)
-                elif "pdf" in content_type or url.lower().endswith(".pdf"):
-                    text = _extract_text_from_pdf(resp.content)
-                elif "word" in content_type or url.lower().endswith(".docx"):
-                    text = _extract_text_from_docx(resp.content)
-                elif "excel" in content_type or url.lower().endswith(".xlsx"):
-                    text = _extract_text_from_xlsx(resp.content)
-                else:
-                    try:
-                        text = resp.content.decode("utf-8", errors="ignore")
-                    except Exception:
-                        text = ""
+                with job_stage("extract"):
+                    if "text/html" in content_type or url.lower().endswith((".html", ".htm")):
+                        text = _extract_text_from_html(resp.text)
+                    elif "pdf" in content_type or url.lower().endswith(".pdf"):
+                        if pdf_sources is not None:
+                            pdf_sources.append({
+                                "id": url,
+                                "data": content,
+                                "metadata": {"source": url, "source_type": "url", "source_ref": url},
+                            })
+                            continue
+                        text = _extract_text_from_pdf(content)
+                    elif "word" in content_type or url.lower().endswith(".docx"):
+                        text = _extract_text_from_docx(content)
+                    elif "excel" in content_type or url.lower().endswith(".xlsx"):
+                        text = _extract_text_from_xlsx(content)
+                    else:
+                        try:
+                            text = content.decode("utf-8", errors="ignore")
+                        except Exception:
+                            text = ""
                 if text:
                     prepared.append({"id": url, "text": text, "metadata": {"source": url, "source_type": "url", "source_ref": url}})
             except Exception:
@@ -770,11 +944,113 @@ def get_taxonomy_stats() -> dict:
         }
 
 
+def _curate_metadata(item_id: Optional[str], text: str, meta: dict[str, Any]) -> bool:
+    """Completa y normaliza (in-place) las entidades de un documento. Retorna si cambió la taxonomía."""
+    # Como alias se registra el valor de la metadata recibida (si vino alguna)
+    aliases = meta if meta else {}
+    taxonomy_changed = False
+    # Extracción automática si faltan entidades
+    if not meta.get("brand") or not meta.get("model") or not meta.get("category"):
+        auto = _extract_entities_from_text(text)
+        for k, v in auto.items():
+            meta.setdefault(k, v)
+    # Normalización básica de entidades con taxonomía
+    brand = _normalize_entity(meta.get("brand"), _TAXONOMY.get("brands", {}))
+    model = _normalize_entity(meta.get("model"), _TAXONOMY.get("models", {}))
+    category = _normalize_entity(meta.get("category"), _TAXONOMY.get("categories", {}))
+    if brand:
+        meta["brand"] = brand
+        taxonomy_changed |= _update_taxonomy("brands", brand, aliases.get("brand"))
+    if model:
+        meta["model"] = model
+        taxonomy_changed |= _update_taxonomy("models", model, aliases.get("model"))
+    if category:
+        meta["category"] = category
+        taxonomy_changed |= _update_taxonomy("categories", category, aliases.get("category"))
+    meta.setdefault("source_type", meta.get("source_type", "doc"))
+    meta.setdefault("source_ref", meta.get("source_ref", item_id))
+    return taxonomy_changed
+
+
+def _split_by_quality(
+    items: List[CanonicalDoc], curated: List[dict[str, Any]], quarantine: List[dict[str, Any]]
+) -> None:
+    for cd in items:
+        if cd.metadata.get("quality_score", 0) < 0.5 or len(cd.text) < 200:
+            quarantine.append({"id": cd.id, "reason": "low_quality_or_too_short"})
+        else:
+            curated.append(cd.model_dump())
+
+
+def _add_counters(total: dict[str, int], counters: Optional[dict[str, int]]) -> dict[str, int]:
+    """Acumula los contadores de `ingest_docs` (inserted/updated/skipped/...)."""
+    for key, value in (counters or {}).items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def _stream_ingest_pdf(base_id: str, data: bytes, metadata: dict[str, Any]) -> dict[str, Any]:
+    """Curación + ingesta de un PDF mientras se extrae.
+
+    Las páginas llegan del pool de extracción, se chunkean al vuelo y cada
+    `INGEST_STREAM_CHUNKS` chunks se curan e ingieren; el pool sigue
+    extrayendo las páginas siguientes mientras se calculan los embeddings.
+    Las entidades (marca/modelo/categoría) que faltan en la metadata se
+    infieren del texto del primer lote.
+    """
+    batch_size = max(1, int(os.getenv("INGEST_STREAM_CHUNKS", "32")))
+    meta = dict(metadata)
+    stats: dict[str, Any] = {
+        "chunks": 0, "curated": 0, "quarantine": 0, "taxonomy_changed": False, "error": None, "kb": {},
+    }
+    pending: List[str] = []
+    resolved = False
+
+    def flush() -> None:
+        nonlocal resolved
+        curated: List[dict[str, Any]] = []
+        quarantine: List[dict[str, Any]] = []
+        with job_stage("curate"):
+            if not resolved:
+                stats["taxonomy_changed"] |= _curate_metadata(base_id, "\n".join(pending), meta)
+                resolved = True
+            items = _build_canonical_items(base_id, "", meta, chunks=pending, start_index=stats["chunks"])
+            _split_by_quality(items, curated, quarantine)
+        if curated:
+            with job_stage("embed"):
+                _add_counters(stats["kb"], ingest_docs(curated))
+        stats["chunks"] += len(pending)
+        stats["curated"] += len(curated)
+        stats["quarantine"] += len(quarantine)
+        pending.clear()
+        report_progress(current_pdf=base_id, current_pdf_chunks=stats["chunks"])
+
+    pages = iter_stage("extract", (t.strip() for t in iter_pdf_pages(data) if t and t.strip()))
+    try:
+        for chunk in _iter_chunk_text(pages):
+            pending.append(chunk)
+            if len(pending) >= batch_size:
+                flush()
+    except PdfExtractionError as e:
+        # Lo ya ingerido se conserva; el resto del documento se reporta como error
+        print(f"❌ Error extrayendo {base_id}: {e}")
+        stats["error"] = str(e)
+        pending.clear()
+    if pending:
+        flush()
+    return stats
+
+
 @app.post("/tools/kb_curate")
 def tool_kb_curate(req: KBCurateRequest) -> dict:
+    return _curate(req)
+
+
+def _curate(req: KBCurateRequest, pdf_sources: Optional[List[dict[str, Any]]] = None) -> dict:
+    """Curación de las entradas; con `pdf_sources` los PDFs se separan para ingesta en streaming."""
     global _TAXONOMY  # Declarar global al inicio
     
-    raw = _prepare_ingest_docs_from_inputs(req.docs, req.urls, req.url_headers)
+    raw = _prepare_ingest_docs_from_inputs(req.docs, req.urls, req.url_headers, pdf_sources=pdf_sources)
     curated: List[dict[str, Any]] = []
     quarantine: List[dict[str, Any]] = []
     taxonomy_changed = False
@@ -782,69 +1058,49 @@ def tool_kb_curate(req: KBCurateRequest) -> dict:
     
     # NUEVO: Auto-aprendizaje de taxonomía si está habilitado
     if req.auto_learn_taxonomy:
-        try:
-            llm_client = LLMClient(agent="taxonomy")
-        except Exception as e:
-            print(f"Warning: No se pudo inicializar LLM client: {e}")
-            llm_client = None
+        with job_stage("taxonomy"):
+            try:
+                llm_client = get_llm_client("taxonomy")
+            except Exception as e:
+                print(f"Warning: No se pudo inicializar LLM client: {e}")
+                llm_client = None
         
-        learner = TaxonomyAutoLearner(llm_client)
+            learner = TaxonomyAutoLearner(llm_client)
         
-        # Extraer texto de todos los documentos nuevos
-        new_text = "\n".join(item.get("text", "") for item in raw)
+            # Extraer texto de todos los documentos nuevos
+            new_text = "\n".join(item.get("text", "") for item in raw)
         
-        if new_text:
-            # Aprendizaje incremental
-            learned_entities = learner.learn_incrementally(new_text, _TAXONOMY)
+            if new_text:
+                # Aprendizaje incremental
+                learned_entities = learner.learn_incrementally(new_text, _TAXONOMY)
             
-            if learned_entities and any(learned_entities.values()):
-                # Merge con taxonomía existente
-                for category in ["brands", "models", "categories"]:
-                    if category in learned_entities:
-                        if category not in _TAXONOMY:
-                            _TAXONOMY[category] = {}
+                if learned_entities and any(learned_entities.values()):
+                    # Merge con taxonomía existente
+                    for category in ["brands", "models", "categories"]:
+                        if category in learned_entities:
+                            if category not in _TAXONOMY:
+                                _TAXONOMY[category] = {}
                         
-                        for entity, aliases in learned_entities[category].items():
-                            if entity not in _TAXONOMY[category]:
-                                _TAXONOMY[category][entity] = aliases
-                                taxonomy_changed = True
-                                print(f"🔍 Auto-aprendida {category[:-1]}: {entity}")
+                            for entity, aliases in learned_entities[category].items():
+                                if entity not in _TAXONOMY[category]:
+                                    _TAXONOMY[category][entity] = aliases
+                                    taxonomy_changed = True
+                                    print(f"🔍 Auto-aprendida {category[:-1]}: {entity}")
                 
-                # Generar estadísticas de aprendizaje
-                learning_stats = learner.get_learning_stats(learned_entities)
+                    # Generar estadísticas de aprendizaje
+                    learning_stats = learner.get_learning_stats(learned_entities)
     
     # Procesamiento normal de curación
-    for item in raw:
-        meta = item.get("metadata") or {}
-        # Extracción automática si faltan entidades
-        if not meta.get("brand") or not meta.get("model") or not meta.get("category"):
-            auto = _extract_entities_from_text(item.get("text", ""))
-            for k, v in auto.items():
-                meta.setdefault(k, v)
-        # Normalización básica de entidades con taxonomía
-        brand = _normalize_entity(meta.get("brand"), _TAXONOMY.get("brands", {}))
-        model = _normalize_entity(meta.get("model"), _TAXONOMY.get("models", {}))
-        category = _normalize_entity(meta.get("category"), _TAXONOMY.get("categories", {}))
-        if brand:
-            meta["brand"] = brand
-            taxonomy_changed |= _update_taxonomy("brands", brand, item.get("metadata", {}).get("brand"))
-        if model:
-            meta["model"] = model
-            taxonomy_changed |= _update_taxonomy("models", model, item.get("metadata", {}).get("model"))
-        if category:
-            meta["category"] = category
-            taxonomy_changed |= _update_taxonomy("categories", category, item.get("metadata", {}).get("category"))
-        meta.setdefault("source_type", meta.get("source_type", "doc"))
-        meta.setdefault("source_ref", meta.get("source_ref", item.get("id")))
-        items = _build_canonical_items(item.get("id", "doc"), item.get("text", ""), meta)
-        for cd in items:
-            if cd.metadata.get("quality_score", 0) < 0.5 or len(cd.text) < 200:
-                quarantine.append({"id": cd.id, "reason": "low_quality_or_too_short"})
-            else:
-                curated.append(cd.model_dump())
+    with job_stage("curate"):
+        for item in raw:
+            meta = item.get("metadata") or {}
+            taxonomy_changed |= _curate_metadata(item.get("id"), item.get("text", ""), meta)
+            items = _build_canonical_items(item.get("id", "doc"), item.get("text", ""), meta)
+            _split_by_quality(items, curated, quarantine)
     
     if taxonomy_changed:
-        _save_taxonomy()
+        with job_stage("taxonomy"):
+            _save_taxonomy()
     
     stats = {"input": len(raw), "curated": len(curated), "quarantine": len(quarantine)}
     
@@ -862,25 +1118,50 @@ def tool_kb_ingest(req: KBIngestRequest) -> dict:
     url_count = 0
 
     if req.auto_curate:
+        # Sin auto-aprendizaje los PDFs se curan e ingieren en streaming mientras
+        # se extraen; el auto-aprendizaje necesita el texto completo antes de curar
+        pdf_sources: Optional[List[dict[str, Any]]] = None if req.auto_learn_taxonomy else []
         # Curación previa y luego ingesta del resultado con auto-aprendizaje opcional
-        curate_result = tool_kb_curate(KBCurateRequest(
+        curate_result = _curate(KBCurateRequest(
             docs=req.docs, 
             urls=req.urls, 
             url_headers=req.url_headers,
             auto_learn_taxonomy=req.auto_learn_taxonomy  # NUEVO: pasar flag de auto-aprendizaje
-        ))
+        ), pdf_sources=pdf_sources)
         curated_docs = curate_result.get("docs", [])
         url_count = len(req.urls or [])
+        kb_counters: dict[str, int] = {}
         if curated_docs:
-            ingest_docs(curated_docs)
+            with job_stage("embed"):
+                _add_counters(kb_counters, ingest_docs(curated_docs))
+        ingested = len(curated_docs)
+        report_progress(pdfs_total=len(pdf_sources or []), pdfs_done=0, ingested=ingested)
+
+        stats = curate_result.get("stats") or {}
+        for n, source in enumerate(pdf_sources or [], start=1):
+            streamed = _stream_ingest_pdf(source["id"], source["data"], source["metadata"])
+            source["data"] = None  # liberar el PDF apenas se procesa
+            ingested += streamed["curated"]
+            _add_counters(kb_counters, streamed["kb"])
+            stats["input"] = stats.get("input", 0) + 1
+            stats["curated"] = stats.get("curated", 0) + streamed["curated"]
+            stats["quarantine"] = stats.get("quarantine", 0) + streamed["quarantine"]
+            stats["streamed_pdfs"] = stats.get("streamed_pdfs", 0) + 1
+            if streamed["taxonomy_changed"]:
+                with job_stage("taxonomy"):
+                    _save_taxonomy()
+            if streamed["error"]:
+                errors.append({"id": source["id"], "error": streamed["error"]})
+            report_progress(pdfs_done=n, ingested=ingested)
         
         # Incluir estadísticas de aprendizaje si están disponibles
         result = {
-            "ingested": len(curated_docs), 
+            "ingested": ingested, 
             "from_urls": url_count, 
             "errors": errors, 
             "curated": True, 
-            "stats": curate_result.get("stats")
+            "stats": stats,
+            "kb": kb_counters,
         }
         
         if "auto_learning" in curate_result.get("stats", {}):
@@ -891,9 +1172,73 @@ def tool_kb_ingest(req: KBIngestRequest) -> dict:
     # Camino anterior: preparar e ingerir directamente
     prepared = _prepare_ingest_docs_from_inputs(req.docs, req.urls, req.url_headers)
     url_count = len(req.urls or [])
-    if prepared:
-        ingest_docs(prepared)
-    return {"ingested": len(prepared), "from_urls": url_count, "errors": errors, "curated": False}
+    with job_stage("embed"):
+        kb_counters = ingest_docs(prepared) if prepared else {}
+    return {"ingested": len(prepared), "from_urls": url_count, "errors": errors, "curated": False, "kb": kb_counters}
+
+
+def _run_ingest_job(payload: dict[str, Any]) -> dict:
+    return tool_kb_ingest(KBIngestRequest(**payload))
+
+
+# Cola de ingesta en segundo plano (`/tools/kb_ingest/jobs`); se abre al iniciar el MCP
+_ingest_jobs: Optional[IngestJobQueue] = None
+
+
+def _get_ingest_jobs() -> IngestJobQueue:
+    global _ingest_jobs
+    if _ingest_jobs is None:
+        path = os.getenv("INGEST_JOBS_DB") or os.path.join(os.getenv("CHROMA_PATH", "/data/chroma"), "ingest_jobs.sqlite3")
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        except OSError:
+            pass
+        _ingest_jobs = IngestJobQueue(
+            _run_ingest_job,
+            path=path,
+            workers=int(os.getenv("INGEST_JOB_WORKERS", "1")),
+            max_attempts=int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3")),
+        )
+    return _ingest_jobs
+
+
+@app.on_event("startup")
+def _start_ingest_jobs() -> None:
+    _get_ingest_jobs().start()
+
+
+@app.on_event("shutdown")
+def _stop_ingest_jobs() -> None:
+    if _ingest_jobs is not None:
+        _ingest_jobs.stop()
+
+
+@app.post("/tools/kb_ingest/jobs", status_code=202)
+def tool_kb_ingest_submit(req: KBIngestRequest) -> dict:
+    """Encola una ingesta (mismo body que `/tools/kb_ingest`) y retorna su `job_id` sin esperar."""
+    summary = {
+        "docs": len(req.docs or []),
+        "urls": len(req.urls or []),
+        "auto_curate": bool(req.auto_curate),
+        "auto_learn_taxonomy": bool(req.auto_learn_taxonomy),
+    }
+    return _get_ingest_jobs().submit(req.model_dump(exclude_none=True), summary=summary)
+
+
+@app.get("/tools/kb_ingest/jobs")
+def tool_kb_ingest_jobs(status: Optional[str] = None, limit: int = 50) -> dict:
+    queue = _get_ingest_jobs()
+    return {**queue.stats(), "items": queue.list(status=status, limit=limit)}
+
+
+@app.get("/tools/kb_ingest/jobs/{job_id}")
+def tool_kb_ingest_job(job_id: str) -> JSONResponse:
+    """Estado de un trabajo: `queued` (con `queue_position`), `running` (con `stage`,
+    `progress` y `timings_ms` parciales), `done` (con `result`) o `failed` (con `error`)."""
+    job = _get_ingest_jobs().get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"detail": f"trabajo {job_id} no encontrado"})
+    return JSONResponse(content=job)
 
 
 @app.get("/tools/taxonomy/test")
@@ -977,9 +1322,10 @@ def view_document(doc_id: str, page: Optional[int] = None) -> dict:
     try:
         # Buscar documento en el KB por doc_id
         # Usar get directo de ChromaDB
-        from services.kb.demo_kb import _collection, generate_document_url
+        from services.kb.demo_kb import _get_collection, generate_document_url
         
         try:
+            _collection = _get_collection()
             result = _collection.get(ids=[doc_id], include=["documents", "metadatas"])
             
             if not result["ids"]:
@@ -1046,3 +1392,10 @@ def health() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """Readiness: 200 solo cuando el modelo de embeddings y la colección están cargados."""
+    status = readiness_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
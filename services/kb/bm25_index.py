@@ -0,0 +1,296 @@
+"""Índice BM25 persistente sobre el texto de los chunks.
+
+Complementa la búsqueda semántica con recuperación exacta de términos:
+números de parte ("80.51.332"), códigos ("s_25"), modelos ("sm-520") y
+vocabulario técnico que los embeddings tienden a diluir.
+
+- Tokenización consciente de español/inglés: minúsculas, sin tildes,
+  stopwords de ambos idiomas y plurales simples; los tokens compuestos con
+  `.`, `-`, `_` o `/` se indexan completos, por partes y unidos
+  ("sm-520" → "sm-520", "sm", "520", "sm520").
+- Se mantienen incrementalmente en SQLite los postings (tf), la longitud
+  de cada documento y la frecuencia de documento (df) de cada término; el
+  IDF se deriva de df y N al consultar. N y la suma de largos se guardan en
+  `index_meta` y se actualizan en la misma transacción que los postings, así
+  una consulta nunca recorre `bm25_docs` completa.
+
+El índice vive junto a la persistencia de Chroma (`CHROMA_PATH`).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+
+
+STOPWORDS = {
+    # español
+    "el", "la", "los", "las", "un", "una", "unos", "unas", "lo", "al", "del",
+    "de", "en", "con", "por", "para", "sin", "sobre", "entre", "hasta", "desde",
+    "y", "o", "u", "e", "ni", "pero", "que", "si", "no", "como", "cuando", "donde",
+    "este", "esta", "estos", "estas", "ese", "esa", "esos", "esas", "se", "su", "sus",
+    "es", "son", "estan", "ser", "estar", "hay", "le", "les", "me", "mi",
+    "muy", "mas", "ya", "tambien", "cada", "todo", "toda", "todos", "todas",
+    # inglés
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "with", "without",
+    "by", "from", "at", "as", "is", "are", "was", "were", "be", "been", "it", "its",
+    "this", "that", "these", "those", "not", "if", "then", "than", "into", "can",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[._\-/]")
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)
+    )
+
+
+def _light_stem(token: str) -> str:
+    """Reduce plurales simples (es/en) en tokens alfabéticos."""
+    if not token.isalpha() or len(token) <= 4:
+        return token
+    if token.endswith("ces"):  # luces -> luz
+        return token[:-3] + "z"
+    if token.endswith(("ores", "ones", "ales", "eres")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Tokeniza texto técnico en español/inglés para BM25."""
+    if not text:
+        return []
+    tokens: list[str] = []
+    for raw in _TOKEN_RE.findall(_strip_accents(text.lower())):
+        if _SPLIT_RE.search(raw):
+            # Token compuesto: completo, unido y por partes
+            parts = [p for p in _SPLIT_RE.split(raw) if p]
+            tokens.append(raw)
+            tokens.append("".join(parts))
+            tokens.extend(p for p in parts if p not in STOPWORDS and (len(p) > 1 or p.isdigit()))
+            continue
+        if raw in STOPWORDS or (len(raw) == 1 and not raw.isdigit()):
+            continue
+        tokens.append(_light_stem(raw))
+    return tokens
+
+
+class BM25Index:
+    """Índice BM25 (Okapi) incremental respaldado por SQLite."""
+
+    def __init__(self, path: str | None = None, k1: float = 1.2, b: float = 0.75) -> None:
+        """Abre (o crea) el índice.
+
+        Args:
+            path: Ruta del archivo SQLite; None usa un índice en memoria.
+            k1: Saturación de frecuencia de término
+            b: Normalización por largo de documento
+        """
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        try:
+            self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+            self.path = path or ":memory:"
+        except Exception:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self.path = ":memory:"
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS bm25_postings (
+                    term TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, doc_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_bm25_postings_doc ON bm25_postings (doc_id);
+                CREATE TABLE IF NOT EXISTS bm25_docs (
+                    doc_id TEXT PRIMARY KEY,
+                    length INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS bm25_df (
+                    term TEXT PRIMARY KEY,
+                    df INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS index_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """
+            )
+            # Índices creados antes de guardar los totales: se calculan una vez
+            if self._conn.execute("SELECT 1 FROM index_meta WHERE key = 'n_docs'").fetchone() is None:
+                n_docs, total_len = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM bm25_docs"
+                ).fetchone()
+                self._set_totals_locked(n_docs, total_len)
+            self._conn.commit()
+
+    def _totals_locked(self) -> tuple[int, int]:
+        """(N, suma de largos) desde `index_meta` (requiere el lock tomado)."""
+        meta = dict(self._conn.execute(
+            "SELECT key, value FROM index_meta WHERE key IN ('n_docs', 'total_length')"
+        ).fetchall())
+        return int(meta.get("n_docs") or 0), int(meta.get("total_length") or 0)
+
+    def _set_totals_locked(self, n_docs: int, total_len: int) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)",
+            [("n_docs", str(n_docs)), ("total_length", str(total_len))],
+        )
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def _remove_locked(self, doc_ids: list[str]) -> None:
+        """Quita documentos y descuenta su df y los totales (requiere el lock tomado)."""
+        n_docs, total_len = self._totals_locked()
+        for doc_id in doc_ids:
+            row = self._conn.execute("SELECT length FROM bm25_docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                continue
+            terms = self._conn.execute(
+                "SELECT term FROM bm25_postings WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+            if terms:
+                self._conn.executemany("UPDATE bm25_df SET df = df - 1 WHERE term = ?", terms)
+            self._conn.execute("DELETE FROM bm25_postings WHERE doc_id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM bm25_docs WHERE doc_id = ?", (doc_id,))
+            n_docs -= 1
+            total_len -= row[0]
+        self._set_totals_locked(max(0, n_docs), max(0, total_len))
+        self._conn.execute("DELETE FROM bm25_df WHERE df <= 0")
+
+    def upsert(self, docs: Iterable[tuple[str, str]]) -> None:
+        """Indexa (o re-indexa) documentos, actualizando df y largos.
+
+        Args:
+            docs: Iterable de (doc_id, texto)
+        """
+        prepared: list[tuple[str, dict[str, int], int]] = []
+        for doc_id, text in docs:
+            tokens = tokenize(text)
+            tf: dict[str, int] = {}
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            prepared.append((doc_id, tf, len(tokens)))
+        # Si un doc_id viene repetido, vale la última versión (igual que el upsert de Chroma)
+        prepared = list({doc_id: (doc_id, tf, n) for doc_id, tf, n in prepared}.values())
+        if not prepared:
+            return
+
+        with self._lock:
+            self._remove_locked([doc_id for doc_id, _, _ in prepared])
+            n_docs, total_len = self._totals_locked()
+            for doc_id, tf, length in prepared:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO bm25_docs (doc_id, length) VALUES (?, ?)", (doc_id, length)
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO bm25_postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, n) for term, n in tf.items()],
+                )
+                self._conn.executemany(
+                    "INSERT INTO bm25_df (term, df) VALUES (?, 1) "
+                    "ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(term,) for term in tf],
+                )
+                n_docs += 1
+                total_len += length
+            self._set_totals_locked(n_docs, total_len)
+            self._conn.commit()
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        """Elimina documentos del índice."""
+        with self._lock:
+            self._remove_locked(list(doc_ids))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Vacía el índice completo."""
+        with self._lock:
+            self._conn.execute("DELETE FROM bm25_postings")
+            self._conn.execute("DELETE FROM bm25_docs")
+            self._conn.execute("DELETE FROM bm25_df")
+            self._conn.execute("DELETE FROM index_meta")
+            self._set_totals_locked(0, 0)
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Metadata del índice
+    # ------------------------------------------------------------------
+    def get_meta(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def idf(self, df: int, n_docs: int) -> float:
+        """IDF de BM25 (variante siempre positiva)."""
+        return math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 10) -> list[tuple[str, float]]:
+        """Busca documentos por BM25.
+
+        Solo lee los postings de los términos de la query, por lo que el costo
+        depende de cuántos documentos los contienen y no del tamaño de la KB.
+
+        Returns:
+            Lista [(doc_id, score)] ordenada por score descendente
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" for _ in terms)
+        with self._lock:
+            n_docs, total_len = self._totals_locked()
+            if not n_docs:
+                return []
+            dfs = dict(self._conn.execute(
+                f"SELECT term, df FROM bm25_df WHERE term IN ({placeholders})", terms
+            ).fetchall())
+            rows = self._conn.execute(
+                "SELECT p.term, p.doc_id, p.tf, d.length FROM bm25_postings p "
+                f"JOIN bm25_docs d ON d.doc_id = p.doc_id WHERE p.term IN ({placeholders})",
+                terms,
+            ).fetchall()
+
+        avg_len = total_len / n_docs if n_docs else 1.0
+        idfs = {t: self.idf(df, n_docs) for t, df in dfs.items()}
+        scores: dict[str, float] = {}
+        for term, doc_id, tf, length in rows:
+            norm = self.k1 * (1.0 - self.b + self.b * length / max(avg_len, 1e-9))
+            scores[doc_id] = scores.get(doc_id, 0.0) + idfs.get(term, 0.0) * tf * (self.k1 + 1.0) / (tf + norm)
+
+        ranking = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return ranking[:top_k] if top_k > 0 else ranking
+
+    def stats(self) -> dict[str, Any]:
+        """Estadísticas básicas del índice."""
+        with self._lock:
+            n_docs, total_len = self._totals_locked()
+            terms = self._conn.execute("SELECT COUNT(*) FROM bm25_df").fetchone()[0]
+        return {
+            "path": self.path,
+            "docs": n_docs,
+            "terms": terms,
+            "avg_doc_length": round(total_len / n_docs, 1) if n_docs else 0.0,
+        }
@@ -5,30 +5,233 @@ Provee funciones de ingesta y búsqueda (kb_search) usadas por el servidor MCP d
 
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Iterable, Iterator
+import hashlib
+import itertools
+import json
 import os
 import re
+import threading
+import time
 
-import chromadb
-from sentence_transformers import SentenceTransformer
+from services.kb.bm25_index import BM25Index
+from services.kb.embeddings import backend_name, create_embedding_backend
+from services.kb.keyword_index import KeywordIndex, code_patterns
+from services.kb.lru_cache import LRUCache
+from services.kb.window_store import WindowStore
 
 
-_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+# Backend de embeddings: torch | onnx | onnx-int8 (ver services/kb/embeddings.py).
+# Nombre canónico: un alias (`int8`) no cambia la clave del modelo ni invalida embeddings
+_EMBEDDING_BACKEND = backend_name(os.getenv("KB_EMBEDDING_BACKEND", "torch"))
 # Persistencia opcional mediante variable de entorno (útil en Docker)
 _chroma_path = os.getenv("CHROMA_PATH", "/data/chroma")
-try:
-    _chroma = chromadb.PersistentClient(path=_chroma_path)
-except Exception:
-    # Fallback a cliente en memoria si la ruta no es válida (entorno local)
-    _chroma = chromadb.Client()
-_collection = _chroma.get_or_create_collection("kb_tech")
+
+# Inicialización perezosa: el modelo (torch) y Chroma se cargan en el primer
+# uso o en `warmup()`, no al importar el módulo. Así el servidor MCP puede
+# abrir el puerto de inmediato y reportar readiness cuando termine la carga.
+_model_lock = threading.Lock()
+_store_lock = threading.Lock()
+_model: Any = None
+_chroma: Any = None
+_chroma_persistent = False
+_collection: Any = None
+_keyword_index: KeywordIndex | None = None
+_bm25_index: BM25Index | None = None
+_window_store: WindowStore | None = None
+_warmup_state: dict[str, Any] = {"started_at": None, "finished_at": None, "error": None}
+# Generación de la KB: se incrementa en cada ingesta para invalidar caches de resultados.
+# Parte del timestamp de arranque (ms) para que un reinicio no reutilice generaciones previas.
+_generation_lock = threading.Lock()
+_kb_generation = int(time.time() * 1000)
+
+
+def _get_model() -> Any:
+    """Retorna el backend de embeddings, cargándolo la primera vez."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = create_embedding_backend(_MODEL_ID, _EMBEDDING_BACKEND)
+    return _model
+
+
+def _init_store() -> None:
+    """Abre Chroma y los índices auxiliares que viven junto a su persistencia."""
+    global _chroma, _chroma_persistent, _collection, _keyword_index, _bm25_index, _window_store
+    with _store_lock:
+        if _collection is not None:
+            return
+        import chromadb
+
+        try:
+            chroma = chromadb.PersistentClient(path=_chroma_path)
+            persistent = True
+        except Exception:
+            # Fallback a cliente en memoria si la ruta no es válida (entorno local)
+            chroma = chromadb.Client()
+            persistent = False
+
+        # Índice invertido de códigos junto a la persistencia de Chroma (en memoria si Chroma lo está)
+        _keyword_index = KeywordIndex(
+            os.path.join(_chroma_path, "keyword_index.sqlite3") if persistent else None
+        )
+        # Índice BM25 sobre el texto de los chunks (recuperación sparse)
+        _bm25_index = BM25Index(
+            os.path.join(_chroma_path, "bm25_index.sqlite3") if persistent else None
+        )
+        # Embeddings de ventanas precomputados al ingestar (opcional, ver KB_PRECOMPUTE_WINDOWS)
+        _window_store = WindowStore(
+            os.path.join(_chroma_path, "window_embeddings.sqlite3") if persistent else None
+        )
+        _chroma = chroma
+        _chroma_persistent = persistent
+        _collection = chroma.get_or_create_collection("kb_tech")
+
+
+def _get_collection() -> Any:
+    """Retorna la colección de Chroma, abriéndola la primera vez."""
+    if _collection is None:
+        _init_store()
+    return _collection
+
+
+def _get_keyword_index() -> KeywordIndex:
+    if _keyword_index is None:
+        _init_store()
+    return _keyword_index  # type: ignore[return-value]
+
+
+def _get_bm25_index() -> BM25Index:
+    if _bm25_index is None:
+        _init_store()
+    return _bm25_index  # type: ignore[return-value]
+
+
+def _get_window_store() -> WindowStore:
+    if _window_store is None:
+        _init_store()
+    return _window_store  # type: ignore[return-value]
+
+
+def is_ready() -> bool:
+    """True cuando el modelo de embeddings y la colección ya están cargados."""
+    return _model is not None and _collection is not None
+
+
+def readiness_status() -> dict[str, Any]:
+    """Estado de la inicialización de la KB para el endpoint de readiness."""
+    return {
+        "ready": is_ready(),
+        "model_loaded": _model is not None,
+        "collection_loaded": _collection is not None,
+        "chroma_persistent": _chroma_persistent,
+        "embedding_backend": _EMBEDDING_BACKEND,
+        **_warmup_state,
+    }
+
+
+def warmup() -> None:
+    """Carga Chroma y el modelo y ejecuta un encode de prueba.
+
+    Pensado para llamarse en el startup del servidor (en un thread de fondo).
+    """
+    _warmup_state["started_at"] = time.time()
+    try:
+        _init_store()
+        _get_model().encode(["warmup"], normalize_embeddings=True)
+        print(f"🔥 KB lista en {time.time() - _warmup_state['started_at']:.1f}s")
+    except Exception as e:
+        _warmup_state["error"] = str(e)
+        print(f"❌ Error en warmup de KB: {e}")
+    finally:
+        _warmup_state["finished_at"] = time.time()
+
+
+def start_warmup() -> threading.Thread:
+    """Lanza `warmup()` en un thread daemon sin bloquear al llamador."""
+    thread = threading.Thread(target=warmup, name="kb-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+_PRECOMPUTE_WINDOWS = os.getenv("KB_PRECOMPUTE_WINDOWS", "false").lower() == "true"
+# Documentos por micro-lote de `ingest_docs` (lectura de huellas, embedding y upsert)
+_INGEST_BATCH_SIZE = max(1, int(os.getenv("KB_INGEST_BATCH_SIZE", "64")))
+# Fusión por defecto en kb_search_hybrid: weighted | rrf
+_HYBRID_FUSION = os.getenv("KB_HYBRID_FUSION", "weighted").lower()
+_RRF_K = int(os.getenv("KB_RRF_K", "60"))
+_MATCH_WINDOW_SIZE = 100
+
+# Cache de embeddings de queries (los técnicos repiten las mismas consultas)
+_query_cache = LRUCache(
+    max_entries=int(os.getenv("KB_QUERY_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("KB_QUERY_CACHE_TTL", "3600")),
+    name="query_embeddings",
+)
+
+
+def _normalize_query(query: str) -> str:
+    """Normaliza una query para el cache (el modelo MiniLM es uncased)."""
+    return " ".join(query.lower().split())
+
+
+def _encode_query(query: str) -> Any:
+    """Embedding normalizado de una query, usando el cache LRU.
+
+    Returns:
+        Vector NumPy (solo lectura) de la query
+    """
+    def _compute() -> Any:
+        vec = _get_model().encode([query], normalize_embeddings=True)[0]
+        vec.setflags(write=False)
+        return vec
+
+    return _query_cache.get_or_compute((_embedding_model_key(), _normalize_query(query)), _compute)
+
+
+def _embedding_model_key() -> str:
+    """Identificador del modelo + backend (los vectores difieren levemente entre backends)."""
+    return f"{_MODEL_ID}@{_EMBEDDING_BACKEND}"
+
+
+def embed_queries(queries: list[str]) -> dict[str, Any]:
+    """Embeddings normalizados de queries (con cache) para consumidores externos.
+
+    Returns:
+        Dict con "embeddings" (listas de floats), "model_id" y "kb_generation"
+    """
+    vectors = _encode_queries(queries) if queries else []
+    return {
+        "embeddings": [v.tolist() for v in vectors],
+        "model_id": _embedding_model_key(),
+        "kb_generation": get_kb_generation(),
+    }
+
+
+def get_query_cache_stats() -> dict[str, Any]:
+    """Contadores del cache de embeddings de queries (hits, misses, evictions)."""
+    return {**_query_cache.stats(), "model_id": _embedding_model_key()}
+
+
+def get_kb_generation() -> int:
+    """Generación actual de la KB (cambia después de cada `ingest_docs`)."""
+    return _kb_generation
+
+
+def _bump_kb_generation() -> int:
+    global _kb_generation
+    with _generation_lock:
+        _kb_generation += 1
+        return _kb_generation
 
 
 def get_all_documents() -> list[dict[str, Any]]:
     """Obtiene todos los documentos del KB para análisis de taxonomía."""
     try:
         # Obtener todos los documentos de la colección (sin incluir 'ids' explícitamente)
-        results = _collection.get(include=["documents", "metadatas"])
+        results = _get_collection().get(include=["documents", "metadatas"])
         
         documents = []
         for i, doc_id in enumerate(results["ids"]):
@@ -45,76 +248,381 @@ def get_all_documents() -> list[dict[str, Any]]:
         return []
 
 
-def ingest_docs(docs: list[dict[str, Any]]) -> None:
-    texts = [d["text"] for d in docs]
-    embeddings = _model.encode(texts, normalize_embeddings=True).tolist()
-    # Chroma requiere metadatas no vacíos; forzamos un valor por defecto
-    metadatas = []
+def rebuild_keyword_index(batch_size: int = 500) -> int:
+    """Reconstruye los índices sparse (códigos y BM25) desde la colección completa.
+
+    Se usa como backfill para colecciones creadas antes de los índices
+    (p.ej. `chroma_local`). Lee la colección paginada para no cargarla
+    entera en memoria.
+
+    Returns:
+        Número de documentos indexados
+    """
+    indexes = (_get_keyword_index(), _get_bm25_index())
+    for index in indexes:
+        index.clear()
+    total = _get_collection().count()
+    indexed = 0
+    for offset in range(0, total, batch_size):
+        page = _get_collection().get(limit=batch_size, offset=offset, include=["documents"])
+        pairs = list(zip(page["ids"], page["documents"] or []))
+        for index in indexes:
+            index.upsert(pairs)
+        indexed += len(page["ids"])
+    for index in indexes:
+        index.set_meta("built", "1")
+    _bump_kb_generation()
+    print(f"🗂️  Índices de keywords y BM25 reconstruidos: {indexed} documentos")
+    return indexed
+
+
+def _ensure_keyword_index() -> None:
+    """Construye los índices sparse la primera vez si la colección ya tenía datos."""
+    if _get_keyword_index().get_meta("built") is None or _get_bm25_index().get_meta("built") is None:
+        rebuild_keyword_index()
+
+
+def precompute_window_embeddings(docs: list[dict[str, Any]]) -> int:
+    """Calcula y guarda los embeddings de ventanas de match para cada chunk.
+
+    Todas las ventanas de los documentos se codifican en un solo `encode`.
+
+    Args:
+        docs: Lista de dicts con "id" y "text"
+
+    Returns:
+        Número de documentos con ventanas guardadas
+    """
+    import numpy as np
+
+    all_windows: list[str] = []
+    segments: list[tuple[str, str, int, int, list[int]]] = []
     for d in docs:
-        md = d.get("metadata") or {"source": "unspecified"}
-        # asegurar al menos un atributo
-        if isinstance(md, dict) and len(md) == 0:
-            md = {"source": "unspecified"}
-        metadatas.append(md)
-
-    # Usar upsert para permitir actualizar documentos existentes
-    _collection.upsert(
-        ids=[d["id"] for d in docs],
-        embeddings=embeddings,
-        documents=texts,
-        metadatas=metadatas,
+        windows, positions = _split_windows(d["text"], _MATCH_WINDOW_SIZE)
+        if not windows:
+            continue
+        segments.append((d["id"], d["text"], len(all_windows), len(all_windows) + len(windows), positions))
+        all_windows.extend(windows)
+
+    if not all_windows:
+        return 0
+
+    windows_emb = np.asarray(_get_model().encode(all_windows, normalize_embeddings=True), dtype=np.float32)
+    _get_window_store().put_many(
+        (
+            (doc_id, text, _MATCH_WINDOW_SIZE, positions, windows_emb[start:end])
+            for doc_id, text, start, end, positions in segments
+        ),
+        embedding_model=_embedding_model_key(),
     )
+    return len(segments)
 
 
-def _find_best_match_position(query: str, full_text: str, window_size: int = 100) -> int:
-    """Encuentra la mejor posición del match usando similitud de embeddings.
-    
+def backfill_window_embeddings(batch_size: int = 200, only_missing: bool = True) -> dict[str, int]:
+    """Precalcula ventanas para una colección existente (p.ej. `chroma_local`).
+
     Args:
-        query: Consulta de búsqueda
-        full_text: Texto completo del documento
-        window_size: Tamaño de ventana para buscar matches
-        
+        batch_size: Documentos leídos y codificados por lote
+        only_missing: Si True, omite documentos que ya tienen ventanas vigentes
+
     Returns:
-        Posición aproximada del mejor match en el texto
+        Dict con conteos de documentos revisados y calculados
     """
-    if not full_text:
-        return 0
-    
-    # Para documentos cortos, retornar inicio
-    if len(full_text) <= window_size * 2:
-        return 0
-    
-    # Dividir texto en ventanas solapadas
+    total = _get_collection().count()
+    scanned = 0
+    computed = 0
+    for offset in range(0, total, batch_size):
+        page = _get_collection().get(limit=batch_size, offset=offset, include=["documents"])
+        docs = [{"id": i, "text": t or ""} for i, t in zip(page["ids"], page["documents"] or [])]
+        scanned += len(docs)
+        if only_missing:
+            current = _get_window_store().get_many(
+                [(d["id"], d["text"]) for d in docs], _MATCH_WINDOW_SIZE, _embedding_model_key()
+            )
+            docs = [d for d in docs if d["id"] not in current]
+        computed += precompute_window_embeddings(docs)
+        print(f"🪟 Ventanas: {scanned}/{total} documentos revisados, {computed} calculados")
+    return {"total": total, "scanned": scanned, "computed": computed}
+
+
+def _text_fingerprint(text: str) -> str:
+    # Mismo formato que `_fingerprint` del MCP (metadata "fingerprint" de los chunks curados)
+    return "sha256:" + hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+# Campos de metadata que cambian en cada ingesta sin que cambie el documento
+_VOLATILE_METADATA = ("updated_at",)
+
+
+def _comparable_metadata(md: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in md.items() if k not in _VOLATILE_METADATA}
+
+
+def ingest_docs(
+    docs: Iterable[dict[str, Any]],
+    precompute_windows: bool | None = None,
+    force: bool = False,
+    batch_size: int | None = None,
+) -> dict[str, int]:
+    """Ingesta (upsert) documentos en la KB, re-embebiendo solo lo nuevo o modificado.
+
+    Los documentos se procesan en micro-lotes de `batch_size`: por lote se
+    leen las huellas existentes, se embebe lo que cambió y se hace un upsert
+    con el arreglo de NumPy tal cual (sin convertir a listas de floats). La
+    memoria pico depende del tamaño del lote, no del total; `docs` puede ser
+    un generador.
+
+    Cada documento se guarda con `fingerprint` (sha256 del texto, siempre
+    recalculado: una huella que venga en la metadata de entrada puede ser de
+    otra versión del texto) y `embedding_model` en su metadata:
+
+    - id nuevo: se embebe e inserta.
+    - texto distinto (o embebido con otro modelo o backend): se re-embebe y actualiza.
+    - mismo texto: no se embebe; si cambió la metadata (sin contar
+      `updated_at`) solo se actualiza la metadata, si no se omite.
+
+    Args:
+        docs: Dicts con "id", "text" y "metadata" opcional
+        precompute_windows: Si calcular y guardar embeddings de ventanas para
+            la localización de contexto (default: env KB_PRECOMPUTE_WINDOWS)
+        force: Re-embebe todos los documentos aunque no hayan cambiado
+        batch_size: Documentos por micro-lote (default: env KB_INGEST_BATCH_SIZE)
+
+    Returns:
+        Contadores {"inserted", "updated", "skipped", "metadata_updated", "batches"}
+        (`metadata_updated` son omitidos del embedding cuya metadata sí se escribió)
+    """
+    counters = {"inserted": 0, "updated": 0, "skipped": 0, "metadata_updated": 0, "batches": 0}
+    if precompute_windows is None:
+        precompute_windows = _PRECOMPUTE_WINDOWS
+    size = max(1, batch_size or _INGEST_BATCH_SIZE)
+
+    iterator = iter(docs)
+    changed = False
+    try:
+        while True:
+            batch = list(itertools.islice(iterator, size))
+            if not batch:
+                break
+            counters["batches"] += 1
+            changed |= _ingest_batch(batch, counters, precompute_windows, force)
+    finally:
+        # Los resultados cacheados de búsquedas previas dejan de ser válidos
+        # (también si un lote falló después de escribir los anteriores)
+        if changed:
+            _bump_kb_generation()
+
+    if counters["batches"]:
+        print(
+            f"📥 Ingesta: {counters['inserted']} nuevos, {counters['updated']} actualizados, "
+            f"{counters['skipped']} sin cambios ({counters['metadata_updated']} con metadata actualizada) "
+            f"en {counters['batches']} lotes"
+        )
+    return counters
+
+
+def _ingest_batch(
+    docs: list[dict[str, Any]],
+    counters: dict[str, int],
+    precompute_windows: bool,
+    force: bool,
+) -> bool:
+    """Un micro-lote de `ingest_docs`. Retorna si escribió algo en la KB."""
+    import numpy as np
+
+    # Chroma requiere metadatas no vacíos; fingerprint y modelo garantizan al menos un atributo
+    model_key = _embedding_model_key()
+    prepared: list[tuple[dict[str, Any], dict[str, Any]]] = []
+    for d in docs:
+        md = dict(d.get("metadata") or {})
+        md["fingerprint"] = _text_fingerprint(d["text"])
+        md["embedding_model"] = model_key
+        prepared.append((d, md))
+
+    collection = _get_collection()
+    found = collection.get(ids=[d["id"] for d, _ in prepared], include=["metadatas"])
+    existing = {doc_id: md or {} for doc_id, md in zip(found["ids"], found["metadatas"])}
+
+    to_embed: list[tuple[dict[str, Any], dict[str, Any]]] = []
+    metadata_only: list[tuple[str, dict[str, Any]]] = []
+    for d, md in prepared:
+        previous = existing.get(d["id"])
+        if previous is None:
+            counters["inserted"] += 1
+            to_embed.append((d, md))
+        elif (
+            force
+            or previous.get("fingerprint") != md["fingerprint"]
+            or previous.get("embedding_model") != model_key
+        ):
+            counters["updated"] += 1
+            to_embed.append((d, md))
+        else:
+            counters["skipped"] += 1
+            if _comparable_metadata(previous) != _comparable_metadata(md):
+                counters["metadata_updated"] += 1
+                metadata_only.append((d["id"], md))
+
+    if metadata_only:
+        collection.update(ids=[i for i, _ in metadata_only], metadatas=[md for _, md in metadata_only])
+
+    if to_embed:
+        texts = [d["text"] for d, _ in to_embed]
+        embeddings = np.asarray(_get_model().encode(texts, normalize_embeddings=True), dtype=np.float32)
+        # Usar upsert para permitir actualizar documentos existentes
+        collection.upsert(
+            ids=[d["id"] for d, _ in to_embed],
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[md for _, md in to_embed],
+        )
+
+        # Mantener los índices sparse sincronizados con el upsert
+        _ensure_keyword_index()
+        _get_keyword_index().upsert((d["id"], d["text"]) for d, _ in to_embed)
+        _get_bm25_index().upsert((d["id"], d["text"]) for d, _ in to_embed)
+
+        # Ventanas de match: recalcular o invalidar las previas de estos ids
+        changed = [d for d, _ in to_embed]
+        if precompute_windows:
+            precompute_window_embeddings(changed)
+        else:
+            _get_window_store().delete(d["id"] for d in changed)
+
+    return bool(to_embed or metadata_only)
+
+
+def _split_windows(full_text: str, window_size: int = 100) -> tuple[list[str], list[int]]:
+    """Divide un texto en ventanas solapadas (paso = window_size // 2).
+
+    Returns:
+        Tupla (ventanas, posiciones). Vacía para textos cortos, donde el
+        mejor match es siempre el inicio.
+    """
+    if not full_text or len(full_text) <= window_size * 2:
+        return ([], [])
+
     step = window_size // 2
     windows = []
     positions = []
-    
     for i in range(0, len(full_text) - window_size, step):
         windows.append(full_text[i:i + window_size])
         positions.append(i)
-    
-    if not windows:
-        return 0
-    
-    # Encontrar ventana más similar a la query
+    return (windows, positions)
+
+
+def _fallback_match_position(query: str, full_text: str, window_size: int = 100) -> int:
+    """Fallback sin embeddings: buscar primer término de query en texto."""
+    query_terms = query.lower().split()[:3]  # Primeros 3 términos
+    for term in query_terms:
+        pos = full_text.lower().find(term)
+        if pos != -1:
+            return max(0, pos - window_size // 2)
+    return 0
+
+
+def _find_best_match_positions(
+    query: str,
+    full_texts: list[str],
+    window_size: int = 100,
+    query_emb: Any = None,
+    doc_ids: list[str] | None = None,
+) -> list[int]:
+    """Localiza el mejor match de la query en varios textos con una sola inferencia.
+
+    Si se pasan `doc_ids`, usa primero las ventanas precomputadas en el
+    `WindowStore` (solo un producto matriz–vector). Las ventanas de los
+    textos restantes se juntan en un único `encode` y se calcula el argmax de
+    similitud por segmento con NumPy. El resultado es el mismo que llamar
+    `_find_best_match_position` para cada texto.
+
+    Args:
+        query: Consulta de búsqueda
+        full_texts: Textos completos de los hits
+        window_size: Tamaño de ventana para buscar matches
+        query_emb: Embedding normalizado de la query si ya se calculó
+        doc_ids: IDs de los hits (habilita el uso de ventanas precomputadas)
+
+    Returns:
+        Lista de posiciones (una por texto, en el mismo orden)
+    """
+    import numpy as np
+
+    positions: list[int] = [0] * len(full_texts)
+
+    # Ventanas precomputadas al ingestar (sin inferencia del modelo)
+    stored: dict[str, tuple[list[int], Any]] = {}
+    if doc_ids:
+        try:
+            stored = _get_window_store().get_many(
+                list(zip(doc_ids, full_texts)), window_size, _embedding_model_key()
+            )
+        except Exception:
+            stored = {}
+
+    all_windows: list[str] = []
+    segments: list[tuple[int, int, int, list[int]]] = []  # (idx_texto, inicio, fin, posiciones)
+    precomputed: list[tuple[int, list[int], Any]] = []
+
+    for idx, full_text in enumerate(full_texts):
+        if doc_ids and doc_ids[idx] in stored:
+            win_positions, win_emb = stored[doc_ids[idx]]
+            if win_positions:
+                precomputed.append((idx, win_positions, win_emb))
+            continue
+        windows, win_positions = _split_windows(full_text, window_size)
+        if not windows:
+            continue
+        segments.append((idx, len(all_windows), len(all_windows) + len(windows), win_positions))
+        all_windows.extend(windows)
+
+    if not all_windows and not precomputed:
+        return positions
+
+    if query_emb is None:
+        try:
+            query_emb = _encode_query(query)
+        except Exception:
+            for idx, _, _, _ in segments:
+                positions[idx] = _fallback_match_position(query, full_texts[idx], window_size)
+            for idx, _, _ in precomputed:
+                positions[idx] = _fallback_match_position(query, full_texts[idx], window_size)
+            return positions
+    q_vec = np.asarray(query_emb, dtype=np.float32)
+
+    for idx, win_positions, win_emb in precomputed:
+        positions[idx] = win_positions[int(np.argmax(win_emb @ q_vec))]
+
+    if not all_windows:
+        return positions
+
     try:
-        query_emb = _model.encode([query], normalize_embeddings=True)[0]
-        windows_emb = _model.encode(windows, normalize_embeddings=True)
-        
-        # Calcular similitud coseno
-        import numpy as np
-        similarities = np.dot(windows_emb, query_emb)
-        best_idx = int(np.argmax(similarities))
-        
-        return positions[best_idx]
+        windows_emb = _get_model().encode(all_windows, normalize_embeddings=True)
+
+        # Similitud coseno de todas las ventanas en una sola operación
+        similarities = np.dot(windows_emb, q_vec.astype(windows_emb.dtype))
+        for idx, seg_start, seg_end, win_positions in segments:
+            best_idx = int(np.argmax(similarities[seg_start:seg_end]))
+            positions[idx] = win_positions[best_idx]
     except Exception:
-        # Fallback: buscar primer término de query en texto
-        query_terms = query.lower().split()[:3]  # Primeros 3 términos
-        for term in query_terms:
-            pos = full_text.lower().find(term)
-            if pos != -1:
-                return max(0, pos - window_size // 2)
-        return 0
+        for idx, _, _, _ in segments:
+            positions[idx] = _fallback_match_position(query, full_texts[idx], window_size)
+
+    return positions
+
+
+def _find_best_match_position(query: str, full_text: str, window_size: int = 100) -> int:
+    """Encuentra la mejor posición del match usando similitud de embeddings.
+    
+    Args:
+        query: Consulta de búsqueda
+        full_text: Texto completo del documento
+        window_size: Tamaño de ventana para buscar matches
+        
+    Returns:
+        Posición aproximada del mejor match en el texto
+    """
+    return _find_best_match_positions(query, [full_text], window_size)[0]
 
 
 def _extract_context_window(
@@ -177,12 +685,12 @@ def kb_search(query: str, top_k: int = 5, where: dict[str, Any] | None = None) -
     Returns:
         Lista de hits con doc_id, score, snippet (500 chars) y metadata
     """
-    q_emb = _model.encode([query], normalize_embeddings=True).tolist()[0]
+    q_emb = _encode_query(query).tolist()
     # Filtro por metadatos (opcional)
     kwargs: dict[str, Any] = {"query_embeddings": [q_emb], "n_results": top_k}
     if where and isinstance(where, dict) and len(where) > 0:
         kwargs["where"] = where
-    res = _collection.query(**kwargs)
+    res = _get_collection().query(**kwargs)
     hits: list[dict[str, Any]] = []
     for i in range(len(res["ids"][0])):
         hits.append(
@@ -395,25 +903,110 @@ def kb_search_extended(
         - highlighted_terms: Lista de términos resaltados (si highlight_terms=True)
     """
     # Realizar búsqueda semántica base
-    q_emb = _model.encode([query], normalize_embeddings=True).tolist()[0]
-    kwargs: dict[str, Any] = {"query_embeddings": [q_emb], "n_results": top_k}
-    if where and isinstance(where, dict) and len(where) > 0:
-        kwargs["where"] = where
-    
-    res = _collection.query(**kwargs)
-    
+    q_vec = _encode_query(query)
+    res = _semantic_query_batch([q_vec], [top_k], [where])[0]
+    return _build_extended_hits(
+        query, q_vec, res, context_chars, include_full_text, highlight_terms
+    )
+
+
+def _encode_queries(queries: list[str]) -> list[Any]:
+    """Embeddings de varias queries con una sola llamada al modelo.
+
+    Usa el cache LRU: solo las queries no cacheadas (deduplicadas) pasan por
+    `encode`, en un único batch.
+
+    Returns:
+        Lista de vectores NumPy (solo lectura) en el orden de entrada
+    """
+    model_key = _embedding_model_key()
+    keys = [(model_key, _normalize_query(q)) for q in queries]
+    vectors: dict[Any, Any] = {}
+    missing: dict[Any, str] = {}
+    for key, query in zip(keys, queries):
+        if key in vectors or key in missing:
+            continue
+        cached = _query_cache.get(key)
+        if cached is not None:
+            vectors[key] = cached
+        else:
+            missing[key] = query
+    if missing:
+        encoded = _get_model().encode(list(missing.values()), normalize_embeddings=True)
+        for key, vec in zip(missing, encoded):
+            vec.setflags(write=False)
+            _query_cache.put(key, vec)
+            vectors[key] = vec
+    return [vectors[key] for key in keys]
+
+
+def _semantic_query_batch(
+    q_vecs: list[Any],
+    top_ks: list[int],
+    wheres: list[dict[str, Any] | None],
+) -> list[dict[str, list[Any]]]:
+    """Consulta densa de varias queries con `query_embeddings` múltiple.
+
+    Chroma acepta un solo `where` y un solo `n_results` por llamada, así que
+    las queries se agrupan por filtro (una llamada por filtro distinto) y se
+    pide el mayor top_k del grupo, recortando luego cada resultado.
+
+    Returns:
+        Por query, un dict {"ids", "documents", "metadatas", "distances"}
+        con listas planas, en el orden de entrada
+    """
+    groups: dict[str, list[int]] = {}
+    for i, where in enumerate(wheres):
+        key = json.dumps(where or {}, sort_keys=True, default=str)
+        groups.setdefault(key, []).append(i)
+
+    results: list[dict[str, list[Any]]] = [
+        {"ids": [], "documents": [], "metadatas": [], "distances": []} for _ in q_vecs
+    ]
+    for indices in groups.values():
+        kwargs: dict[str, Any] = {
+            "query_embeddings": [q_vecs[i].tolist() for i in indices],
+            "n_results": max(top_ks[i] for i in indices),
+        }
+        where = wheres[indices[0]]
+        if where and isinstance(where, dict) and len(where) > 0:
+            kwargs["where"] = where
+        res = _get_collection().query(**kwargs)
+        for row, i in enumerate(indices):
+            n = top_ks[i]
+            results[i] = {
+                field: (res.get(field) or [[]] * len(indices))[row][:n]
+                for field in ("ids", "documents", "metadatas", "distances")
+            }
+    return results
+
+
+def _build_extended_hits(
+    query: str,
+    q_vec: Any,
+    res: dict[str, list[Any]],
+    context_chars: int = 2000,
+    include_full_text: bool = False,
+    highlight_terms: bool = True,
+) -> list[dict[str, Any]]:
+    """Construye los hits de `kb_search_extended` a partir del resultado denso de una query."""
     # Extraer términos clave para highlighting
     key_terms = extract_key_terms(query) if highlight_terms else []
     
+    # Localizar el mejor match de todos los hits en un solo batch de embeddings
+    match_positions = _find_best_match_positions(
+        query, res["documents"], query_emb=q_vec, doc_ids=res["ids"]
+    )
+    
     hits: list[dict[str, Any]] = []
-    for i in range(len(res["ids"][0])):
-        doc_id = res["ids"][0][i]
-        full_text = res["documents"][0][i]
-        metadata = res["metadatas"][0][i] or {}
-        score = float(res["distances"][0][i])
+    for i in range(len(res["ids"])):
+        doc_id = res["ids"][i]
+        full_text = res["documents"][i]
+        metadata = res["metadatas"][i] or {}
+        score = float(res["distances"][i])
         
-        # Encontrar mejor posición del match en el texto
-        match_pos = _find_best_match_position(query, full_text)
+        # Mejor posición del match en el texto
+        match_pos = match_positions[i]
         
         # Extraer ventana de contexto ampliada
         context, context_start, context_end = _extract_context_window(
@@ -507,47 +1100,169 @@ def _keyword_boost_search(
     if not error_codes:
         return {}
     
-    # Construir patrones de búsqueda para cada código
-    search_patterns = []
-    for code in error_codes:
-        search_patterns.extend([
-            f"service {code}",
-            f"servicio {code}",
-            f"service{code}",
-            f"s_{code}",
-            f"s{code}",
-            f"error {code}",
-        ])
-    
-    # Obtener todos los documentos (o filtrados)
+    # Postings del índice invertido: solo se leen los documentos que contienen
+    # algún patrón de código, no la colección completa.
     try:
-        if where:
-            results = _collection.get(where=where, include=["documents", "metadatas"])
-        else:
-            results = _collection.get(include=["documents", "metadatas"])
+        _ensure_keyword_index()
+        keyword_scores = _get_keyword_index().score_codes(error_codes)
     except Exception:
         return {}
+
+    # Aplicar filtros de metadata sobre los candidatos en un solo get
+    if where and keyword_scores:
+        try:
+            allowed = _get_collection().get(ids=list(keyword_scores.keys()), where=where, include=[])
+        except Exception:
+            return {}
+        allowed_ids = set(allowed["ids"])
+        keyword_scores = {k: v for k, v in keyword_scores.items() if k in allowed_ids}
     
-    # Scoring por matches de keywords
-    keyword_scores = {}
-    for i, doc_id in enumerate(results["ids"]):
-        text = results["documents"][i].lower() if i < len(results["documents"]) else ""
-        score = 0.0
-        
-        for pattern in search_patterns:
-            # Contar ocurrencias del patrón
-            count = text.count(pattern.lower())
-            if count > 0:
-                # Boost score basado en:
-                # - Número de ocurrencias
-                # - Qué tan específico es el patrón
-                pattern_weight = 2.0 if "_" in pattern or pattern.startswith("service ") else 1.0
-                score += count * pattern_weight
+    return keyword_scores
+
+
+def _bm25_search(
+    query: str,
+    top_k: int = 20,
+    where: dict[str, Any] | None = None,
+) -> list[tuple[str, float]]:
+    """Búsqueda sparse BM25 sobre el texto de los chunks.
+
+    Returns:
+        Ranking [(doc_id, score_bm25)] descendente, filtrado por `where`
+    """
+    try:
+        _ensure_keyword_index()
+        # Con filtro se piden más candidatos para compensar los descartados
+        ranking = _get_bm25_index().search(query, top_k=top_k * 5 if where else top_k)
+    except Exception as e:
+        print(f"Error en búsqueda BM25: {e}")
+        return []
+
+    if where and ranking:
+        try:
+            allowed = _get_collection().get(ids=[d for d, _ in ranking], where=where, include=[])
+        except Exception:
+            return []
+        allowed_ids = set(allowed["ids"])
+        ranking = [(d, sc) for d, sc in ranking if d in allowed_ids]
+    return ranking[:top_k]
+
+
+def _fuse_rrf(
+    rankings: list[tuple[list[str], float]],
+    k: int = 60,
+) -> list[tuple[str, float]]:
+    """Reciprocal Rank Fusion ponderado.
+
+    score(d) = Σ peso_i / (k + rank_i(d)), con rank desde 1.
+
+    Args:
+        rankings: Lista de (doc_ids ordenados, peso)
+        k: Constante de suavizado de RRF
+
+    Returns:
+        Ranking [(doc_id, score_rrf)] descendente
+    """
+    scores: dict[str, float] = {}
+    for doc_ids, weight in rankings:
+        for rank, doc_id in enumerate(doc_ids, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+
+
+def _fuse_weighted(
+    semantic_results: list[dict[str, Any]],
+    keyword_scores: dict[str, float],
+    semantic_weight: float,
+    keyword_weight: float,
+) -> tuple[list[tuple[str, float]], dict[str, float], dict[str, float]]:
+    """Fusión ponderada de scores semánticos y de keywords.
+
+    Normaliza ambos lados a [0-1] (min-max para el semántico, división por
+    el máximo para keywords) y combina con los pesos dados.
+
+    Returns:
+        Tupla (ranking [(doc_id, score_híbrido)] descendente, scores
+        semánticos normalizados, scores de keywords normalizados)
+    """
+    # Normalizar scores semánticos a [0-1]
+    semantic_scores: dict[str, float] = {}
+    if semantic_results:
+        max_sem_score = max(r["score"] for r in semantic_results)
+        min_sem_score = min(r["score"] for r in semantic_results)
+        score_range = max_sem_score - min_sem_score if max_sem_score > min_sem_score else 1.0
         
-        if score > 0:
-            keyword_scores[doc_id] = score
+        for r in semantic_results:
+            normalized = (r["score"] - min_sem_score) / score_range
+            semantic_scores[r["doc_id"]] = normalized
     
-    return keyword_scores
+    # Normalizar keyword scores a [0-1]
+    if keyword_scores:
+        max_kw_score = max(keyword_scores.values())
+        if max_kw_score > 0:
+            keyword_scores = {k: v / max_kw_score for k, v in keyword_scores.items()}
+    
+    # Score híbrido: dar más peso a keyword matches para códigos de error
+    combined_scores: dict[str, float] = {}
+    for doc_id in set(semantic_scores) | set(keyword_scores):
+        combined_scores[doc_id] = (
+            semantic_weight * semantic_scores.get(doc_id, 0.0) +
+            keyword_weight * keyword_scores.get(doc_id, 0.0)
+        )
+    
+    ranking = sorted(combined_scores.items(), key=lambda x: (-x[1], x[0]))
+    return ranking, semantic_scores, keyword_scores
+
+
+def _fetch_hits_by_ids(
+    doc_ids: list[str],
+    patterns: list[str],
+    context_chars: int,
+) -> dict[str, dict[str, Any]]:
+    """Recupera en un solo `get` los hits que solo aparecieron por keywords.
+
+    El contexto se centra en la primera ocurrencia de alguno de los
+    `patterns` (códigos o términos de la query), con la misma forma de hit
+    que `kb_search_extended`.
+
+    Returns:
+        Dict {doc_id: hit}
+    """
+    if not doc_ids:
+        return {}
+    try:
+        res = _get_collection().get(ids=doc_ids, include=["documents", "metadatas"])
+    except Exception as e:
+        print(f"Error recuperando hits por keyword: {e}")
+        return {}
+
+    documents = res.get("documents") or []
+    metadatas = res.get("metadatas") or []
+    hits: dict[str, dict[str, Any]] = {}
+    for i, doc_id in enumerate(res["ids"]):
+        full_text = (documents[i] if i < len(documents) else "") or ""
+        metadata = (metadatas[i] if i < len(metadatas) else None) or {}
+
+        low = full_text.lower()
+        found = [pos for pos in (low.find(p.lower()) for p in patterns) if pos != -1]
+        match_pos = min(found) if found else 0
+        context, context_start, context_end = _extract_context_window(full_text, match_pos, context_chars)
+
+        hits[doc_id] = {
+            "doc_id": doc_id,
+            "score": 0.0,  # No tuvo score semántico
+            "snippet": full_text[:500],
+            "context": context,
+            "metadata": {
+                **metadata,
+                "match_position": match_pos,
+                "context_start": context_start,
+                "context_end": context_end,
+                "text_length": len(full_text),
+            },
+            "document_url": generate_document_url(doc_id, metadata),
+        }
+    return hits
 
 
 def kb_search_hybrid(
@@ -557,6 +1272,8 @@ def kb_search_hybrid(
     semantic_weight: float = 0.5,
     keyword_weight: float = 0.5,
     context_chars: int = 2000,
+    fusion: str | None = None,
+    semantic_results: list[dict[str, Any]] | None = None,
 ) -> list[dict[str, Any]]:
     """Búsqueda híbrida: combina búsqueda semántica con keyword matching.
     
@@ -570,6 +1287,12 @@ def kb_search_hybrid(
         semantic_weight: Peso para score semántico (0-1)
         keyword_weight: Peso para score de keywords (0-1)
         context_chars: Caracteres de contexto
+        fusion: "weighted" (scores normalizados, solo con códigos de error) o
+            "rrf" (Reciprocal Rank Fusion denso + BM25, siempre).
+            Default: env KB_HYBRID_FUSION o "weighted".
+        semantic_results: Hits densos ya calculados (de `kb_search_extended`
+            con al menos `hybrid_semantic_top_k(...)` resultados); los usa
+            `kb_search_batch` para no repetir la consulta densa.
         
     Returns:
         Lista de hits con scores híbridos, ordenados por relevancia
@@ -577,8 +1300,16 @@ def kb_search_hybrid(
     # 1. Detectar códigos de error en la query
     error_codes = _detect_error_codes(query)
     
+    if (fusion or _HYBRID_FUSION) == "rrf":
+        return _kb_search_hybrid_rrf(
+            query, top_k, where, semantic_weight, keyword_weight, context_chars, error_codes,
+            semantic_results,
+        )
+    
     # 2. Si no hay códigos de error, usar búsqueda semántica normal
     if not error_codes:
+        if semantic_results is not None:
+            return semantic_results[:top_k]
         return kb_search_extended(
             query=query,
             top_k=top_k,
@@ -587,14 +1318,17 @@ def kb_search_hybrid(
             highlight_terms=False
         )
     
-    # 3. Búsqueda semántica (top_k * 2 para tener más candidatos)
-    semantic_results = kb_search_extended(
-        query=query,
-        top_k=top_k * 3,  # Obtener más candidatos
-        where=where,
-        context_chars=context_chars,
-        highlight_terms=False
-    )
+    # 3. Búsqueda semántica (top_k * 3 para tener más candidatos)
+    if semantic_results is None:
+        semantic_results = kb_search_extended(
+            query=query,
+            top_k=top_k * 3,  # Obtener más candidatos
+            where=where,
+            context_chars=context_chars,
+            highlight_terms=False
+        )
+    else:
+        semantic_results = semantic_results[:top_k * 3]
     
     # 4. Búsqueda por keywords
     keyword_scores = _keyword_boost_search(
@@ -604,76 +1338,204 @@ def kb_search_hybrid(
         where=where
     )
     
-    # 5. Normalizar scores semánticos a [0-1]
-    semantic_scores = {}
-    if semantic_results:
-        max_sem_score = max(r["score"] for r in semantic_results)
-        min_sem_score = min(r["score"] for r in semantic_results)
-        score_range = max_sem_score - min_sem_score if max_sem_score > min_sem_score else 1.0
-        
-        for r in semantic_results:
-            normalized = (r["score"] - min_sem_score) / score_range
-            semantic_scores[r["doc_id"]] = normalized
-    
-    # 6. Normalizar keyword scores a [0-1]
-    if keyword_scores:
-        max_kw_score = max(keyword_scores.values())
-        if max_kw_score > 0:
-            keyword_scores = {k: v/max_kw_score for k, v in keyword_scores.items()}
-    
-    # 7. Combinar scores híbridos
-    combined_scores = {}
-    all_doc_ids = set(semantic_scores.keys()) | set(keyword_scores.keys())
-    
-    for doc_id in all_doc_ids:
-        sem_score = semantic_scores.get(doc_id, 0.0)
-        kw_score = keyword_scores.get(doc_id, 0.0)
-        
-        # Score híbrido: dar más peso a keyword matches para códigos de error
-        combined_scores[doc_id] = (
-            semantic_weight * sem_score + 
-            keyword_weight * kw_score
-        )
+    # 5. Fusión de rankings (solo scores, sin tocar el store)
+    ranking, semantic_scores, keyword_scores = _fuse_weighted(
+        semantic_results, keyword_scores, semantic_weight, keyword_weight
+    )
+    ranking = ranking[:top_k]
     
-    # 8. Reordenar resultados por score híbrido
+    # 6. Materializar hits: los semánticos ya vienen con contexto; los que solo
+    # aparecieron por keywords se recuperan en un único get batch.
     semantic_results_dict = {r["doc_id"]: r for r in semantic_results}
-    
-    # Obtener documentos adicionales que solo aparecieron en keyword search
-    for doc_id in keyword_scores:
-        if doc_id not in semantic_results_dict:
-            # Recuperar el documento completo
-            try:
-                doc_result = _collection.get(ids=[doc_id], include=["documents", "metadatas"])
-                if doc_result and doc_result["ids"]:
-                    semantic_results_dict[doc_id] = {
-                        "doc_id": doc_id,
-                        "score": 0.0,  # No tuvo score semántico
-                        "snippet": doc_result["documents"][0][:500] if doc_result["documents"] else "",
-                        "context": doc_result["documents"][0][:context_chars] if doc_result["documents"] else "",
-                        "metadata": doc_result["metadatas"][0] if doc_result["metadatas"] else {},
-                        "document_url": generate_document_url(
-                            doc_result["metadatas"][0].get("source", "") if doc_result["metadatas"] else "",
-                            page=doc_result["metadatas"][0].get("page") if doc_result["metadatas"] else None,
-                            doc_id=doc_id
-                        )
-                    }
-            except Exception:
-                continue
+    keyword_only_ids = [doc_id for doc_id, _ in ranking if doc_id not in semantic_results_dict]
+    keyword_only_hits = _fetch_hits_by_ids(
+        keyword_only_ids, [p for code in error_codes for p in code_patterns(code)], context_chars
+    )
     
     # Crear lista final con scores híbridos
     hybrid_results = []
-    for doc_id, hybrid_score in sorted(combined_scores.items(), key=lambda x: -x[1])[:top_k]:
-        if doc_id in semantic_results_dict:
-            result = semantic_results_dict[doc_id].copy()
-            result["score"] = hybrid_score
-            result["semantic_score"] = semantic_scores.get(doc_id, 0.0)
-            result["keyword_score"] = keyword_scores.get(doc_id, 0.0)
-            result["error_codes_found"] = error_codes
-            hybrid_results.append(result)
+    for doc_id, hybrid_score in ranking:
+        base = semantic_results_dict.get(doc_id) or keyword_only_hits.get(doc_id)
+        if base is None:
+            continue
+        result = base.copy()
+        result["score"] = hybrid_score
+        result["semantic_score"] = semantic_scores.get(doc_id, 0.0)
+        result["keyword_score"] = keyword_scores.get(doc_id, 0.0)
+        result["error_codes_found"] = error_codes
+        hybrid_results.append(result)
     
     return hybrid_results
 
 
+def _kb_search_hybrid_rrf(
+    query: str,
+    top_k: int,
+    where: dict[str, Any] | None,
+    semantic_weight: float,
+    keyword_weight: float,
+    context_chars: int,
+    error_codes: list[str],
+    semantic_results: list[dict[str, Any]] | None = None,
+) -> list[dict[str, Any]]:
+    """Modo `fusion="rrf"`: fusiona ranking denso, BM25 y códigos en una pasada.
+
+    A diferencia del modo ponderado, el lado sparse corre siempre (no solo
+    con códigos de error), lo que da recall exacto para números de parte,
+    modelos y códigos.
+    """
+    n_candidates = top_k * 3
+    if semantic_results is None:
+        semantic_results = kb_search_extended(
+            query=query,
+            top_k=n_candidates,
+            where=where,
+            context_chars=context_chars,
+            highlight_terms=False
+        )
+    else:
+        semantic_results = semantic_results[:n_candidates]
+    bm25_ranking = _bm25_search(query, top_k=n_candidates, where=where)
+    code_scores = _keyword_boost_search(query, error_codes, top_k=n_candidates, where=where) if error_codes else {}
+    code_ranking = sorted(code_scores.items(), key=lambda x: (-x[1], x[0]))[:n_candidates]
+
+    dense_ids = [r["doc_id"] for r in semantic_results]  # Chroma ya ordena por distancia
+    sparse_lists = [([d for d, _ in bm25_ranking], keyword_weight)]
+    if code_ranking:
+        sparse_lists.append(([d for d, _ in code_ranking], keyword_weight))
+    ranking = _fuse_rrf([(dense_ids, semantic_weight)] + sparse_lists, k=_RRF_K)[:top_k]
+
+    dense_rank = {d: i for i, d in enumerate(dense_ids, 1)}
+    bm25_rank = {d: i for i, (d, _) in enumerate(bm25_ranking, 1)}
+    bm25_scores = dict(bm25_ranking)
+
+    # Los hits que no vinieron del lado denso se recuperan en un único get
+    semantic_results_dict = {r["doc_id"]: r for r in semantic_results}
+    sparse_only_ids = [d for d, _ in ranking if d not in semantic_results_dict]
+    patterns = [p for code in error_codes for p in code_patterns(code)] + extract_key_terms(query)
+    sparse_only_hits = _fetch_hits_by_ids(sparse_only_ids, patterns, context_chars)
+
+    hybrid_results = []
+    for doc_id, rrf_score in ranking:
+        base = semantic_results_dict.get(doc_id) or sparse_only_hits.get(doc_id)
+        if base is None:
+            continue
+        result = base.copy()
+        result["score"] = rrf_score
+        result["semantic_score"] = semantic_weight / (_RRF_K + dense_rank[doc_id]) if doc_id in dense_rank else 0.0
+        result["keyword_score"] = rrf_score - result["semantic_score"]
+        result["semantic_rank"] = dense_rank.get(doc_id)
+        result["bm25_rank"] = bm25_rank.get(doc_id)
+        result["bm25_score"] = bm25_scores.get(doc_id, 0.0)
+        result["fusion"] = "rrf"
+        result["error_codes_found"] = error_codes
+        hybrid_results.append(result)
+
+    return hybrid_results
+
+
+def hybrid_semantic_top_k(query: str, top_k: int, fusion: str | None = None) -> int:
+    """Candidatos densos que necesita `kb_search_hybrid` para una query."""
+    if (fusion or _HYBRID_FUSION) == "rrf" or _detect_error_codes(query):
+        return top_k * 3
+    return top_k
+
+
+_BATCH_CHUNK_SIZE = int(os.getenv("KB_BATCH_CHUNK_SIZE", "256"))
+
+
+def iter_kb_search_batch(
+    queries: list[dict[str, Any]],
+    mode: str = "hybrid",
+    context_chars: int = 2000,
+    semantic_weight: float = 0.5,
+    keyword_weight: float = 0.5,
+    fusion: str | None = None,
+    highlight_terms: bool = False,
+    chunk_size: int | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Búsqueda de muchas queries con la parte densa en batch.
+
+    Por cada bloque de `chunk_size` queries (default: env KB_BATCH_CHUNK_SIZE)
+    hace un único `encode` y una consulta multi-embedding a Chroma por filtro
+    `where` distinto; luego arma los hits de cada query igual que
+    `kb_search_hybrid` o `kb_search_extended`. Al ser un generador, los
+    resultados se pueden emitir a medida que se completa cada bloque.
+
+    Args:
+        queries: Lista de dicts con "query" y opcionalmente "top_k" y "where"
+        mode: "hybrid" o "extended"
+        context_chars, semantic_weight, keyword_weight, fusion: Igual que en
+            `kb_search_hybrid`
+        highlight_terms: Solo para mode="extended"
+
+    Returns:
+        Iterador que entrega, por query y en orden de entrada,
+        {"index", "query", "hits", "total_hits"} o
+        {"index", "query", "hits": [], "error"} si esa query falló.
+        `mode` se valida al llamar (ValueError), no al iterar.
+    """
+    if mode not in ("hybrid", "extended"):
+        raise ValueError(f"mode inválido: {mode} (opciones: hybrid, extended)")
+    return _iter_batch_chunks(
+        queries, mode, context_chars, semantic_weight, keyword_weight, fusion,
+        highlight_terms, max(1, chunk_size or _BATCH_CHUNK_SIZE),
+    )
+
+
+def _iter_batch_chunks(
+    queries: list[dict[str, Any]],
+    mode: str,
+    context_chars: int,
+    semantic_weight: float,
+    keyword_weight: float,
+    fusion: str | None,
+    highlight_terms: bool,
+    size: int,
+) -> Iterator[dict[str, Any]]:
+    for start in range(0, len(queries), size):
+        chunk = queries[start:start + size]
+        texts = [q["query"] for q in chunk]
+        top_ks = [int(q.get("top_k") or 10) for q in chunk]
+        wheres = [q.get("where") for q in chunk]
+        if mode == "hybrid":
+            n_dense = [hybrid_semantic_top_k(t, k, fusion) for t, k in zip(texts, top_ks)]
+        else:
+            n_dense = top_ks
+
+        q_vecs = _encode_queries(texts)
+        dense = _semantic_query_batch(q_vecs, n_dense, wheres)
+
+        for offset, (text, top_k, where) in enumerate(zip(texts, top_ks, wheres)):
+            item: dict[str, Any] = {"index": start + offset, "query": text}
+            try:
+                hits = _build_extended_hits(
+                    text, q_vecs[offset], dense[offset], context_chars,
+                    highlight_terms=highlight_terms and mode == "extended",
+                )
+                if mode == "hybrid":
+                    hits = kb_search_hybrid(
+                        query=text,
+                        top_k=top_k,
+                        where=where,
+                        semantic_weight=semantic_weight,
+                        keyword_weight=keyword_weight,
+                        context_chars=context_chars,
+                        fusion=fusion,
+                        semantic_results=hits,
+                    )
+                item.update({"hits": hits, "total_hits": len(hits)})
+            except Exception as e:
+                print(f"Error en query {start + offset} del batch: {e}")
+                item.update({"hits": [], "error": str(e)})
+            yield item
+
+
+def kb_search_batch(queries: list[dict[str, Any]], **kwargs: Any) -> list[dict[str, Any]]:
+    """Versión no streaming de `iter_kb_search_batch` (resultados en orden de entrada)."""
+    return list(iter_kb_search_batch(queries, **kwargs))
+
+
 if __name__ == "__main__":
     ingest_docs(
         [
@@ -0,0 +1,175 @@
+"""Backends de embeddings para la KB.
+
+El backend se elige con `KB_EMBEDDING_BACKEND`:
+
+- `torch` (default): `SentenceTransformer` sobre PyTorch.
+- `onnx`: el mismo modelo exportado a ONNX y ejecutado con ONNX Runtime en CPU.
+- `onnx-int8`: como `onnx`, con cuantización dinámica int8 de los pesos.
+
+Todos exponen `encode(texts, normalize_embeddings=True, batch_size=32)` y
+retornan un `np.ndarray` float32, igual que `SentenceTransformer.encode`, de
+modo que `demo_kb` los usa indistintamente.
+
+El backend ONNX exporta el modelo la primera vez (requiere `optimum`) y lo
+guarda en `KB_ONNX_DIR`; en ejecuciones siguientes solo necesita
+`onnxruntime` y `tokenizers`, sin importar torch.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+import os
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+_BACKEND_ALIASES = {"onnx_int8": "onnx-int8", "int8": "onnx-int8"}
+
+
+def backend_name(backend: str | None = None) -> str:
+    """Nombre canónico del backend (resuelve alias como `int8` → `onnx-int8`).
+
+    Un valor desconocido se retorna tal cual; `create_embedding_backend` lo rechaza.
+    """
+    name = (backend or os.getenv("KB_EMBEDDING_BACKEND", "torch")).strip().lower()
+    return _BACKEND_ALIASES.get(name, name)
+
+
+class SentenceTransformerBackend:
+    """Backend PyTorch (comportamiento original)."""
+
+    name = "torch"
+
+    def __init__(self, model_id: str) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self.model_id = model_id
+        self._model = SentenceTransformer(model_id)
+
+    def encode(self, texts: list[str], normalize_embeddings: bool = True, batch_size: int = 32) -> Any:
+        return self._model.encode(
+            texts, normalize_embeddings=normalize_embeddings, batch_size=batch_size
+        )
+
+
+class OnnxBackend:
+    """Backend ONNX Runtime para modelos sentence-transformers con mean pooling.
+
+    Reproduce el pipeline de all-MiniLM-L6-v2: tokenización con truncado a
+    `max_seq_length`, mean pooling con la máscara de atención y
+    normalización L2 opcional.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        onnx_dir: str | None = None,
+        quantize: bool = False,
+        max_seq_length: int = 256,
+        num_threads: int | None = None,
+    ) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_id = model_id
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+        base_dir = onnx_dir or os.getenv("KB_ONNX_DIR", "/data/onnx")
+        self.onnx_dir = os.path.join(base_dir, model_id.replace("/", "__"))
+
+        model_path = self._ensure_exported()
+        if quantize:
+            model_path = self._ensure_quantized(model_path)
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(self.onnx_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=max_seq_length)
+        self._tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        threads = num_threads or int(os.getenv("KB_ONNX_THREADS", "0"))
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def _ensure_exported(self) -> str:
+        """Exporta el modelo a ONNX si aún no existe en `onnx_dir`."""
+        model_path = os.path.join(self.onnx_dir, "model.onnx")
+        if os.path.exists(model_path) and os.path.exists(os.path.join(self.onnx_dir, "tokenizer.json")):
+            return model_path
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                f"No existe {model_path} y falta `optimum[onnxruntime]` para exportarlo: {e}"
+            ) from e
+
+        print(f"📦 Exportando {self.model_id} a ONNX en {self.onnx_dir}...")
+        os.makedirs(self.onnx_dir, exist_ok=True)
+        ORTModelForFeatureExtraction.from_pretrained(self.model_id, export=True).save_pretrained(self.onnx_dir)
+        AutoTokenizer.from_pretrained(self.model_id).save_pretrained(self.onnx_dir)
+        return model_path
+
+    def _ensure_quantized(self, model_path: str) -> str:
+        """Genera la versión int8 (cuantización dinámica de pesos) si no existe."""
+        quantized_path = os.path.join(self.onnx_dir, "model_int8.onnx")
+        if os.path.exists(quantized_path):
+            return quantized_path
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"🗜️  Cuantizando {self.model_id} a int8...")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+
+    def encode(self, texts: list[str], normalize_embeddings: bool = True, batch_size: int = 32) -> Any:
+        import numpy as np
+
+        if isinstance(texts, str):
+            texts = [texts]
+        outputs: list[Any] = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self._tokenizer.encode_batch(texts[start:start + batch_size])
+            input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+
+            token_embeddings = self._session.run(None, feeds)[0]
+
+            # Mean pooling respetando la máscara de atención
+            mask = attention_mask[..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings = summed / counts
+            if normalize_embeddings:
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                embeddings = embeddings / np.clip(norms, 1e-12, None)
+            outputs.append(embeddings.astype(np.float32))
+
+        if not outputs:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(outputs, axis=0)
+
+
+def create_embedding_backend(model_id: str, backend: str | None = None) -> Any:
+    """Crea el backend de embeddings configurado.
+
+    Args:
+        model_id: Modelo sentence-transformers (p.ej. all-MiniLM-L6-v2)
+        backend: torch | onnx | onnx-int8 (default: env KB_EMBEDDING_BACKEND o torch)
+
+    Returns:
+        Instancia con método `encode` compatible con SentenceTransformer
+    """
+    name = backend_name(backend)
+    if name == "torch":
+        return SentenceTransformerBackend(model_id)
+    if name == "onnx":
+        return OnnxBackend(model_id, quantize=False)
+    if name == "onnx-int8":
+        return OnnxBackend(model_id, quantize=True)
+    raise ValueError(f"KB_EMBEDDING_BACKEND inválido: {name} (opciones: {', '.join(BACKENDS)})")
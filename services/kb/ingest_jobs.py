@@ -0,0 +1,376 @@
+"""Cola persistente de trabajos de ingesta procesados en segundo plano.
+
+`/tools/kb_ingest` descarga, extrae, cura, aprende taxonomía y embebe dentro
+del request: los scripts de carga necesitan timeouts de minutos por PDF y
+cada ingesta ocupa un worker del MCP que compite con las búsquedas. Con la
+cola:
+
+- `submit` guarda el request en SQLite (`INGEST_JOBS_DB`) y retorna un id de
+  inmediato; el trabajo sobrevive a un reinicio del MCP (los que quedaron
+  `running` vuelven a `queued` al abrir la cola, hasta `max_attempts`
+  intentos: un PDF que tumba el proceso no se reintenta para siempre).
+- `INGEST_JOB_WORKERS` threads toman los trabajos en orden de llegada. Es el
+  tope de ingestas simultáneas: una carga masiva no ocupa más que eso y el
+  resto de los workers del MCP queda para las búsquedas.
+- El handler reporta avance y tiempos por etapa (`download`, `extract`,
+  `curate`, `taxonomy`, `embed`) con `job_stage` / `report_progress`, que no
+  hacen nada fuera de un trabajo. Las etapas anidadas descuentan su tiempo de
+  la etapa que las contiene.
+
+El payload se descarta al terminar el trabajo (puede traer PDFs en base64);
+se conservan estado, avance, tiempos y resultado.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Iterable, Iterator
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+_current = threading.local()
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class JobProgress:
+    """Avance y tiempos por etapa del trabajo que corre en el thread actual.
+
+    Los cambios se escriben a SQLite al entrar a una etapa distinta de la
+    última guardada y, si no, como mucho cada `_SAVE_INTERVAL` segundos (las
+    páginas de un PDF entran y salen de `extract` cientos de veces).
+    """
+
+    _SAVE_INTERVAL = 0.5
+
+    def __init__(self, queue: "IngestJobQueue", job_id: str) -> None:
+        self._queue = queue
+        self.job_id = job_id
+        self.progress: dict[str, Any] = {}
+        self.timings: dict[str, float] = {}
+        # Pila de [etapa, inicio, tiempo de etapas hijas]
+        self._stack: list[list[Any]] = []
+        self._saved_stage: str | None = None
+        self._saved_at = 0.0
+
+    def _save(self, entering: bool = False) -> None:
+        stage = self._stack[-1][0] if self._stack else None
+        now = time.monotonic()
+        changed = entering and stage != self._saved_stage
+        if not changed and now - self._saved_at < self._SAVE_INTERVAL:
+            return
+        self._saved_stage, self._saved_at = stage, now
+        self._queue._save_progress(self.job_id, stage, self.progress, self.timings)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        self._stack.append([name, time.perf_counter(), 0.0])
+        self._save(entering=True)
+        try:
+            yield
+        finally:
+            _, start, children = self._stack.pop()
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed - children
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            self._save()
+
+    def update(self, **fields: Any) -> None:
+        self.progress.update(fields)
+        self._save()
+
+
+def current_job() -> JobProgress | None:
+    """Trabajo en curso en este thread (None fuera de la cola)."""
+    return getattr(_current, "job", None)
+
+
+@contextmanager
+def job_stage(name: str) -> Iterator[None]:
+    """Mide una etapa del trabajo en curso; sin trabajo no hace nada."""
+    job = current_job()
+    if job is None:
+        yield
+        return
+    with job.stage(name):
+        yield
+
+
+def iter_stage(name: str, iterable: Iterable[Any]) -> Iterator[Any]:
+    """Itera midiendo como `name` solo el tiempo de producir cada elemento.
+
+    Para generadores que se consumen intercalados con otras etapas (p. ej.
+    páginas de un PDF que se curan y embeben a medida que llegan).
+    """
+    iterator = iter(iterable)
+    while True:
+        with job_stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def report_progress(**fields: Any) -> None:
+    """Actualiza los contadores de avance del trabajo en curso (si hay uno)."""
+    job = current_job()
+    if job is not None:
+        job.update(**fields)
+
+
+class IngestJobQueue:
+    """Trabajos de ingesta en SQLite con un pool fijo de workers."""
+
+    def __init__(
+        self,
+        handler: Callable[[dict[str, Any]], dict[str, Any]],
+        path: str | None = None,
+        workers: int = 1,
+        poll_seconds: float = 5.0,
+        max_attempts: int = 3,
+    ) -> None:
+        """Abre (o crea) la cola.
+
+        Args:
+            handler: Ejecuta un trabajo a partir de su payload y retorna el resultado
+            path: Ruta del archivo SQLite; None usa una cola en memoria
+            workers: Trabajos simultáneos (tope de ingestas en paralelo)
+            poll_seconds: Espera máxima de un worker ocioso antes de revisar la cola
+            max_attempts: Intentos de un trabajo interrumpido antes de marcarlo `failed`
+        """
+        self._handler = handler
+        self.workers = max(1, workers)
+        self._poll_seconds = poll_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        try:
+            self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+            self.path = path or ":memory:"
+        except Exception:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self.path = ":memory:"
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT,
+                    summary TEXT NOT NULL,
+                    stage TEXT,
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    timings TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_seq ON jobs (status, seq)")
+            # Trabajos interrumpidos por un reinicio: se vuelven a encolar, salvo
+            # los que ya agotaron sus intentos (probablemente tumbaron el proceso)
+            abandoned = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', payload = NULL, stage = NULL, error = ?, finished_at = ? "
+                "WHERE status = 'running' AND attempts >= ?",
+                (
+                    f"Interrumpido {self.max_attempts} veces (reinicio o caída del MCP durante la ingesta)",
+                    _now_iso(),
+                    self.max_attempts,
+                ),
+            ).rowcount
+            recovered = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL WHERE status = 'running'"
+            ).rowcount
+            self._conn.commit()
+        if recovered:
+            print(f"♻️  {recovered} trabajos de ingesta interrumpidos vueltos a encolar")
+        if abandoned:
+            print(f"⚠️  {abandoned} trabajos de ingesta marcados failed tras {self.max_attempts} intentos")
+
+    # -- API ----------------------------------------------------------------
+
+    def submit(self, payload: dict[str, Any], summary: dict[str, Any] | None = None) -> dict[str, Any]:
+        """Encola un trabajo y retorna su estado inicial."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs").fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO jobs (id, seq, status, payload, summary, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, seq, json.dumps(payload, ensure_ascii=False), json.dumps(summary or {}), _now_iso()),
+            )
+            self._conn.commit()
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get(job_id)  # type: ignore[return-value]
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        """Estado, avance, tiempos por etapa y resultado de un trabajo."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, seq, status, summary, stage, progress, timings, result, error, attempts, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row[2] == "queued":
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND seq < ?", (row[1],)
+                ).fetchone()[0]
+        return self._row_to_job(row, position)
+
+    def list(self, status: str | None = None, limit: int = 50) -> list[dict[str, Any]]:
+        """Trabajos más recientes primero (sin resultado completo)."""
+        query = (
+            "SELECT id, seq, status, summary, stage, progress, timings, NULL, error, attempts, "
+            "created_at, started_at, finished_at FROM jobs"
+        )
+        params: list[Any] = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(max(1, limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_job(row, None) for row in rows]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "path": self.path,
+            "workers": self.workers,
+            "jobs": {status: counts.get(status, 0) for status in JOB_STATUSES},
+        }
+
+    def start(self) -> None:
+        """Lanza los workers (idempotente)."""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ingest-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene los workers; un trabajo a medias se retoma al reiniciar."""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # -- Workers ------------------------------------------------------------
+
+    def _claim(self) -> tuple[str, dict[str, Any]] | None:
+        with self._lock:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY seq LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                # Condicionado a `queued`: otro proceso sobre el mismo archivo pudo tomarlo
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1, "
+                    "progress = '{}', timings = '{}' WHERE id = ? AND status = 'queued'",
+                    (_now_iso(), row[0]),
+                ).rowcount
+                self._conn.commit()
+                if claimed:
+                    return row[0], json.loads(row[1] or "{}")
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            claimed = self._claim()
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(self._poll_seconds)
+                continue
+            job_id, payload = claimed
+            job = JobProgress(self, job_id)
+            _current.job = job
+            t0 = time.perf_counter()
+            try:
+                result = self._handler(payload)
+            except Exception as e:
+                print(f"❌ Trabajo de ingesta {job_id} falló: {e}")
+                self._finish(job, "failed", None, str(e))
+            else:
+                print(f"✅ Trabajo de ingesta {job_id} terminado en {time.perf_counter() - t0:.1f}s")
+                self._finish(job, "done", result, None)
+            finally:
+                _current.job = None
+
+    def _finish(self, job: JobProgress, status: str, result: Any, error: str | None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, payload = NULL, stage = NULL, progress = ?, timings = ?, "
+                "result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(job.progress, ensure_ascii=False, default=str),
+                    json.dumps(job.timings),
+                    json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                    error,
+                    _now_iso(),
+                    job.job_id,
+                ),
+            )
+            self._conn.commit()
+
+    def _save_progress(
+        self, job_id: str, stage: str | None, progress: dict[str, Any], timings: dict[str, float]
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ?, timings = ? WHERE id = ?",
+                (stage, json.dumps(progress, ensure_ascii=False, default=str), json.dumps(timings), job_id),
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _row_to_job(row: tuple[Any, ...], position: int | None) -> dict[str, Any]:
+        (job_id, _, status, summary, stage, progress, timings, result, error, attempts,
+         created_at, started_at, finished_at) = row
+        job: dict[str, Any] = {
+            "job_id": job_id,
+            "status": status,
+            "stage": stage,
+            "request": json.loads(summary or "{}"),
+            "progress": json.loads(progress or "{}"),
+            "timings_ms": {k: round(v * 1000, 1) for k, v in json.loads(timings or "{}").items()},
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+        if position is not None:
+            job["queue_position"] = position
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error:
+            job["error"] = error
+        return job
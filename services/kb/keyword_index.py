@@ -0,0 +1,220 @@
+"""Índice invertido persistente para la búsqueda por keywords de la KB.
+
+Reemplaza el escaneo completo de la colección en `_keyword_boost_search`:
+en vez de traer todos los documentos y contar patrones con `text.count()`,
+durante la ingesta se registran las ocurrencias de cada patrón de código
+(`service 25`, `s_25`, `error 25`, ...) en una tabla de postings con su
+frecuencia por documento. En búsqueda solo se leen los postings de los
+términos pedidos, por lo que el costo crece con el número de matches y no
+con el tamaño de la KB.
+
+El índice vive en un SQLite junto a la persistencia de Chroma (`CHROMA_PATH`).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+import re
+import sqlite3
+import threading
+
+
+# Prefijos de patrón usados por `_keyword_boost_search`, con su peso.
+# Deben mantenerse sincronizados con `code_patterns()`.
+CODE_PATTERN_PREFIXES: list[str] = [
+    "service ",
+    "servicio ",
+    "service",
+    "s_",
+    "s",
+    "error ",
+]
+
+_DIGIT_RUN_RE = re.compile(r"\d+")
+
+
+def code_patterns(code: str) -> list[str]:
+    """Patrones de búsqueda para un código de error (mismo orden que el scan original)."""
+    return [f"{prefix}{code}" for prefix in CODE_PATTERN_PREFIXES]
+
+
+def pattern_weight(pattern: str) -> float:
+    """Peso de un patrón: más específico (`s_`, `service `) pesa el doble."""
+    return 2.0 if "_" in pattern or pattern.startswith("service ") else 1.0
+
+
+def extract_code_terms(text: str) -> dict[str, int]:
+    """Extrae los términos de código de un texto con su frecuencia.
+
+    Reproduce la semántica de `text.lower().count(prefijo + código)`: para cada
+    posición donde un prefijo va seguido de una secuencia de dígitos, se cuenta
+    una ocurrencia para cada prefijo numérico de esa secuencia (así
+    "service 250" también cuenta para "service 2" y "service 25", igual que
+    el conteo por substring).
+
+    Args:
+        text: Texto del documento/chunk
+
+    Returns:
+        Dict de {término: frecuencia}
+    """
+    terms: dict[str, int] = {}
+    if not text:
+        return terms
+
+    low = text.lower()
+    for match in _DIGIT_RUN_RE.finditer(low):
+        start = match.start()
+        digits = match.group(0)
+        # Un run de dígitos solo inicia en su primer dígito; posiciones
+        # intermedias no están precedidas por un prefijo alfabético.
+        for prefix in CODE_PATTERN_PREFIXES:
+            plen = len(prefix)
+            if start >= plen and low[start - plen:start] == prefix:
+                for end in range(1, len(digits) + 1):
+                    term = prefix + digits[:end]
+                    terms[term] = terms.get(term, 0) + 1
+    return terms
+
+
+class KeywordIndex:
+    """Índice invertido término → {doc_id: tf} respaldado por SQLite.
+
+    Es seguro para uso concurrente desde el threadpool de FastAPI: todas las
+    operaciones se serializan con un lock sobre una única conexión.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        """Abre (o crea) el índice.
+
+        Args:
+            path: Ruta del archivo SQLite. Si es None o no es válida, se usa
+                un índice en memoria (igual que el fallback de Chroma).
+        """
+        self._lock = threading.Lock()
+        try:
+            self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+            self.path = path or ":memory:"
+        except Exception:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self.path = ":memory:"
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, doc_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (doc_id);
+                CREATE TABLE IF NOT EXISTS index_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """
+            )
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def upsert(self, docs: Iterable[tuple[str, str]]) -> None:
+        """Indexa (o re-indexa) documentos.
+
+        Args:
+            docs: Iterable de (doc_id, texto). Los postings previos de cada
+                doc_id se eliminan antes de insertar los nuevos.
+        """
+        rows: list[tuple[str, str, int]] = []
+        doc_ids: list[str] = []
+        for doc_id, text in docs:
+            doc_ids.append(doc_id)
+            for term, tf in extract_code_terms(text).items():
+                rows.append((term, doc_id, tf))
+
+        if not doc_ids:
+            return
+
+        with self._lock:
+            self._conn.executemany("DELETE FROM postings WHERE doc_id = ?", [(d,) for d in doc_ids])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        """Elimina del índice los postings de los doc_ids indicados."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM postings WHERE doc_id = ?", [(d,) for d in doc_ids])
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Vacía el índice completo."""
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM index_meta")
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Metadata del índice
+    # ------------------------------------------------------------------
+    def get_meta(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def postings(self, terms: list[str]) -> dict[str, dict[str, int]]:
+        """Retorna {término: {doc_id: tf}} para los términos pedidos."""
+        result: dict[str, dict[str, int]] = {t: {} for t in terms}
+        if not terms:
+            return result
+        placeholders = ",".join("?" for _ in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT term, doc_id, tf FROM postings WHERE term IN ({placeholders})", terms
+            ).fetchall()
+        for term, doc_id, tf in rows:
+            result[term][doc_id] = tf
+        return result
+
+    def score_codes(self, error_codes: list[str]) -> dict[str, float]:
+        """Calcula los keyword_scores para códigos de error.
+
+        Equivalente al scoring de `_keyword_boost_search` sobre la colección
+        completa: suma de `tf * peso_patrón` por documento.
+
+        Returns:
+            Dict de {doc_id: keyword_score} (solo documentos con score > 0)
+        """
+        patterns: list[str] = []
+        for code in error_codes:
+            patterns.extend(code_patterns(code))
+
+        postings = self.postings(sorted(set(patterns)))
+        scores: dict[str, float] = {}
+        # Iterar sobre la lista con repetidos para respetar el scoring
+        # original si dos códigos generan el mismo patrón.
+        for pattern in patterns:
+            weight = pattern_weight(pattern)
+            for doc_id, tf in postings.get(pattern, {}).items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + tf * weight
+        return scores
+
+    def stats(self) -> dict[str, Any]:
+        """Estadísticas básicas del índice."""
+        with self._lock:
+            terms = self._conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+            docs = self._conn.execute("SELECT COUNT(DISTINCT doc_id) FROM postings").fetchone()[0]
+            rows = self._conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        return {"path": self.path, "terms": terms, "docs_with_codes": docs, "postings": rows}
@@ -0,0 +1,127 @@
+"""Cache LRU acotado, thread-safe y con TTL.
+
+Usado por la KB para cachear embeddings de queries y resultados de búsqueda.
+Expone contadores de hits/misses/evictions para poder medir la tasa de
+acierto desde el MCP.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import threading
+import time
+
+
+class LRUCache:
+    """Cache LRU con tamaño máximo y expiración por TTL.
+
+    - `max_entries <= 0` deshabilita el cache (todas las lecturas son miss).
+    - `ttl_seconds <= 0` desactiva la expiración por tiempo.
+    - `max_bytes > 0` acota además la memoria según el tamaño (estimado por el
+      llamador) que se pasa en `put(key, value, size=...)`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 0.0,
+        name: str = "cache",
+        max_bytes: int = 0,
+    ) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[Hashable, tuple[Any, float, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable) -> Any | None:
+        """Retorna el valor cacheado o None (cuenta hit/miss)."""
+        if not self.enabled:
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at and expires_at <= now:
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> None:
+        """Guarda un valor, desalojando los menos usados si se supera el tamaño.
+
+        Args:
+            key: Clave hashable
+            value: Valor a cachear
+            size: Tamaño estimado en bytes (solo cuenta si `max_bytes > 0`)
+        """
+        if not self.enabled:
+            return
+        if self.max_bytes > 0 and size > self.max_bytes:
+            return  # nunca cabría: no desalojar todo el cache por una entrada
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes > 0 and self._bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Retorna el valor cacheado o lo calcula (fuera del lock) y lo guarda."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Contadores y tasa de acierto del cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,277 @@
+"""Extracción de texto de PDFs en un pool de procesos, página por página.
+
+Extraer un manual de servicio grande con pypdf/pdfminer toma decenas de
+segundos de CPU en Python puro; hecho dentro del handler del MCP bloquea ese
+worker (y el GIL) y mantiene el PDF completo decodificado en memoria.
+`iter_pdf_pages`:
+
+- Escribe el PDF a un archivo temporal; los workers lo abren por ruta y solo
+  leen las páginas de su rango (`PDF_EXTRACT_PAGES_PER_TASK`).
+- Reparte los rangos en un `ProcessPoolExecutor` (`PDF_EXTRACT_WORKERS`,
+  procesos `spawn`) con una ventana acotada de rangos en vuelo por documento,
+  así un manual de 500 páginas no acapara la cola ni se adelanta demasiado al
+  consumidor.
+- Entrega el texto de cada página en orden a medida que terminan los rangos:
+  el chunking y el embedding empiezan antes de parsear el PDF completo.
+- Límites por documento: `PDF_EXTRACT_TIMEOUT` segundos de extracción (suma
+  del tiempo de los rangos, repartida entre los rangos en vuelo y cortada con
+  SIGALRM dentro del worker) y `PDF_EXTRACT_MAX_MEMORY_MB` de memoria por
+  worker (RLIMIT_AS).
+
+Por rango se usa pypdf y, si no extrae nada, pdfminer.six (mismo orden que la
+extracción anterior). `PDF_EXTRACT_WORKERS=0` extrae en el mismo proceso: ahí
+no hay SIGALRM (no es el hilo principal) ni RLIMIT_AS, así que el tiempo solo
+se revisa entre páginas (una página o el fallback a pdfminer no se cortan a la
+mitad) y no hay límite de memoria.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Iterator, List, Optional, Tuple
+import collections
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+
+
+class PdfExtractionError(RuntimeError):
+    """El PDF no se pudo extraer dentro de los límites (tiempo, memoria, worker caído)."""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_inline_warned = False
+
+
+def _config() -> Tuple[int, float, int, int]:
+    workers = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+    timeout = float(os.getenv("PDF_EXTRACT_TIMEOUT", "120"))
+    max_memory_mb = int(os.getenv("PDF_EXTRACT_MAX_MEMORY_MB", "1024"))
+    pages_per_task = max(1, int(os.getenv("PDF_EXTRACT_PAGES_PER_TASK", "8")))
+    return workers, timeout, max_memory_mb, pages_per_task
+
+
+# ---------------------------------------------------------------------------
+# Lado worker
+# ---------------------------------------------------------------------------
+
+def _init_worker(max_memory_mb: int) -> None:
+    if max_memory_mb > 0:
+        try:
+            import resource
+
+            limit = max_memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except Exception as e:  # plataformas sin RLIMIT_AS
+            print(f"⚠️  No se pudo aplicar límite de memoria al extractor de PDF: {e}")
+
+
+def _on_alarm(signum: int, frame: Any) -> None:
+    raise TimeoutError("tiempo de extracción agotado")
+
+
+def _set_alarm(seconds: Optional[float]) -> bool:
+    # SIGALRM solo en el hilo principal (siempre en los workers del pool)
+    if seconds is None or threading.current_thread() is not threading.main_thread():
+        return False
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, max(0.01, seconds))
+    return True
+
+
+def _count_pages(path: str, budget: Optional[float]) -> int:
+    """Páginas del PDF según pypdf (0 si pypdf no lo puede abrir)."""
+    armed = _set_alarm(budget)
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(path).pages)
+    except (TimeoutError, MemoryError):
+        raise
+    except Exception:
+        return 0
+    finally:
+        if armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _extract_range(path: str, start: int, end: Optional[int], budget: Optional[float]) -> Tuple[List[str], float]:
+    """Texto de las páginas [start, end) y segundos usados.
+
+    Con `end=None` (pypdf no pudo abrir el PDF) extrae todo con pdfminer.
+    """
+    t0 = time.perf_counter()
+    armed = _set_alarm(budget)
+    # Sin SIGALRM (extracción en el hilo del request) el tiempo se revisa entre páginas
+    deadline = t0 + budget if budget is not None and not armed else None
+    try:
+        texts: List[str] = []
+        if end is not None:
+            try:
+                from pypdf import PdfReader
+
+                reader = PdfReader(path)
+                for number in range(start, end):
+                    if deadline is not None and time.perf_counter() > deadline:
+                        raise TimeoutError("tiempo de extracción agotado")
+                    try:
+                        texts.append(reader.pages[number].extract_text() or "")
+                    except (TimeoutError, MemoryError):
+                        raise
+                    except Exception:
+                        texts.append("")
+            except (TimeoutError, MemoryError):
+                raise
+            except Exception:
+                texts = []
+
+        if not any(texts):
+            # Fallback a pdfminer.six si pypdf falla, no está instalado o no extrajo nada
+            try:
+                from pdfminer.high_level import extract_text as pdfminer_extract_text
+
+                pages = range(start, end) if end is not None else None
+                # pdfminer separa páginas con form feed
+                texts = pdfminer_extract_text(path, page_numbers=pages).split("\f")
+            except (TimeoutError, MemoryError):
+                raise
+            except Exception:
+                pass
+        return texts, time.perf_counter() - t0
+    finally:
+        if armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# ---------------------------------------------------------------------------
+# Lado servidor
+# ---------------------------------------------------------------------------
+
+def _get_pool(workers: int, max_memory_mb: int) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: workers livianos (sin el modelo ni Chroma del proceso padre),
+            # necesario para que RLIMIT_AS mida solo la extracción
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(max_memory_mb,),
+            )
+        return _pool
+
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    """Descarta un pool roto (worker muerto por OOM, etc.); el próximo uso crea otro."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pdf_pages(data: bytes, timeout: Optional[float] = None) -> Iterator[str]:
+    """Texto de cada página del PDF, en orden, a medida que se extrae.
+
+    Args:
+        data: Contenido del PDF
+        timeout: Segundos de extracción por documento (default: env PDF_EXTRACT_TIMEOUT)
+
+    Raises:
+        PdfExtractionError: si se agota el tiempo, se supera el límite de
+            memoria o se cae un worker
+    """
+    workers, default_timeout, max_memory_mb, pages_per_task = _config()
+    budget = timeout if timeout is not None else default_timeout
+
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="mcp-extract-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+    global _inline_warned
+    if workers <= 0 and not _inline_warned:
+        _inline_warned = True
+        print(
+            "⚠️  PDF_EXTRACT_WORKERS=0: extracción en el mismo proceso, sin límite de memoria "
+            "y con PDF_EXTRACT_TIMEOUT revisado solo entre páginas"
+        )
+
+    pool = _get_pool(workers, max_memory_mb) if workers > 0 else None
+    # (future, segundos asignados al rango)
+    in_flight: Deque[Tuple[Future, Optional[float]]] = collections.deque()
+    spent = 0.0
+
+    def run(fn: Any, *args: Any) -> Future:
+        if pool is not None:
+            return pool.submit(fn, *args)
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def wait(future: Future) -> Any:
+        # Margen para la espera en cola detrás de otros documentos
+        return future.result(timeout=budget * 3 + 30 if budget > 0 else None)
+
+    try:
+        total_pages = wait(run(_count_pages, path, budget or None))
+        ranges = (
+            [(start, min(start + pages_per_task, total_pages)) for start in range(0, total_pages, pages_per_task)]
+            if total_pages > 0
+            else [(0, None)]
+        )
+        window = max(1, workers)
+        next_range = 0
+        while next_range < len(ranges) or in_flight:
+            while next_range < len(ranges) and len(in_flight) < window:
+                range_budget = None
+                if budget > 0:
+                    # Lo asignado a los rangos en vuelo más lo ya gastado nunca supera el budget:
+                    # lo disponible se reparte entre los lugares libres de la ventana
+                    available = budget - spent - sum(allotted or 0.0 for _, allotted in in_flight)
+                    if available <= 0:
+                        if in_flight:
+                            break
+                        raise TimeoutError("tiempo de extracción agotado")
+                    range_budget = available / (window - len(in_flight))
+                start, end = ranges[next_range]
+                in_flight.append((run(_extract_range, path, start, end, range_budget), range_budget))
+                next_range += 1
+            future, _ = in_flight.popleft()
+            texts, elapsed = wait(future)
+            spent += elapsed
+            for text in texts:
+                yield text
+    except (TimeoutError, FutureTimeoutError) as e:
+        # En Python 3.10 `future.result(timeout=...)` no lanza el TimeoutError builtin
+        raise PdfExtractionError(f"extracción de PDF excedió {budget:.0f}s") from e
+    except MemoryError as e:
+        raise PdfExtractionError(f"extracción de PDF excedió {max_memory_mb} MB") from e
+    except BrokenProcessPool as e:
+        if pool is not None:
+            _reset_pool(pool)
+        raise PdfExtractionError(f"worker de extracción caído: {e}") from e
+    finally:
+        for future, _ in in_flight:
+            future.cancel()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
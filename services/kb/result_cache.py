@@ -0,0 +1,114 @@
+"""Cache de respuestas de los endpoints de búsqueda del MCP.
+
+La misma combinación `query + where + pesos + context_chars` se consulta una
+y otra vez (técnicos que repiten el reporte, `predict_fallas` reintentando).
+Cada endpoint tiene su propio LRU acotado en entradas y en memoria, y todas
+las entradas quedan etiquetadas con la generación de la KB: en cuanto una
+ingesta la incrementa, el cache completo se descarta.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable
+import json
+import threading
+
+from services.kb.lru_cache import LRUCache
+
+
+def normalize_params(params: dict[str, Any]) -> str:
+    """Serialización canónica de los parámetros de una búsqueda.
+
+    Colapsa espacios en la query y ordena las claves (también las de `where`)
+    para que requests equivalentes compartan entrada.
+    """
+    normalized = dict(params)
+    if isinstance(normalized.get("query"), str):
+        normalized["query"] = " ".join(normalized["query"].split())
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class SearchResultCache:
+    """Cache por endpoint invalidado por generación de la KB."""
+
+    def __init__(
+        self,
+        endpoints: list[str],
+        generation: Callable[[], int],
+        max_entries: int = 512,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 600.0,
+    ) -> None:
+        """
+        Args:
+            endpoints: Nombres de los endpoints cacheados
+            generation: Función que retorna la generación actual de la KB
+            max_entries: Máximo de entradas por endpoint
+            max_bytes: Memoria total (se reparte entre endpoints)
+            ttl_seconds: Expiración de cada entrada
+        """
+        self._generation = generation
+        self._seen_generation = generation()
+        self._lock = threading.Lock()
+        self.invalidations = 0
+        per_endpoint_bytes = max_bytes // max(1, len(endpoints)) if max_bytes > 0 else 0
+        self._caches = {
+            name: LRUCache(
+                max_entries=max_entries,
+                ttl_seconds=ttl_seconds,
+                name=name,
+                max_bytes=per_endpoint_bytes,
+            )
+            for name in endpoints
+        }
+
+    def _check_generation(self) -> int:
+        """Vacía todos los caches si la KB cambió desde la última consulta."""
+        current = self._generation()
+        if current != self._seen_generation:
+            with self._lock:
+                if current != self._seen_generation:
+                    for cache in self._caches.values():
+                        cache.clear()
+                    self._seen_generation = current
+                    self.invalidations += 1
+        return current
+
+    def get(self, endpoint: str, params: dict[str, Any]) -> dict[str, Any] | None:
+        """Respuesta cacheada (copia superficial) o None."""
+        generation = self._check_generation()
+        value = self._caches[endpoint].get((generation, normalize_params(params)))
+        return dict(value) if value is not None else None
+
+    def current_generation(self) -> int:
+        return self._generation()
+
+    def put(
+        self,
+        endpoint: str,
+        params: dict[str, Any],
+        response: dict[str, Any],
+        generation: int | None = None,
+    ) -> None:
+        """Guarda una respuesta exitosa con su tamaño serializado como estimación de memoria.
+
+        Args:
+            generation: Generación leída antes de ejecutar la búsqueda; si hubo
+                una ingesta mientras tanto, la respuesta no se cachea.
+        """
+        cache = self._caches[endpoint]
+        if not cache.enabled:
+            return
+        current = self._check_generation()
+        if generation is not None and generation != current:
+            return
+        size = len(json.dumps(response, ensure_ascii=False, default=str))
+        cache.put((current, normalize_params(params)), response, size=size)
+
+    def stats(self) -> dict[str, Any]:
+        """Hit rate y uso de memoria por endpoint."""
+        return {
+            "kb_generation": self._seen_generation,
+            "invalidations": self.invalidations,
+            "endpoints": {name: cache.stats() for name, cache in self._caches.items()},
+        }
@@ -0,0 +1,153 @@
+"""Almacén lateral de embeddings de ventanas por chunk.
+
+`kb_search_extended` localiza el mejor match dentro de cada hit comparando la
+query con ventanas solapadas de 100 chars. Como el texto de un chunk no
+cambia entre búsquedas, las ventanas y sus embeddings se pueden calcular una
+sola vez al ingestar y guardarse aquí, indexados por doc_id. En búsqueda la
+localización queda en un producto matriz–vector, sin inferencia del modelo.
+
+Cada registro guarda un hash del texto y el modelo de embeddings (id del
+modelo de `demo_kb` + `KB_EMBEDDING_BACKEND`) para descartar entradas
+obsoletas si el chunk se re-ingesta sin recalcular ventanas o si cambia el
+modelo o el backend.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+import hashlib
+import sqlite3
+import threading
+
+
+def text_hash(text: str) -> str:
+    """Hash corto del texto usado para validar que las ventanas siguen vigentes."""
+    return hashlib.sha1(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+class WindowStore:
+    """Persistencia de {doc_id: (posiciones, embeddings)} en SQLite."""
+
+    def __init__(self, path: str | None = None) -> None:
+        """Abre (o crea) el almacén.
+
+        Args:
+            path: Ruta del archivo SQLite; None usa un almacén en memoria.
+        """
+        self._lock = threading.Lock()
+        try:
+            self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+            self.path = path or ":memory:"
+        except Exception:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self.path = ":memory:"
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS windows (
+                    doc_id TEXT PRIMARY KEY,
+                    text_hash TEXT NOT NULL,
+                    window_size INTEGER NOT NULL,
+                    dim INTEGER NOT NULL,
+                    positions BLOB NOT NULL,
+                    embeddings BLOB NOT NULL,
+                    embedding_model TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+            # Almacenes creados antes de la columna: sus filas quedan sin modelo
+            # (nunca coinciden) hasta que se recalculen
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(windows)")}
+            if "embedding_model" not in columns:
+                self._conn.execute("ALTER TABLE windows ADD COLUMN embedding_model TEXT NOT NULL DEFAULT ''")
+            self._conn.commit()
+
+    def put_many(
+        self, entries: Iterable[tuple[str, str, int, list[int], Any]], embedding_model: str = ""
+    ) -> None:
+        """Guarda ventanas precomputadas.
+
+        Args:
+            entries: Iterable de (doc_id, texto, window_size, posiciones, embeddings)
+                con embeddings normalizados de shape (n_ventanas, dim).
+            embedding_model: Modelo + backend que generó los embeddings
+        """
+        import numpy as np
+
+        rows = []
+        for doc_id, text, window_size, positions, embeddings in entries:
+            emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+            dim = int(emb.shape[1]) if emb.ndim == 2 and emb.shape[0] else 0
+            rows.append((
+                doc_id,
+                text_hash(text),
+                window_size,
+                dim,
+                np.asarray(positions, dtype=np.int32).tobytes(),
+                emb.tobytes(),
+                embedding_model,
+            ))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO windows "
+                "(doc_id, text_hash, window_size, dim, positions, embeddings, embedding_model) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def get_many(
+        self, items: list[tuple[str, str]], window_size: int = 100, embedding_model: str = ""
+    ) -> dict[str, tuple[list[int], Any]]:
+        """Lee en un solo query las ventanas vigentes para varios documentos.
+
+        Args:
+            items: Lista de (doc_id, texto actual)
+            window_size: Tamaño de ventana esperado
+            embedding_model: Modelo + backend actual de la KB
+
+        Returns:
+            Dict {doc_id: (posiciones, embeddings)} solo para entradas cuyo
+            hash coincide con el texto actual y cuyos embeddings son del mismo
+            modelo (un modelo distinto cuenta como miss).
+        """
+        if not items:
+            return {}
+        import numpy as np
+
+        expected = {doc_id: text_hash(text) for doc_id, text in items}
+        placeholders = ",".join("?" for _ in expected)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, text_hash, window_size, dim, positions, embeddings, embedding_model "
+                f"FROM windows WHERE doc_id IN ({placeholders})",
+                list(expected.keys()),
+            ).fetchall()
+
+        result: dict[str, tuple[list[int], Any]] = {}
+        for doc_id, stored_hash, stored_window, dim, pos_blob, emb_blob, stored_model in rows:
+            if (
+                stored_hash != expected.get(doc_id)
+                or stored_window != window_size
+                or stored_model != embedding_model
+            ):
+                continue
+            positions = np.frombuffer(pos_blob, dtype=np.int32).tolist()
+            embeddings = np.frombuffer(emb_blob, dtype=np.float32)
+            embeddings = embeddings.reshape(len(positions), dim) if dim else embeddings.reshape(0, 0)
+            result[doc_id] = (positions, embeddings)
+        return result
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        """Elimina las ventanas guardadas de los doc_ids indicados."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM windows WHERE doc_id = ?", [(d,) for d in doc_ids])
+            self._conn.commit()
+
+    def stats(self) -> dict[str, Any]:
+        """Estadísticas básicas del almacén."""
+        with self._lock:
+            docs = self._conn.execute("SELECT COUNT(*) FROM windows").fetchone()[0]
+        return {"path": self.path, "docs": docs}
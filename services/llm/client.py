@@ -1,62 +1,254 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, List, Optional
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
 import json
+import threading
+import time
 
 from openai import OpenAI
 
 
+# Defaults por agente (sobrescribibles con LLM_AGENTS). El re-ranker devuelve
+# un ranking con explicación por candidato y necesita más tokens que el default.
+_AGENT_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "rerank": {"max_tokens": 2000},
+}
+
+_registry_lock = threading.Lock()
+_clients: Dict[Tuple[str, str], "LLMClient"] = {}
+_sync_openai: Dict[Tuple[str, Optional[str]], OpenAI] = {}
+_async_openai: Dict[Tuple[str, Optional[str]], Tuple[Any, Any]] = {}
+_metrics: Dict[str, "LLMAgentMetrics"] = {}
+
+
+def _agents_config() -> Dict[str, Any]:
+    raw_agents = os.getenv("LLM_AGENTS")
+    if not raw_agents:
+        return {}
+    try:
+        agents_cfg = json.loads(raw_agents)
+    except Exception:
+        return {}
+    return agents_cfg if isinstance(agents_cfg, dict) else {}
+
+
+class LLMAgentMetrics:
+    """Latencia, tokens y errores acumulados de un agente."""
+
+    def __init__(self, window: int = 1000) -> None:
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, latency_ms: float, usage: Any = None, error: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self._latencies.append(latency_ms)
+            if error:
+                self.errors += 1
+            if usage is not None:
+                self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._latencies)
+
+            def pct(q: float) -> float:
+                return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 1) if ordered else 0.0
+
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "error_rate": round(self.errors / self.calls, 4) if self.calls else 0.0,
+                "latency_ms": {
+                    "avg": round(sum(ordered) / len(ordered), 1) if ordered else 0.0,
+                    "p50": pct(0.5),
+                    "p95": pct(0.95),
+                },
+                "tokens": {
+                    "prompt": self.prompt_tokens,
+                    "completion": self.completion_tokens,
+                    "total": self.prompt_tokens + self.completion_tokens,
+                },
+            }
+
+
+def _agent_metrics(agent: Optional[str]) -> LLMAgentMetrics:
+    name = agent or "default"
+    with _registry_lock:
+        if name not in _metrics:
+            _metrics[name] = LLMAgentMetrics()
+        return _metrics[name]
+
+
+def _shared_sync_client(api_key: str, base_url: Optional[str]) -> OpenAI:
+    """Un `OpenAI` (y su pool HTTP) por credencial/endpoint, compartido entre agentes."""
+    key = (api_key, base_url)
+    with _registry_lock:
+        client = _sync_openai.get(key)
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url) if base_url else OpenAI(api_key=api_key)
+            _sync_openai[key] = client
+        return client
+
+
+def _shared_async_client(api_key: str, base_url: Optional[str]) -> Any:
+    """Un `AsyncOpenAI` por credencial/endpoint sobre el pool HTTP compartido `llm`."""
+    from openai import AsyncOpenAI
+
+    from services.orch.http_pool import get_async_client
+
+    http_client = get_async_client("llm")
+    key = (api_key, base_url)
+    with _registry_lock:
+        client, pool = _async_openai.get(key, (None, None))
+        # El pool se recrea si se cerró (shutdown/tests): no reutilizar uno cerrado
+        if client is None or pool is not http_client:
+            kwargs: Dict[str, Any] = {"api_key": api_key, "http_client": http_client}
+            if base_url:
+                kwargs["base_url"] = base_url
+            client = AsyncOpenAI(**kwargs)
+            _async_openai[key] = (client, http_client)
+        return client
+
+
 class LLMClient:
     def __init__(self, agent: Optional[str] = None) -> None:
         """Cliente LLM con soporte de configuración por agente.
 
         - Si se define `LLM_AGENTS` (JSON en env), busca la sección del agente por nombre
           y permite configurar `model`, `base_url`, `temperature`, `max_tokens`, `api_key`.
-        - Fallback a variables globales (`OPENAI_API_KEY`, `LLM_MODEL`, etc.).
+        - Fallback a variables globales (`OPENAI_API_KEY`, `LLM_MODEL`, `LLM_BASE_URL`, etc.).
         - Para servidores OpenAI‑compatibles locales, si no hay API key, usa una dummy.
-        """
 
-        # Cargar configuración de agentes desde env
-        agents_cfg: Dict[str, Any] = {}
-        raw_agents = os.getenv("LLM_AGENTS")
-        if raw_agents:
-            try:
-                agents_cfg = json.loads(raw_agents)
-            except Exception:
-                agents_cfg = {}
+        Preferir `get_llm_client(agent)`, que reutiliza la instancia del agente;
+        los clientes OpenAI subyacentes (y sus conexiones) se comparten siempre.
+        """
 
-        cfg: Dict[str, Any] = agents_cfg.get(agent or "", {}) if isinstance(agents_cfg, dict) else {}
+        agents_cfg = _agents_config()
+        cfg: Dict[str, Any] = {**_AGENT_DEFAULTS.get(agent or "", {}), **agents_cfg.get(agent or "", {})}
 
         model = cfg.get("model") or os.getenv("LLM_MODEL", "gpt-4o-mini")
         temperature = float(str(cfg.get("temperature", os.getenv("LLM_TEMPERATURE", "0.1"))))
         max_tokens = int(str(cfg.get("max_tokens", os.getenv("LLM_MAX_TOKENS", "800"))))
-        base_url = cfg.get("base_url")
+        base_url = cfg.get("base_url") or os.getenv("LLM_BASE_URL") or None
 
         # API key: preferir la del agente, luego global, luego dummy local
-        api_key = cfg.get("api_key") or os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_LOCAL_API_KEY") or "sk-local"
+        configured_key = cfg.get("api_key") or os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_LOCAL_API_KEY")
+        api_key = configured_key or "sk-local"
         if not api_key:
             raise RuntimeError("No se encontró API key para el cliente LLM")
 
-        if base_url:
-            self._client = OpenAI(api_key=api_key, base_url=base_url)
-        else:
-            self._client = OpenAI(api_key=api_key)
+        self._client = _shared_sync_client(api_key, base_url)
 
+        self.agent = agent
+        self.has_api_key = bool(configured_key)
+        self._api_key = api_key
+        self._base_url = base_url
         self._model = model
         self._temperature = temperature
         self._max_tokens = max_tokens
+        self._metrics = _agent_metrics(agent)
+
+    @property
+    def model(self) -> str:
+        return self._model
 
-    def complete_json(self, system_prompt: str, user_prompt: str) -> str:
-        resp = self._client.chat.completions.create(
-            model=self._model,
-            temperature=self._temperature,
-            max_tokens=self._max_tokens,
-            messages=[
+    def _request(
+        self, system_prompt: str, user_prompt: str, json_mode: bool, model: Optional[str]
+    ) -> Dict[str, Any]:
+        request: Dict[str, Any] = {
+            "model": model or self._model,
+            "temperature": self._temperature,
+            "max_tokens": self._max_tokens,
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-        )
+        }
+        if json_mode:
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    def complete_json(
+        self, system_prompt: str, user_prompt: str, json_mode: bool = False, model: Optional[str] = None
+    ) -> str:
+        t0 = time.perf_counter()
+        try:
+            resp = self._client.chat.completions.create(**self._request(system_prompt, user_prompt, json_mode, model))
+        except Exception:
+            self._metrics.record((time.perf_counter() - t0) * 1000, error=True)
+            raise
+        self._metrics.record((time.perf_counter() - t0) * 1000, usage=resp.usage)
+        return resp.choices[0].message.content or "{}"
+
+    async def acomplete_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        timeout: Any = None,
+        json_mode: bool = False,
+        model: Optional[str] = None,
+    ) -> str:
+        """Versión asíncrona de `complete_json` sobre el pool HTTP compartido `llm`."""
+        options: Dict[str, Any] = {"timeout": timeout} if timeout is not None else {}
+        t0 = time.perf_counter()
+        try:
+            resp = await _shared_async_client(self._api_key, self._base_url).chat.completions.create(
+                **self._request(system_prompt, user_prompt, json_mode, model), **options
+            )
+        except Exception:
+            self._metrics.record((time.perf_counter() - t0) * 1000, error=True)
+            raise
+        self._metrics.record((time.perf_counter() - t0) * 1000, usage=resp.usage)
         return resp.choices[0].message.content or "{}"
 
+    async def astream_json(self, system_prompt: str, user_prompt: str, timeout: Any = None) -> AsyncIterator[str]:
+        """Como `acomplete_json`, pero entrega los fragmentos de texto a medida que llegan."""
+        options: Dict[str, Any] = {"timeout": timeout} if timeout is not None else {}
+        t0 = time.perf_counter()
+        usage = None
+        try:
+            stream = await _shared_async_client(self._api_key, self._base_url).chat.completions.create(
+                **self._request(system_prompt, user_prompt, False, None),
+                stream=True,
+                stream_options={"include_usage": True},
+                **options,
+            )
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            self._metrics.record((time.perf_counter() - t0) * 1000, error=True)
+            raise
+        self._metrics.record((time.perf_counter() - t0) * 1000, usage=usage)
+
+
+def get_llm_client(agent: Optional[str] = None) -> LLMClient:
+    """Instancia reutilizable del cliente de un agente (una por proceso).
+
+    Se reconstruye solo si cambia `LLM_AGENTS`.
+    """
+    key = (agent or "", os.getenv("LLM_AGENTS") or "")
+    with _registry_lock:
+        client = _clients.get(key)
+    if client is None:
+        client = LLMClient(agent)
+        with _registry_lock:
+            client = _clients.setdefault(key, client)
+    return client
+
 
+def llm_metrics() -> Dict[str, Any]:
+    """Métricas por agente: llamadas, errores, latencia (p50/p95) y tokens de `resp.usage`."""
+    with _registry_lock:
+        agents = dict(_metrics)
+    return {name: m.snapshot() for name, m in sorted(agents.items())}
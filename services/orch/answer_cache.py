@@ -0,0 +1,193 @@
+"""Cache semántico de respuestas de `/api/v1/predict-fallas`.
+
+Muchos reportes son casi idénticos ("service 25 iCombi Classic" vs
+"servicio 25 en el classic"): si la descripción de un reporte nuevo es
+suficientemente similar (coseno >= `ANSWER_CACHE_THRESHOLD`) a la de uno ya
+resuelto para el mismo equipo, se devuelve el diagnóstico guardado sin
+recuperar ni llamar al LLM.
+
+- Los embeddings los calcula la KB (`transport.aembed`), con el mismo modelo
+  y cache de queries que las búsquedas, y vienen con la generación de la KB:
+  si cambió (nueva ingesta), el cache se descarta completo.
+- Solo se comparan reportes del mismo equipo (marca + modelo normalizado) y
+  con los mismos números en la descripción: "service 25" nunca responde a
+  "service 34" aunque sus embeddings sean muy parecidos.
+- Solo se guardan diagnósticos generados por el LLM (sin fallback ni baja
+  evidencia).
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import copy
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+
+@dataclass
+class AnswerCacheProbe:
+    """Resultado de un lookup; se reutiliza en `store` para no re-embeber."""
+
+    key: Tuple[str, ...]
+    vector: Optional[np.ndarray]
+    generation: Any
+    data: Optional[Dict[str, Any]] = None
+    similarity: float = 0.0
+
+    @property
+    def hit(self) -> bool:
+        return self.data is not None
+
+
+def _normalize(text: Optional[str]) -> str:
+    return re.sub(r"[\s\-_]+", "", (text or "").lower())
+
+
+def equipment_key(descripcion: str, equipo: Dict[str, Any]) -> Tuple[str, ...]:
+    """Partición del cache: marca, modelo normalizado y números de la descripción."""
+    brand = (equipo or {}).get("marca") or (equipo or {}).get("brand")
+    model = _normalize((equipo or {}).get("modelo") or (equipo or {}).get("model"))
+    # Misma normalización de modelo que `rag._build_search_query`
+    if "icombiclassic" in model or "classic" in model:
+        model = "icombiclassic"
+    elif "icombipro" in model or "pro" in model:
+        model = "icombipro"
+    numbers = ",".join(sorted(set(re.findall(r"\d+", descripcion or ""))))
+    return (_normalize(brand), model, numbers)
+
+
+def _embedding_text(descripcion: str, key: Tuple[str, ...]) -> str:
+    brand, model, _ = key
+    return f"{brand} {model} {' '.join((descripcion or '').split())}".strip()
+
+
+class SemanticAnswerCache:
+    """Cache LRU de diagnósticos indexado por similitud de embeddings."""
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        threshold: float = 0.92,
+        ttl_seconds: float = 86400,
+    ) -> None:
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # entry_id -> (key, vector, data, expires_at)
+        self._entries: "OrderedDict[int, Tuple[Tuple[str, ...], np.ndarray, Dict[str, Any], float]]" = OrderedDict()
+        self._next_id = 0
+        self._generation: Any = None
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _check_generation(self, generation: Any) -> None:
+        if generation != self._generation:
+            if self._entries:
+                self._invalidations += 1
+                print(f"♻️  Cache de respuestas invalidado (generación KB {self._generation} → {generation})")
+            self._entries.clear()
+            self._generation = generation
+
+    def lookup(
+        self,
+        key: Tuple[str, ...],
+        vector: np.ndarray,
+        generation: Any,
+    ) -> AnswerCacheProbe:
+        """Busca la entrada más similar de la misma partición."""
+        probe = AnswerCacheProbe(key=key, vector=vector, generation=generation)
+        now = time.time()
+        with self._lock:
+            self._check_generation(generation)
+            best_id, best_sim = None, -1.0
+            for entry_id, (entry_key, entry_vec, _, expires_at) in list(self._entries.items()):
+                if expires_at and expires_at < now:
+                    del self._entries[entry_id]
+                    continue
+                if entry_key != key:
+                    continue
+                sim = float(np.dot(entry_vec, vector))
+                if sim > best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is not None and best_sim >= self.threshold:
+                self._entries.move_to_end(best_id)
+                probe.data = copy.deepcopy(self._entries[best_id][2])
+                probe.similarity = best_sim
+                self._hits += 1
+            else:
+                self._misses += 1
+        return probe
+
+    def store(self, probe: AnswerCacheProbe, data: Dict[str, Any]) -> bool:
+        """Guarda un diagnóstico del LLM; ignora fallbacks y respuestas con baja evidencia."""
+        signals = data.get("signals") or {}
+        if (
+            probe.vector is None
+            or not signals.get("llm_used")
+            or signals.get("low_evidence")
+            or not data.get("fallas_probables")
+        ):
+            return False
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+        with self._lock:
+            # La KB cambió mientras se generaba la respuesta: no guardar
+            if probe.generation != self._generation:
+                return False
+            self._entries[self._next_id] = (probe.key, probe.vector, copy.deepcopy(data), expires_at)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    async def alookup(self, transport: Any, descripcion: str, equipo: Dict[str, Any]) -> Optional[AnswerCacheProbe]:
+        """Embebe el reporte vía la KB y busca una respuesta similar.
+
+        Returns:
+            Probe (con `data` si hubo hit) o None si el cache está deshabilitado
+            o la KB no pudo calcular el embedding
+        """
+        if not self.enabled:
+            return None
+        key = equipment_key(descripcion, equipo)
+        try:
+            res = await transport.aembed([_embedding_text(descripcion, key)])
+            vector = np.asarray(res["embeddings"][0], dtype=np.float32)
+        except Exception as e:
+            print(f"⚠️  Cache de respuestas: no se pudo obtener embedding ({e})")
+            return None
+        generation = (res.get("model_id"), res.get("kb_generation"))
+        return self.lookup(key, vector, generation)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+                "invalidations": self._invalidations,
+            }
+
+
+def create_answer_cache() -> SemanticAnswerCache:
+    """Cache configurado por env (ANSWER_CACHE_SIZE=0 lo deshabilita)."""
+    return SemanticAnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+    )
@@ -0,0 +1,262 @@
+"""Ensamblado del contexto del prompt con presupuesto de tokens.
+
+`build_context_from_hits` concatena el contexto de cada hit tal cual: los
+chunks `#cN` consecutivos de un mismo documento se solapan 200 caracteres
+(`_chunk_text` del MCP) y distintas páginas repiten párrafos, así que una
+parte del prompt es texto duplicado. `assemble_context`:
+
+1. Recorre los hits en orden de relevancia y fusiona en un solo pasaje los
+   que vienen del mismo documento y se solapan (sufijo de uno = prefijo del
+   otro), citando todos sus `doc_id`.
+2. Descarta pasajes casi duplicados de uno ya incluido (contención de
+   shingles de palabras >= `CONTEXT_DEDUP_THRESHOLD`).
+3. Llena `CONTEXT_TOKEN_BUDGET` tokens en orden de relevancia; el último
+   pasaje que no cabe completo se recorta.
+
+Los tokens se cuentan con `tiktoken` (`pip install -e .[tokens]`, encoding
+`CONTEXT_TOKENIZER`); sin él se estima con ~4 caracteres por token.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import os
+import re
+
+
+_MIN_OVERLAP_CHARS = 30
+_MAX_OVERLAP_CHARS = 600
+_SHINGLE_SIZE = 5
+_MIN_TRUNCATED_TOKENS = 100
+
+_token_counter: Optional[Callable[[str], int]] = None
+_tokenizer_name = "chars/4"
+
+
+def _get_token_counter() -> Callable[[str], int]:
+    """Contador de tokens local (tiktoken si está instalado)."""
+    global _token_counter, _tokenizer_name
+    if _token_counter is None:
+        encoding_name = os.getenv("CONTEXT_TOKENIZER", "o200k_base")
+        try:
+            import tiktoken
+
+            encoding = tiktoken.get_encoding(encoding_name)
+            _token_counter = lambda text: len(encoding.encode(text, disallowed_special=()))
+            _tokenizer_name = f"tiktoken:{encoding_name}"
+        except Exception as e:
+            print(f"⚠️  tiktoken no disponible ({e}), estimando tokens como caracteres/4")
+            _token_counter = lambda text: (len(text) + 3) // 4
+            _tokenizer_name = "chars/4"
+    return _token_counter
+
+
+def count_tokens(text: str) -> int:
+    return _get_token_counter()(text) if text else 0
+
+
+def build_context_from_hits(hits: List[Dict[str, Any]]) -> str:
+    """Construye contexto textual enriquecido desde los hits de KB.
+    
+    Usa el campo "context" (contexto ampliado) cuando está disponible,
+    con fallback a "snippet" para compatibilidad con versiones anteriores.
+    
+    Args:
+        hits: Resultados de búsqueda semántica en KB
+        
+    Returns:
+        Contexto formateado con fuentes citables
+    """
+    lines: List[str] = []
+    for h in hits:
+        doc_id = h.get("doc_id", "unknown")
+        # Preferir "context" (ampliado) sobre "snippet" (limitado a 500 chars)
+        text = h.get("context") or h.get("snippet", "")
+        metadata = h.get("metadata", {})
+        
+        # Incluir metadata relevante si está disponible
+        context_line = f"[source:{doc_id}]"
+        if metadata.get("brand"):
+            context_line += f" [marca:{metadata['brand']}]"
+        if metadata.get("model"):
+            context_line += f" [modelo:{metadata['model']}]"
+        if metadata.get("page"):
+            context_line += f" [página:{metadata['page']}]"
+        context_line += f" {text}"
+        
+        lines.append(context_line)
+    
+    return "\n".join(lines)
+
+
+def _split_chunk_id(doc_id: str) -> Tuple[str, Optional[int]]:
+    """"manual_p25#c3" -> ("manual_p25", 3); ids sin sufijo -> (doc_id, None)."""
+    base, sep, idx = doc_id.rpartition("#c")
+    if sep and idx.isdigit():
+        return base, int(idx)
+    return doc_id, None
+
+
+def _clean_text(text: str) -> str:
+    # Quitar los "..." que agrega la ventana de contexto para poder detectar solapes
+    text = text.strip()
+    if text.startswith("..."):
+        text = text[3:]
+    if text.endswith("..."):
+        text = text[:-3]
+    return text.strip()
+
+
+def _overlap(left: str, right: str) -> int:
+    """Largo del mayor sufijo de `left` que es prefijo de `right` (0 si no hay)."""
+    longest = min(len(left), len(right), _MAX_OVERLAP_CHARS)
+    for k in range(longest, _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+def _merge_texts(a: str, b: str) -> Optional[str]:
+    """Une dos textos del mismo documento si uno contiene al otro o se solapan."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    k = _overlap(a, b)
+    if k:
+        return a + b[k:]
+    k = _overlap(b, a)
+    if k:
+        return b + a[k:]
+    return None
+
+
+def _shingles(text: str) -> Set[int]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < _SHINGLE_SIZE:
+        return {hash(" ".join(words))} if words else set()
+    return {hash(" ".join(words[i:i + _SHINGLE_SIZE])) for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+
+def _passage_header(doc_ids: List[str], metadata: Dict[str, Any]) -> str:
+    # Mismo formato de cita que build_context_from_hits
+    header = " ".join(f"[source:{doc_id}]" for doc_id in doc_ids)
+    if metadata.get("brand"):
+        header += f" [marca:{metadata['brand']}]"
+    if metadata.get("model"):
+        header += f" [modelo:{metadata['model']}]"
+    if metadata.get("page"):
+        header += f" [página:{metadata['page']}]"
+    return header
+
+
+def assemble_context(
+    hits: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    dedup_threshold: Optional[float] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """Arma el contexto del prompt sin texto repetido y dentro del presupuesto.
+
+    Args:
+        hits: Hits en orden de relevancia (como los recibe el LLM)
+        token_budget: Máximo de tokens del contexto (default: env
+            CONTEXT_TOKEN_BUDGET; 0 = sin límite)
+        dedup_threshold: Fracción de shingles de un pasaje ya presentes en otro
+            para descartarlo (default: env CONTEXT_DEDUP_THRESHOLD)
+
+    Returns:
+        (contexto, stats) con stats: context_tokens, tokens_raw (lo que
+        costaba `build_context_from_hits`), tokens_saved, passages, merged,
+        deduplicated, truncated, dropped_budget y tokenizer
+    """
+    if token_budget is None:
+        token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "5000"))
+    if dedup_threshold is None:
+        dedup_threshold = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+    passages: List[Dict[str, Any]] = []
+    merged = deduplicated = 0
+
+    for hit in hits:
+        doc_id = hit.get("doc_id", "unknown")
+        text = _clean_text(hit.get("context") or hit.get("snippet", ""))
+        if not text:
+            continue
+        base_id, _ = _split_chunk_id(doc_id)
+
+        # 1. Fusionar con un pasaje del mismo documento si se solapan (chunks contiguos)
+        target = None
+        for passage in passages:
+            combined = _merge_texts(passage["text"], text) if passage["base_id"] == base_id else None
+            if combined is not None:
+                passage["text"] = combined
+                target = passage
+                break
+        if target is not None:
+            if doc_id not in target["doc_ids"]:
+                target["doc_ids"].append(doc_id)
+            merged += 1
+            # El pasaje creció: puede unir otros del mismo documento (c3 + c5 al llegar c4)
+            for other in [p for p in passages if p is not target and p["base_id"] == base_id]:
+                combined = _merge_texts(target["text"], other["text"])
+                if combined is not None:
+                    target["text"] = combined
+                    target["doc_ids"] += [d for d in other["doc_ids"] if d not in target["doc_ids"]]
+                    passages.remove(other)
+                    merged += 1
+            target["shingles"] = _shingles(target["text"])
+            continue
+
+        # 2. Descartar casi duplicados de pasajes más relevantes
+        shingles = _shingles(text)
+        if shingles and any(
+            len(shingles & passage["shingles"]) / len(shingles) >= dedup_threshold for passage in passages
+        ):
+            deduplicated += 1
+            continue
+
+        passages.append({
+            "base_id": base_id,
+            "doc_ids": [doc_id],
+            "metadata": hit.get("metadata", {}) or {},
+            "text": text,
+            "shingles": shingles,
+        })
+
+    # 3. Llenar el presupuesto en orden de relevancia
+    lines: List[str] = []
+    used = truncated = dropped = 0
+    for passage in passages:
+        line = f"{_passage_header(passage['doc_ids'], passage['metadata'])} {passage['text']}"
+        tokens = count_tokens(line) + 1  # + salto de línea
+        if token_budget <= 0 or used + tokens <= token_budget:
+            lines.append(line)
+            used += tokens
+            continue
+        remaining = token_budget - used
+        if remaining >= _MIN_TRUNCATED_TOKENS:
+            # Recorte proporcional; se ajusta hasta entrar en el presupuesto
+            cut = int(len(line) * remaining / tokens)
+            while cut > 0 and count_tokens(line[:cut] + "...") + 1 > remaining:
+                cut = int(cut * 0.9)
+            if cut > 0:
+                lines.append(line[:cut] + "...")
+                used += count_tokens(lines[-1]) + 1
+                truncated += 1
+                continue
+        dropped += 1
+
+    context = "\n".join(lines)
+    context_tokens = count_tokens(context)
+    tokens_raw = count_tokens(build_context_from_hits(hits))
+    return context, {
+        "context_tokens": context_tokens,
+        "tokens_raw": tokens_raw,
+        "tokens_saved": max(0, tokens_raw - context_tokens),
+        "passages": len(lines),
+        "merged": merged,
+        "deduplicated": deduplicated,
+        "truncated": truncated,
+        "dropped_budget": dropped,
+        "tokenizer": _tokenizer_name,
+    }
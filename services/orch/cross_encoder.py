@@ -0,0 +1,167 @@
+"""Backends de cross-encoder para re-ranking local en CPU.
+
+Un cross-encoder puntúa cada par (query, documento) con un solo forward del
+modelo, sin generar texto: re-rankear 10-20 hits toma decenas de ms en CPU
+frente a una llamada completa al LLM.
+
+El backend se elige con `RERANK_CROSS_ENCODER_BACKEND`:
+
+- `torch` (default): `sentence_transformers.CrossEncoder`.
+- `onnx`: el mismo modelo exportado a ONNX y ejecutado con ONNX Runtime.
+- `onnx-int8`: como `onnx`, con cuantización dinámica int8 de los pesos.
+
+Todos exponen `predict(pairs, batch_size=16)` y retornan un `np.ndarray` con
+la relevancia de cada par en [0, 1] (sigmoide del logit; softmax de la clase
+positiva en modelos de 2 clases). Como en `services.kb.embeddings`, el modelo
+ONNX se exporta la primera vez (requiere `optimum`) a `KB_ONNX_DIR`.
+"""
+
+from __future__ import annotations
+
+from typing import Any, List, Tuple
+import os
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+DEFAULT_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+def _to_probabilities(scores: Any) -> Any:
+    import numpy as np
+
+    scores = np.asarray(scores, dtype=np.float32)
+    if scores.ndim == 2 and scores.shape[1] > 1:
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return (exp / exp.sum(axis=1, keepdims=True))[:, 1]
+    return scores.reshape(-1)
+
+
+class TorchCrossEncoder:
+    """Backend PyTorch vía sentence-transformers."""
+
+    name = "torch"
+
+    def __init__(self, model_id: str, max_length: int = 512) -> None:
+        from sentence_transformers import CrossEncoder
+
+        self.model_id = model_id
+        self._model = CrossEncoder(model_id, max_length=max_length, device="cpu")
+
+    def predict(self, pairs: List[Tuple[str, str]], batch_size: int = 16) -> Any:
+        # CrossEncoder ya aplica sigmoide a modelos de una salida
+        scores = self._model.predict(pairs, batch_size=batch_size, convert_to_numpy=True)
+        return _to_probabilities(scores)
+
+
+class OnnxCrossEncoder:
+    """Backend ONNX Runtime para cross-encoders (AutoModelForSequenceClassification)."""
+
+    def __init__(
+        self,
+        model_id: str,
+        onnx_dir: str | None = None,
+        quantize: bool = False,
+        max_length: int = 512,
+        num_threads: int | None = None,
+    ) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_id = model_id
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+        base_dir = onnx_dir or os.getenv("KB_ONNX_DIR", "/data/onnx")
+        self.onnx_dir = os.path.join(base_dir, model_id.replace("/", "__"))
+
+        model_path = self._ensure_exported()
+        if quantize:
+            model_path = self._ensure_quantized(model_path)
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(self.onnx_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=max_length)
+        self._tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        threads = num_threads or int(os.getenv("RERANK_ONNX_THREADS", os.getenv("KB_ONNX_THREADS", "0")))
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def _ensure_exported(self) -> str:
+        """Exporta el modelo a ONNX si aún no existe en `onnx_dir`."""
+        model_path = os.path.join(self.onnx_dir, "model.onnx")
+        if os.path.exists(model_path) and os.path.exists(os.path.join(self.onnx_dir, "tokenizer.json")):
+            return model_path
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                f"No existe {model_path} y falta `optimum[onnxruntime]` para exportarlo: {e}"
+            ) from e
+
+        print(f"📦 Exportando {self.model_id} a ONNX en {self.onnx_dir}...")
+        os.makedirs(self.onnx_dir, exist_ok=True)
+        ORTModelForSequenceClassification.from_pretrained(self.model_id, export=True).save_pretrained(self.onnx_dir)
+        AutoTokenizer.from_pretrained(self.model_id).save_pretrained(self.onnx_dir)
+        return model_path
+
+    def _ensure_quantized(self, model_path: str) -> str:
+        """Genera la versión int8 (cuantización dinámica de pesos) si no existe."""
+        quantized_path = os.path.join(self.onnx_dir, "model_int8.onnx")
+        if os.path.exists(quantized_path):
+            return quantized_path
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"🗜️  Cuantizando {self.model_id} a int8...")
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        return quantized_path
+
+    def predict(self, pairs: List[Tuple[str, str]], batch_size: int = 16) -> Any:
+        import numpy as np
+
+        outputs: list[Any] = []
+        for start in range(0, len(pairs), batch_size):
+            encodings = self._tokenizer.encode_batch(pairs[start:start + batch_size])
+            feeds = {
+                "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+            }
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+            logits = np.asarray(self._session.run(None, feeds)[0], dtype=np.float32)
+            if logits.ndim == 2 and logits.shape[1] == 1:
+                logits = 1.0 / (1.0 + np.exp(-logits))
+            outputs.append(_to_probabilities(logits))
+
+        if not outputs:
+            return np.zeros((0,), dtype=np.float32)
+        return np.concatenate(outputs, axis=0)
+
+
+def create_cross_encoder(model_id: str | None = None, backend: str | None = None) -> Any:
+    """Crea el cross-encoder configurado.
+
+    Args:
+        model_id: Modelo cross-encoder (default: env RERANK_CROSS_ENCODER_MODEL o
+            un MiniLM multilingüe entrenado en mMARCO)
+        backend: torch | onnx | onnx-int8 (default: env RERANK_CROSS_ENCODER_BACKEND o torch)
+
+    Returns:
+        Instancia con método `predict(pairs, batch_size)`
+    """
+    model_id = model_id or os.getenv("RERANK_CROSS_ENCODER_MODEL", DEFAULT_MODEL)
+    max_length = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+    name = (backend or os.getenv("RERANK_CROSS_ENCODER_BACKEND", "torch")).lower()
+    if name == "torch":
+        return TorchCrossEncoder(model_id, max_length=max_length)
+    if name == "onnx":
+        return OnnxCrossEncoder(model_id, quantize=False, max_length=max_length)
+    if name in ("onnx-int8", "onnx_int8", "int8"):
+        return OnnxCrossEncoder(model_id, quantize=True, max_length=max_length)
+    raise ValueError(f"RERANK_CROSS_ENCODER_BACKEND inválido: {name} (opciones: {', '.join(BACKENDS)})")
@@ -0,0 +1,78 @@
+"""Clientes HTTP asíncronos compartidos (pool de conexiones) para el pipeline.
+
+El predictor llama al MCP y al LLM en cada request. Con `requests.post` sin
+`Session` cada llamada abría una conexión TCP/TLS nueva; aquí se mantienen
+`httpx.AsyncClient` de larga vida, uno por destino, con límites de pool y
+keep-alive explícitos, y timeouts por etapa del pipeline.
+
+Configuración (env):
+- `HTTP_POOL_MAX_CONNECTIONS`: conexiones máximas por cliente (default: 100)
+- `HTTP_POOL_MAX_KEEPALIVE`: conexiones ociosas que se mantienen abiertas (default: 20)
+- `HTTP_POOL_KEEPALIVE_EXPIRY`: segundos antes de cerrar una conexión ociosa (default: 30)
+- `HTTP_CONNECT_TIMEOUT`: timeout de conexión para todas las etapas (default: 5)
+- `MCP_SEARCH_TIMEOUT`, `MCP_FALLBACK_TIMEOUT`, `LLM_GENERATE_TIMEOUT`,
+  `LLM_RERANK_TIMEOUT`: timeout de lectura por etapa (30, 10, 60, 30)
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+
+import httpx
+
+
+_STAGE_DEFAULTS = {
+    "kb_search": ("MCP_SEARCH_TIMEOUT", 30.0),
+    "kb_fallback": ("MCP_FALLBACK_TIMEOUT", 10.0),
+    "llm_generate": ("LLM_GENERATE_TIMEOUT", 60.0),
+    "llm_rerank": ("LLM_RERANK_TIMEOUT", 30.0),
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_lock = threading.Lock()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30")),
+    )
+
+
+def stage_timeout(stage: str) -> httpx.Timeout:
+    """Timeout de una etapa del pipeline (kb_search, kb_fallback, llm_generate, llm_rerank)."""
+    env_name, default = _STAGE_DEFAULTS.get(stage, ("", 30.0))
+    read = float(os.getenv(env_name, str(default))) if env_name else default
+    return httpx.Timeout(read, connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")))
+
+
+def get_async_client(name: str, base_url: str | None = None) -> httpx.AsyncClient:
+    """Retorna el cliente compartido `name`, creándolo la primera vez.
+
+    Args:
+        name: Destino lógico ("mcp", "llm", ...); un pool por nombre
+        base_url: URL base opcional (p.ej. MCP_SERVER_URL)
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        with _lock:
+            client = _clients.get(name)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    base_url=base_url or "",
+                    limits=_pool_limits(),
+                    timeout=stage_timeout(""),
+                )
+                _clients[name] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    """Cierra todos los pools (llamar en el shutdown de la app)."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,89 @@
+"""Parser incremental de JSON para respuestas del LLM en streaming.
+
+El LLM emite el diagnóstico como un único objeto JSON token a token. Para
+mostrar resultados antes de que termine, `JSONArrayItemStream` recibe los
+fragmentos de texto a medida que llegan y devuelve cada elemento completo del
+arreglo indicado (p. ej. `fallas_probables`) en cuanto se cierra su `}`.
+
+Solo mira el arreglo bajo la clave de primer nivel pedida; el resto del
+objeto se ignora (la respuesta completa se parsea al final como siempre).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import json
+
+
+class JSONArrayItemStream:
+    """Extrae los objetos de `obj[key]` de un JSON que llega por fragmentos."""
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self._buffer: List[str] = []
+        self._pos = 0  # caracteres ya procesados
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string: Optional[str] = None
+        self._array_depth = -1  # profundidad dentro del arreglo objetivo (-1: fuera)
+        self._item_start = -1
+        self._done = False
+        self.items_emitted = 0
+
+    @property
+    def done(self) -> bool:
+        """True cuando el arreglo objetivo ya se cerró."""
+        return self._done
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Procesa un fragmento y retorna los elementos completados en él."""
+        if not chunk or self._done:
+            return []
+        self._buffer.append(chunk)
+        text = "".join(self._buffer)
+        self._buffer = [text]
+        completed: List[Dict[str, Any]] = []
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1 : i]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "[" and self._depth == 2 and self._array_depth < 0 and self._last_string == self.key:
+                    self._array_depth = self._depth
+                elif ch == "{" and self._array_depth > 0 and self._depth == self._array_depth + 1:
+                    self._item_start = i
+            elif ch in "}]":
+                if ch == "}" and self._item_start >= 0 and self._depth == self._array_depth + 1:
+                    try:
+                        item = json.loads(text[self._item_start : i + 1])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict):
+                        completed.append(item)
+                        self.items_emitted += 1
+                    self._item_start = -1
+                elif ch == "]" and self._depth == self._array_depth:
+                    self._array_depth = -1
+                    self._done = True
+                self._depth -= 1
+            elif ch == "," and self._depth == 1:
+                self._last_string = None
+
+        self._pos = len(text)
+        return completed
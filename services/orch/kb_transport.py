@@ -0,0 +1,118 @@
+"""Transporte entre el pipeline de predicción y la KB.
+
+- `http` (default): llama a los endpoints `/tools/kb_search_*` del servidor
+  MCP, como siempre.
+- `inprocess`: llama directo a `services.kb.demo_kb` cuando la API y la KB
+  corren en el mismo proceso/contenedor, sin serializar a JSON ni pasar por
+  HTTP. Requiere que la API tenga acceso a `CHROMA_PATH`.
+
+Ambos retornan la misma forma (lista de hits como dicts, `KBHits`), así que el
+resto del pipeline no cambia; la lista lleva además la generación de la KB con
+la que se respondió la búsqueda (la usa el cache de re-ranking sin otro hop).
+`aembed` expone los embeddings de queries de la KB junto a su generación (lo
+usa el cache semántico de respuestas). Se elige con `KB_TRANSPORT`.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+
+import requests
+
+from services.orch.http_pool import get_async_client, stage_timeout
+
+
+TRANSPORTS = ("http", "inprocess")
+
+_SYNC_TIMEOUTS = {"kb_search": 30, "kb_fallback": 10}
+
+
+class KBHits(list):
+    """Lista de hits con la generación de la KB que los produjo (None si el MCP no la informa)."""
+
+    def __init__(self, hits: Any = (), kb_generation: Optional[int] = None) -> None:
+        super().__init__(hits)
+        self.kb_generation = kb_generation
+
+
+def _hits_from_response(res: Any) -> KBHits:
+    """Extrae los hits; los endpoints del MCP reportan fallas como 200 + "error"."""
+    print(f"🔍 Status KB: {res.status_code}")
+    res.raise_for_status()
+    body = res.json()
+    if body.get("error"):
+        raise RuntimeError(f"MCP: {body['error']}")
+    return KBHits(body.get("hits", []), body.get("kb_generation"))
+
+
+class HttpKBTransport:
+    """Búsquedas contra el servidor MCP por HTTP."""
+
+    name = "http"
+
+    def __init__(self, mcp_url: str) -> None:
+        self.mcp_url = mcp_url
+
+    def search(self, endpoint: str, payload: Dict[str, Any], stage: str = "kb_search") -> List[Dict[str, Any]]:
+        res = requests.post(
+            f"{self.mcp_url}/tools/{endpoint}", json=payload, timeout=_SYNC_TIMEOUTS.get(stage, 30)
+        )
+        return _hits_from_response(res)
+
+    async def asearch(self, endpoint: str, payload: Dict[str, Any], stage: str = "kb_search") -> List[Dict[str, Any]]:
+        client = get_async_client("mcp", base_url=self.mcp_url)
+        res = await client.post(f"/tools/{endpoint}", json=payload, timeout=stage_timeout(stage))
+        return _hits_from_response(res)
+
+    async def aembed(self, texts: List[str]) -> Dict[str, Any]:
+        client = get_async_client("mcp", base_url=self.mcp_url)
+        res = await client.post("/tools/kb_embed", json={"texts": texts}, timeout=stage_timeout("kb_search"))
+        res.raise_for_status()
+        body = res.json()
+        if body.get("error"):
+            raise RuntimeError(f"MCP: {body['error']}")
+        return body
+
+
+class InProcessKBTransport:
+    """Búsquedas llamando directo a `services.kb.demo_kb` (sin hop HTTP)."""
+
+    name = "inprocess"
+
+    def _call(self, endpoint: str, payload: Dict[str, Any]) -> KBHits:
+        from services.kb import demo_kb
+
+        functions = {
+            "kb_search": demo_kb.kb_search,
+            "kb_search_extended": demo_kb.kb_search_extended,
+            "kb_search_hybrid": demo_kb.kb_search_hybrid,
+        }
+        if endpoint not in functions:
+            raise ValueError(f"Endpoint de KB desconocido: {endpoint}")
+        # Generación leída antes de buscar, igual que el cache de resultados del MCP
+        generation = demo_kb.get_kb_generation()
+        return KBHits(functions[endpoint](**payload), generation)
+
+    def search(self, endpoint: str, payload: Dict[str, Any], stage: str = "kb_search") -> List[Dict[str, Any]]:
+        return self._call(endpoint, payload)
+
+    async def asearch(self, endpoint: str, payload: Dict[str, Any], stage: str = "kb_search") -> List[Dict[str, Any]]:
+        # Encode + Chroma son bloqueantes: se ejecutan fuera del event loop
+        return await asyncio.to_thread(self._call, endpoint, payload)
+
+    async def aembed(self, texts: List[str]) -> Dict[str, Any]:
+        from services.kb import demo_kb
+
+        return await asyncio.to_thread(demo_kb.embed_queries, texts)
+
+
+def get_kb_transport(mcp_url: str, transport: str | None = None) -> Any:
+    """Crea el transporte configurado (default: env KB_TRANSPORT o "http")."""
+    name = (transport or os.getenv("KB_TRANSPORT", "http")).lower()
+    if name == "http":
+        return HttpKBTransport(mcp_url)
+    if name in ("inprocess", "in-process", "local"):
+        return InProcessKBTransport()
+    raise ValueError(f"KB_TRANSPORT inválido: {name} (opciones: {', '.join(TRANSPORTS)})")
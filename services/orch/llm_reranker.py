@@ -9,9 +9,10 @@ Este módulo implementa un segundo paso de análisis donde el LLM:
 
 from __future__ import annotations
 from typing import Any, List, Dict
-import os
 import json
-import requests
+
+from services.llm.client import get_llm_client
+from services.orch.http_pool import stage_timeout
 
 
 def rerank_with_llm(
@@ -52,15 +53,64 @@ def rerank_with_llm(
     if not candidates:
         return []
     
-    # Configuración del LLM
-    llm_api_key = os.getenv("OPENAI_API_KEY")
-    llm_model = model_name or os.getenv("LLM_MODEL", "gpt-4o-mini")
-    llm_base_url = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1")
+    # Configuración del LLM (agente "rerank" del registro de clientes)
+    client = get_llm_client("rerank")
     
-    if not llm_api_key:
+    if not client.has_api_key:
         print("⚠️  OPENAI_API_KEY no configurado, retornando candidatos sin re-ranking")
         return candidates[:top_k]
     
+    system_prompt, user_prompt = _build_rerank_prompts(query, candidates, marca, modelo)
+
+    # Llamar al LLM
+    try:
+        print(f"🤖 Llamando LLM re-ranker ({model_name or client.model})...")
+        content = client.complete_json(system_prompt, user_prompt, json_mode=True, model=model_name)
+        return _apply_rankings(candidates, content, top_k)
+        
+    except Exception as e:
+        print(f"❌ Error en LLM re-ranker: {e}")
+        import traceback
+        traceback.print_exc()
+        return candidates[:top_k]
+
+
+async def arerank_with_llm(
+    query: str,
+    candidates: List[Dict[str, Any]],
+    model_name: str | None = None,
+    marca: str | None = None,
+    modelo: str | None = None,
+    top_k: int = 8
+) -> List[Dict[str, Any]]:
+    """Versión asíncrona de `rerank_with_llm` sobre el pool HTTP compartido `llm`."""
+    if not candidates:
+        return []
+    
+    client = get_llm_client("rerank")
+    if not client.has_api_key:
+        print("⚠️  OPENAI_API_KEY no configurado, retornando candidatos sin re-ranking")
+        return candidates[:top_k]
+    
+    system_prompt, user_prompt = _build_rerank_prompts(query, candidates, marca, modelo)
+    try:
+        print(f"🤖 Llamando LLM re-ranker ({model_name or client.model})...")
+        content = await client.acomplete_json(
+            system_prompt, user_prompt, timeout=stage_timeout("llm_rerank"), json_mode=True, model=model_name
+        )
+        return _apply_rankings(candidates, content, top_k)
+    except Exception as e:
+        print(f"❌ Error en LLM re-ranker: {e}")
+        return candidates[:top_k]
+
+
+def _build_rerank_prompts(
+    query: str,
+    candidates: List[Dict[str, Any]],
+    marca: str | None,
+    modelo: str | None,
+) -> tuple[str, str]:
+    """Prompts (system, user) con los 15 primeros candidatos resumidos."""
     # Construir contexto para el LLM
     context_info = f"Marca: {marca or 'N/A'}, Modelo: {modelo or 'N/A'}"
     
@@ -138,81 +188,48 @@ IMPORTANTE:
 
 Analiza cada documento y retorna el JSON con los rankings de relevancia."""
 
-    # Llamar al LLM
-    try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {llm_api_key}"
-        }
-        
-        payload = {
-            "model": llm_model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "temperature": 0.1,  # Muy bajo para respuestas determinísticas
-            "response_format": {"type": "json_object"}  # Forzar JSON
-        }
-        
-        print(f"🤖 Llamando LLM re-ranker ({llm_model})...")
-        response = requests.post(
-            f"{llm_base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            print(f"❌ Error en LLM re-ranker: {response.status_code}")
-            return candidates[:top_k]
-        
-        result = response.json()
-        llm_response = result["choices"][0]["message"]["content"]
-        
-        # Parsear respuesta del LLM
-        rankings_data = json.loads(llm_response)
-        rankings = rankings_data.get("rankings", [])
-        
-        print(f"✅ LLM re-ranker completado: {len(rankings)} documentos analizados")
-        
-        # Crear un mapa de rankings por ID
-        rankings_map = {r["id"]: r for r in rankings}
-        
-        # Enriquecer documentos originales con scores del LLM
-        enriched_candidates = []
-        for idx, candidate in enumerate(candidates[:15], 1):
-            ranking_info = rankings_map.get(idx, {
-                "relevance_score": 0,
-                "confidence": "Baja",
-                "explanation": "No analizado por el LLM"
-            })
-            
-            candidate["llm_relevance_score"] = ranking_info["relevance_score"]
-            candidate["llm_confidence"] = ranking_info["confidence"]
-            candidate["llm_explanation"] = ranking_info["explanation"]
-            enriched_candidates.append(candidate)
-        
-        # Ordenar por score del LLM
-        enriched_candidates.sort(
-            key=lambda x: x.get("llm_relevance_score", 0),
-            reverse=True
-        )
-        
-        # Log de top 3
-        print(f"🏆 Top 3 según LLM:")
-        for i, doc in enumerate(enriched_candidates[:3], 1):
-            doc_id = doc.get("doc_id", "N/A")[:50]
-            score = doc.get("llm_relevance_score", 0)
-            confidence = doc.get("llm_confidence", "N/A")
-            print(f"  {i}. {doc_id} - {score}% ({confidence})")
-        
-        return enriched_candidates[:top_k]
-        
-    except Exception as e:
-        print(f"❌ Error en LLM re-ranker: {e}")
-        import traceback
-        traceback.print_exc()
-        return candidates[:top_k]
+    return system_prompt, user_prompt
 
 
+def _apply_rankings(
+    candidates: List[Dict[str, Any]], llm_response: str, top_k: int
+) -> List[Dict[str, Any]]:
+    """Enriquece y ordena los candidatos con la respuesta del LLM."""
+    # Parsear respuesta del LLM
+    rankings_data = json.loads(llm_response)
+    rankings = rankings_data.get("rankings", [])
+
+    print(f"✅ LLM re-ranker completado: {len(rankings)} documentos analizados")
+
+    # Crear un mapa de rankings por ID
+    rankings_map = {r["id"]: r for r in rankings}
+
+    # Enriquecer documentos originales con scores del LLM
+    enriched_candidates = []
+    for idx, candidate in enumerate(candidates[:15], 1):
+        ranking_info = rankings_map.get(idx, {
+            "relevance_score": 0,
+            "confidence": "Baja",
+            "explanation": "No analizado por el LLM"
+        })
+
+        candidate["llm_relevance_score"] = ranking_info["relevance_score"]
+        candidate["llm_confidence"] = ranking_info["confidence"]
+        candidate["llm_explanation"] = ranking_info["explanation"]
+        enriched_candidates.append(candidate)
+
+    # Ordenar por score del LLM
+    enriched_candidates.sort(
+        key=lambda x: x.get("llm_relevance_score", 0),
+        reverse=True
+    )
+
+    # Log de top 3
+    print(f"🏆 Top 3 según LLM:")
+    for i, doc in enumerate(enriched_candidates[:3], 1):
+        doc_id = doc.get("doc_id", "N/A")[:50]
+        score = doc.get("llm_relevance_score", 0)
+        confidence = doc.get("llm_confidence", "N/A")
+        print(f"  {i}. {doc_id} - {score}% ({confidence})")
+
+    return enriched_candidates[:top_k]
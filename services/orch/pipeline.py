@@ -0,0 +1,269 @@
+"""Planificador de etapas del pipeline de predicción.
+
+Después de la recuperación hay dos etapas: el diagnóstico del LLM
+(`agenerate_prediction`) y el re-ranking de los hits para `contextos`
+(`services.orch.rerankers`: cross-encoder local por defecto, LLM opt-in con
+`RERANKER=llm`). El orden se elige con `PREDICT_PIPELINE_MODE`:
+
+- `concurrent` (default): diagnóstico y re-ranking corren en paralelo sobre
+  el mismo conjunto de hits; la latencia es la del más lento de los dos.
+- `rerank_first`: primero se re-rankea y el diagnóstico se genera sobre los
+  `RERANK_FIRST_TOP_N` mejores hits (prompt más corto y más enfocado).
+- `sequential`: diagnóstico y luego re-ranking (comportamiento anterior).
+
+Cada modo reporta sus tiempos por etapa en `signals.timings_ms`. El
+re-ranking pasa por el cache de `services.orch.rerank_cache`: si la misma
+query ya se re-rankeó con los mismos candidatos, no se vuelve a llamar al
+re-ranker (`signals.rerank_cache_hit`).
+
+`stream_prediction_pipeline` es la variante para SSE: siempre concurrente,
+emite eventos a medida que cada etapa produce algo (hits, fallas del
+diagnóstico mientras el LLM escribe, hits re-rankeados).
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+from services.orch.kb_transport import get_kb_transport
+from services.orch.rerank_cache import get_rerank_cache
+from services.orch.rerankers import get_reranker
+from services.orch.rag import (
+    agenerate_prediction,
+    aretrieve_for_prediction,
+    astream_prediction,
+    attach_retrieval,
+)
+
+
+PIPELINE_MODES = ("concurrent", "rerank_first", "sequential")
+
+
+async def _timed(timings: Dict[str, float], stage: str, awaitable: Awaitable[Any]) -> Any:
+    """Ejecuta una etapa registrando su duración en ms."""
+    t0 = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+async def _retrieve(
+    mcp_url: str,
+    descripcion: str,
+    equipo: Dict[str, Any],
+    top_k: int,
+    transport: Any,
+    timings: Dict[str, float],
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Recuperación única del request.
+
+    Returns:
+        (retrieval, rerank_candidates): la salida de `aretrieve_for_prediction`
+        y los hits a re-rankear para `contextos`
+    """
+    retrieval = await _timed(
+        timings, "retrieval",
+        aretrieve_for_prediction(mcp_url, descripcion, equipo, top_k, transport),
+    )
+    stats = retrieval["stats"]
+
+    # Si la recuperación falló, una búsqueda directa con la descripción original
+    # alimenta al menos los `contextos` (el diagnóstico ya cae a heurística)
+    rerank_candidates = retrieval["hits"]
+    if stats.get("failed"):
+        print(f"⚠️  Recuperación fallida, haciendo búsqueda directa de contextos...")
+        stats["kb_searches"] += 1
+        try:
+            rerank_candidates = await _timed(
+                timings, "retrieval_retry",
+                transport.asearch(
+                    "kb_search_hybrid",
+                    {
+                        "query": descripcion,
+                        "top_k": top_k,
+                        "semantic_weight": 0.3,
+                        "keyword_weight": 0.7,
+                        "context_chars": 2000,
+                    },
+                ),
+            )
+            stats["kb_generation"] = getattr(rerank_candidates, "kb_generation", None)
+            print(f"✅ Búsqueda directa: {len(rerank_candidates)} hits encontrados")
+        except Exception as e:
+            print(f"❌ Error en búsqueda directa de contextos: {e}")
+            rerank_candidates = []
+    return retrieval, rerank_candidates
+
+
+async def run_prediction_pipeline(
+    mcp_url: str,
+    descripcion: str,
+    equipo: Dict[str, Any],
+    top_k: int = 10,
+    transport: Any = None,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Recuperación + diagnóstico + re-ranking según el modo configurado.
+
+    Args:
+        mcp_url: URL del servidor MCP
+        descripcion: Descripción del problema
+        equipo: Información del equipo (marca, modelo, ...)
+        top_k: Hits a recuperar y a conservar tras el re-ranking
+        transport: Transporte a la KB (ver `services.orch.kb_transport`)
+        mode: concurrent | rerank_first | sequential (default: env PREDICT_PIPELINE_MODE)
+
+    Returns:
+        Respuesta de `apredict_with_llm` más `_ranked_hits` (hits ordenados
+        por el re-ranker para `contextos`) y `signals.pipeline_mode` /
+        `signals.timings_ms`
+    """
+    mode = (mode or os.getenv("PREDICT_PIPELINE_MODE", "concurrent")).lower()
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"PREDICT_PIPELINE_MODE inválido: {mode} (opciones: {', '.join(PIPELINE_MODES)})")
+
+    transport = transport or get_kb_transport(mcp_url)
+    reranker = get_reranker()
+    rerank_cache = get_rerank_cache()
+    timings: Dict[str, float] = {}
+    t_start = time.perf_counter()
+    marca = (equipo or {}).get("marca") or (equipo or {}).get("brand")
+    modelo = (equipo or {}).get("modelo") or (equipo or {}).get("model")
+
+    retrieval, rerank_candidates = await _retrieve(mcp_url, descripcion, equipo, top_k, transport, timings)
+    hits: List[Dict[str, Any]] = retrieval["hits"]
+    stats = retrieval["stats"]
+    rerank_cache_hit = False
+
+    async def _rerank(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        nonlocal rerank_cache_hit
+        if candidates:
+            print(f"🤖 Aplicando re-ranker {reranker.name} ({len(candidates)} candidatos, modo {mode})")
+        ranked, rerank_cache_hit = await _timed(
+            timings, "rerank",
+            rerank_cache.arerank(
+                reranker, descripcion, candidates, stats["kb_generation"], marca=marca, modelo=modelo, top_k=top_k
+            ),
+        )
+        return ranked
+
+    def _generate(generation_hits: List[Dict[str, Any]]) -> Awaitable[Dict[str, Any]]:
+        return _timed(
+            timings, "generation",
+            agenerate_prediction(descripcion, equipo, retrieval["query"], generation_hits),
+        )
+
+    if mode == "concurrent":
+        data, ranked_hits = await asyncio.gather(_generate(hits), _rerank(rerank_candidates))
+    elif mode == "rerank_first":
+        ranked_hits = await _rerank(rerank_candidates)
+        top_n = int(os.getenv("RERANK_FIRST_TOP_N", "5"))
+        data = await _generate(ranked_hits[:top_n] if not stats.get("failed") else hits)
+    else:
+        data = await _generate(hits)
+        ranked_hits = await _rerank(rerank_candidates)
+
+    timings["total"] = round((time.perf_counter() - t_start) * 1000, 1)
+    data = attach_retrieval(data, hits, stats)
+    data["signals"]["pipeline_mode"] = mode
+    data["signals"]["reranker"] = reranker.name
+    data["signals"]["rerank_cache_hit"] = rerank_cache_hit
+    data["signals"]["timings_ms"] = timings
+    data["_ranked_hits"] = ranked_hits
+    return data
+
+
+async def stream_prediction_pipeline(
+    mcp_url: str,
+    descripcion: str,
+    equipo: Dict[str, Any],
+    top_k: int = 10,
+    transport: Any = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Variante en streaming de `run_prediction_pipeline` (modo concurrente).
+
+    Emite, en orden de disponibilidad:
+    - ("retrieval", {"hits", "kb_searches"}) apenas termina la búsqueda
+    - ("falla", item) por cada falla que el LLM termina de escribir
+    - ("ranked_hits", hits) cuando termina el re-ranking
+    - ("prediction", data) al final, con la misma forma que
+      `run_prediction_pipeline` (`signals.timings_ms` incluye `first_falla`)
+    """
+    transport = transport or get_kb_transport(mcp_url)
+    reranker = get_reranker()
+    rerank_cache = get_rerank_cache()
+    timings: Dict[str, float] = {}
+    t_start = time.perf_counter()
+    marca = (equipo or {}).get("marca") or (equipo or {}).get("brand")
+    modelo = (equipo or {}).get("modelo") or (equipo or {}).get("model")
+
+    retrieval, rerank_candidates = await _retrieve(mcp_url, descripcion, equipo, top_k, transport, timings)
+    hits: List[Dict[str, Any]] = retrieval["hits"]
+    stats = retrieval["stats"]
+    rerank_cache_hit = False
+    yield "retrieval", {"hits": hits, "kb_searches": stats["kb_searches"]}
+
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def _generation() -> None:
+        t0 = time.perf_counter()
+        try:
+            async for event, payload in astream_prediction(descripcion, equipo, retrieval["query"], hits):
+                if event == "falla" and "first_falla" not in timings:
+                    timings["first_falla"] = round((time.perf_counter() - t_start) * 1000, 1)
+                await queue.put((event, payload))
+        finally:
+            timings["generation"] = round((time.perf_counter() - t0) * 1000, 1)
+            await queue.put(done)
+
+    async def _rerank() -> None:
+        nonlocal rerank_cache_hit
+        try:
+            ranked, rerank_cache_hit = await _timed(
+                timings, "rerank",
+                rerank_cache.arerank(
+                    reranker, descripcion, rerank_candidates, stats["kb_generation"],
+                    marca=marca, modelo=modelo, top_k=top_k,
+                ),
+            )
+            await queue.put(("ranked_hits", ranked))
+        finally:
+            await queue.put(done)
+
+    tasks = [asyncio.create_task(_generation()), asyncio.create_task(_rerank())]
+    data: Dict[str, Any] = {}
+    ranked_hits: List[Dict[str, Any]] = []
+    try:
+        pending = len(tasks)
+        while pending:
+            item = await queue.get()
+            if item is done:
+                pending -= 1
+                continue
+            event, payload = item
+            if event == "prediction":
+                data = payload
+                continue
+            if event == "ranked_hits":
+                ranked_hits = payload
+            yield event, payload
+        # Propaga errores inesperados de las etapas
+        await asyncio.gather(*tasks)
+    finally:
+        # Cliente desconectado a mitad del stream: no dejar llamadas al LLM colgando
+        for task in tasks:
+            task.cancel()
+
+    timings["total"] = round((time.perf_counter() - t_start) * 1000, 1)
+    data = attach_retrieval(data, hits, stats)
+    data["signals"]["pipeline_mode"] = "stream"
+    data["signals"]["reranker"] = reranker.name
+    data["signals"]["rerank_cache_hit"] = rerank_cache_hit
+    data["signals"]["timings_ms"] = timings
+    data["_ranked_hits"] = ranked_hits
+    yield "prediction", data
@@ -9,48 +9,17 @@ NO usa diccionarios estáticos ni patrones predefinidos. Todo se aprende del con
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
-import requests
-
-from services.llm.client import LLMClient
+from services.llm.client import get_llm_client
+from services.orch.context_builder import assemble_context, build_context_from_hits
+from services.orch.http_pool import stage_timeout
+from services.orch.json_stream import JSONArrayItemStream
+from services.orch.kb_transport import get_kb_transport
 from services.predictor.heuristic import infer_from_hits, _analyze_failure_context
 
 
-def build_context_from_hits(hits: List[Dict[str, Any]]) -> str:
-    """Construye contexto textual enriquecido desde los hits de KB.
-    
-    Usa el campo "context" (contexto ampliado) cuando está disponible,
-    con fallback a "snippet" para compatibilidad con versiones anteriores.
-    
-    Args:
-        hits: Resultados de búsqueda semántica en KB
-        
-    Returns:
-        Contexto formateado con fuentes citables
-    """
-    lines: List[str] = []
-    for h in hits:
-        doc_id = h.get("doc_id", "unknown")
-        # Preferir "context" (ampliado) sobre "snippet" (limitado a 500 chars)
-        text = h.get("context") or h.get("snippet", "")
-        metadata = h.get("metadata", {})
-        
-        # Incluir metadata relevante si está disponible
-        context_line = f"[source:{doc_id}]"
-        if metadata.get("brand"):
-            context_line += f" [marca:{metadata['brand']}]"
-        if metadata.get("model"):
-            context_line += f" [modelo:{metadata['model']}]"
-        if metadata.get("page"):
-            context_line += f" [página:{metadata['page']}]"
-        context_line += f" {text}"
-        
-        lines.append(context_line)
-    
-    return "\n".join(lines)
-
-
 def _parse_json_safely(raw: str) -> Dict[str, Any]:
     """Parse JSON de respuesta del LLM con manejo robusto de errores."""
     try:
@@ -72,23 +41,48 @@ def _parse_json_safely(raw: str) -> Dict[str, Any]:
     }
 
 
-def predict_with_llm(mcp_url: str, descripcion: str, equipo: Dict[str, Any], top_k: int = 5) -> Dict[str, Any]:
-    """Genera predicción usando LLM con contexto de KB.
-    
-    Este es el FLUJO PRINCIPAL del sistema:
-    1. Recupera contexto relevante de KB usando embeddings semánticos
-    2. Construye prompt enriquecido con ese contexto
-    3. El LLM lee el contenido REAL de los manuales y genera respuesta
-    4. NO usa diccionarios estáticos - todo viene del contenido
-    
-    Args:
-        mcp_url: URL del servicio MCP con KB
-        descripcion: Descripción del problema reportado
-        equipo: Información del equipo (marca, modelo, etc)
-        top_k: Número de documentos a recuperar de KB
-        
+_DIAGNOSIS_SYSTEM_PROMPT = (
+    "Eres un asistente técnico experto que analiza documentación de equipos industriales. "
+    "Tu trabajo es leer el CONTEXTO REAL proporcionado (extractos de manuales) y generar diagnósticos precisos.\n\n"
+    "Responde SOLO con JSON válido (sin markdown ni explicaciones), con esta estructura EXACTA:\n"
+    "{\n"
+    '  "fallas_probables": [\n'
+    "    {\n"
+    '      "falla": "descripción de la falla detectada",\n'
+    '      "confidence": 0.85,\n'
+    '      "rationale": "explicación citando [source:doc_id]",\n'
+    '      "repuestos_sugeridos": ["repuesto1", "repuesto2"],\n'
+    '      "herramientas_sugeridas": ["herramienta1", "herramienta2"],\n'
+    "      \"pasos\": [\n"
+    '        {"orden": 1, "descripcion": "paso", "tipo": "seguridad"},\n'
+    '        {"orden": 2, "descripcion": "paso", "tipo": "diagnostico"},\n'
+    '        {"orden": 3, "descripcion": "paso", "tipo": "reparacion"}\n'
+    "      ]\n"
+    "    }\n"
+    "  ],\n"
+    '  "feedback_coherencia": "evaluación de la coherencia del problema reportado"\n'
+    "}\n\n"
+    "REGLAS CRÍTICAS:\n"
+    "1. USA ÚNICAMENTE información del CONTEXTO proporcionado. NO inventes datos.\n"
+    "2. Cada 'rationale' DEBE citar fuentes específicas como [source:doc_id].\n"
+    "3. Los 'repuestos_sugeridos' y 'herramientas_sugeridas' deben estar mencionados o derivables del contexto.\n"
+    "4. Los 'pasos' DEBEN incluir:\n"
+    "   - INICIO: 3 pasos de seguridad (desconexión eléctrica, EPP, verificación de presión)\n"
+    "   - MEDIO: 3-5 pasos de diagnóstico específicos del problema\n"
+    "   - MEDIO: 2-4 pasos de reparación si aplica\n"
+    "   - FIN: 1 paso de seguridad final (verificación y prueba supervisada)\n"
+    "5. 'confidence' debe estar en [0,1] con 2 decimales.\n"
+    "6. Genera 1-3 fallas probables según la evidencia disponible.\n"
+    "7. Si el contexto es limitado, usa confidencias bajas (0.3-0.5) y sé explícito en el rationale.\n"
+    "8. Responde SOLO el JSON, sin explicaciones adicionales ni markdown."
+)
+
+
+def _build_search_query(descripcion: str, equipo: Dict[str, Any]) -> Dict[str, Any]:
+    """Deriva marca/modelo y la query de búsqueda a partir del reporte.
+
     Returns:
-        Diccionario con predicción estructurada basada en contenido real
+        Dict con brand, model, model_normalized y query_enriched
     """
     # 1. RECUPERACIÓN: Búsqueda HÍBRIDA OPTIMIZADA para iCombi Classic
     brand = (equipo or {}).get("marca") or (equipo or {}).get("brand")
@@ -106,7 +100,6 @@ def predict_with_llm(mcp_url: str, descripcion: str, equipo: Dict[str, Any], top
     # OPTIMIZACIÓN: Para búsqueda híbrida con códigos de error,
     # NO diluir la query con marca/modelo ya que reduce keyword matching
     # Los códigos de error son más específicos que la marca
-    import re
     tiene_codigo_error = bool(re.search(r'\b(service|servicio|error|código|s_)\s*\d+', descripcion.lower()))
     
     if tiene_codigo_error:
@@ -116,172 +109,232 @@ def predict_with_llm(mcp_url: str, descripcion: str, equipo: Dict[str, Any], top
         # Query enriquecida para búsqueda semántica general
         query_enriched = f"{brand or ''} {model or ''} {descripcion}".strip()
     
-    # FILTRADO POR METADATA: Si tenemos modelo específico, lo usamos para RERANKING
-    # No usamos where filter porque ChromaDB tiene limitaciones y querríamos más resultados
-    # En su lugar, haremos post-processing para dar boost a docs del modelo correcto
-    model_boost = 1.5 if model_normalized else 1.0  # 50% boost para modelo correcto
-    print(f"🎯 Modelo detectado: {model_normalized or 'N/A'}, boost={model_boost}x")
+    return {
+        "brand": brand,
+        "model": model,
+        "model_normalized": model_normalized,
+        "query_enriched": query_enriched,
+    }
 
+
+def _hybrid_payload(query_enriched: str, top_k: int) -> Dict[str, Any]:
     # Usar kb_search_hybrid: combina búsqueda semántica + keyword matching
     # Esto mejora SIGNIFICATIVAMENTE la relevancia para códigos de error técnicos
-    payload = {
+    return {
         "query": query_enriched, 
         "top_k": top_k * 2,  # Obtener más resultados para post-filtering
         "semantic_weight": 0.3,  # Reducimos peso semántico para códigos
         "keyword_weight": 0.7,   # Aumentamos peso keywords (detecta "service 25", "error 42", etc.)
         "context_chars": 2000,   # Contexto ampliado
     }
-    
-    print(f"🔍 Buscando en KB HÍBRIDA: query='{query_enriched}' top_k={top_k}")
-    print(f"🔍 MCP URL: {mcp_url}/tools/kb_search_hybrid")
-    print(f"🔍 Pesos: semantic=0.4, keyword=0.6")
-    
+
+
+def _fallback_payload(query_enriched: str, top_k: int) -> Dict[str, Any]:
+    return {
+        "query": query_enriched,
+        "top_k": top_k,
+        "context_chars": 2000,
+        "include_full_text": False
+    }
+
+
+def _log_hits(hits: List[Dict[str, Any]]) -> None:
+    print(f"🔍 Hits encontrados: {len(hits)}")
+    if hits:
+        first_hit = hits[0]
+        context_len = len(first_hit.get("context", ""))
+        print(f"🔍 Primer hit: {first_hit.get('doc_id', 'N/A')} - score: {first_hit.get('score', 0):.3f} - context_len: {context_len}")
+        # Mostrar scores híbridos si están disponibles
+        if 'semantic_score' in first_hit and 'keyword_score' in first_hit:
+            print(f"    └─ semantic: {first_hit['semantic_score']:.3f}, keyword: {first_hit['keyword_score']:.3f}")
+        if 'error_codes_found' in first_hit:
+            print(f"    └─ códigos detectados: {first_hit['error_codes_found']}")
+
+
+def new_retrieval_stats() -> Dict[str, Any]:
+    """Contadores de recuperación de un request: búsquedas ejecutadas, si fallaron todas
+    y la generación de la KB informada con los hits (None si no se conoce)."""
+    return {"kb_searches": 0, "failed": False, "kb_generation": None}
+
+
+def _retrieve_hits(
+    transport: Any, query_enriched: str, top_k: int, stats: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Búsqueda híbrida en la KB (bloqueante) con fallback a kb_search_extended."""
+    print(f"🔍 Buscando en KB HÍBRIDA ({transport.name}): query='{query_enriched}' top_k={top_k}")
+    try:
+        stats["kb_searches"] += 1
+        hits = transport.search("kb_search_hybrid", _hybrid_payload(query_enriched, top_k))
+        stats["kb_generation"] = getattr(hits, "kb_generation", None)
+        _log_hits(hits)
+        return hits
+    except Exception as e:
+        print(f"❌ Error en búsqueda KB híbrida: {e}")
+    # Fallback a kb_search_extended si híbrida falla
+    try:
+        print(f"🔄 Fallback a kb_search_extended...")
+        stats["kb_searches"] += 1
+        hits = transport.search("kb_search_extended", _fallback_payload(query_enriched, top_k), stage="kb_fallback")
+        stats["kb_generation"] = getattr(hits, "kb_generation", None)
+        print(f"🔍 Hits con fallback: {len(hits)}")
+        return hits
+    except Exception as e2:
+        print(f"❌ Error en fallback: {e2}")
+        stats["failed"] = True
+        return []
+
+
+async def _aretrieve_hits(
+    transport: Any, query_enriched: str, top_k: int, stats: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Versión asíncrona de `_retrieve_hits`."""
+    print(f"🔍 Buscando en KB HÍBRIDA ({transport.name}): query='{query_enriched}' top_k={top_k}")
     try:
-        res = requests.post(f"{mcp_url}/tools/kb_search_hybrid", json=payload, timeout=30)
-        print(f"🔍 Status KB: {res.status_code}")
-        hits = res.json().get("hits", [])
-        print(f"🔍 Hits encontrados: {len(hits)}")
-        if hits:
-            first_hit = hits[0]
-            context_len = len(first_hit.get("context", ""))
-            print(f"🔍 Primer hit: {first_hit.get('doc_id', 'N/A')} - score: {first_hit.get('score', 0):.3f} - context_len: {context_len}")
-            # Mostrar scores híbridos si están disponibles
-            if 'semantic_score' in first_hit and 'keyword_score' in first_hit:
-                print(f"    └─ semantic: {first_hit['semantic_score']:.3f}, keyword: {first_hit['keyword_score']:.3f}")
-            if 'error_codes_found' in first_hit:
-                print(f"    └─ códigos detectados: {first_hit['error_codes_found']}")
+        stats["kb_searches"] += 1
+        hits = await transport.asearch("kb_search_hybrid", _hybrid_payload(query_enriched, top_k))
+        stats["kb_generation"] = getattr(hits, "kb_generation", None)
+        _log_hits(hits)
+        return hits
     except Exception as e:
         print(f"❌ Error en búsqueda KB híbrida: {e}")
-        # Fallback a kb_search_extended si híbrida falla
-        try:
-            print(f"🔄 Fallback a kb_search_extended...")
-            payload_fallback = {
-                "query": query_enriched,
-                "top_k": top_k,
-                "context_chars": 2000,
-                "include_full_text": False
-            }
-            res = requests.post(f"{mcp_url}/tools/kb_search_extended", json=payload_fallback, timeout=10)
-            hits = res.json().get("hits", [])
-            print(f"🔍 Hits con fallback: {len(hits)}")
-        except Exception as e2:
-            print(f"❌ Error en fallback: {e2}")
-            hits = []
+    try:
+        print(f"🔄 Fallback a kb_search_extended...")
+        stats["kb_searches"] += 1
+        hits = await transport.asearch(
+            "kb_search_extended", _fallback_payload(query_enriched, top_k), stage="kb_fallback"
+        )
+        stats["kb_generation"] = getattr(hits, "kb_generation", None)
+        print(f"🔍 Hits con fallback: {len(hits)}")
+        return hits
+    except Exception as e2:
+        print(f"❌ Error en fallback: {e2}")
+        stats["failed"] = True
+        return []
+
+
+def attach_retrieval(
+    data: Dict[str, Any], hits: List[Dict[str, Any]], stats: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Adjunta los hits y contadores de recuperación a cualquier respuesta.
+
+    El endpoint reutiliza `_raw_hits` para re-ranking y `contextos` sin volver
+    a buscar; `_retrieval` indica si la recuperación falló.
+    """
+    data.setdefault("signals", {})["kb_searches"] = stats["kb_searches"]
+    data["_raw_hits"] = hits
+    data["_retrieval"] = stats
+    return data
+
+
+def _apply_model_boost(
+    hits: List[Dict[str, Any]], model_normalized: Optional[str], top_k: int
+) -> List[Dict[str, Any]]:
+    """POST-PROCESSING: boost a documentos del modelo correcto y recorte a top_k."""
+    # FILTRADO POR METADATA: Si tenemos modelo específico, lo usamos para RERANKING
+    # No usamos where filter porque ChromaDB tiene limitaciones y querríamos más resultados
+    # En su lugar, haremos post-processing para dar boost a docs del modelo correcto
+    model_boost = 1.5 if model_normalized else 1.0  # 50% boost para modelo correcto
+    if not (hits and model_normalized):
+        return hits
+    print(f"🎯 Aplicando reranking para modelo: {model_normalized}")
     
-    # POST-PROCESSING: Reranking para dar boost a documentos del modelo correcto
-    if hits and model_normalized:
-        print(f"🎯 Aplicando reranking para modelo: {model_normalized}")
-        
-        # Normalizar variantes del modelo para matching flexible
-        model_variants = [
-            model_normalized.lower().replace(" ", ""),  # "icombiclassic"
-            model_normalized.lower().replace(" ", "_"),  # "icombi_classic"
-            model_normalized.lower(),  # "icombi classic"
-            model_normalized.replace(" ", ""),  # "iCombiClassic"
-        ]
+    # Normalizar variantes del modelo para matching flexible
+    model_variants = [
+        model_normalized.lower().replace(" ", ""),  # "icombiclassic"
+        model_normalized.lower().replace(" ", "_"),  # "icombi_classic"
+        model_normalized.lower(),  # "icombi classic"
+        model_normalized.replace(" ", ""),  # "iCombiClassic"
+    ]
+    
+    reranked_hits = []
+    for hit in hits:
+        doc_id = hit.get("doc_id", "").lower()
+        metadata = hit.get("metadata", {})
+        model_meta = str(metadata.get("model", "")).lower()
+        source_meta = str(metadata.get("source", "")).lower()
         
-        reranked_hits = []
-        for hit in hits:
-            doc_id = hit.get("doc_id", "").lower()
-            metadata = hit.get("metadata", {})
-            model_meta = str(metadata.get("model", "")).lower()
-            source_meta = str(metadata.get("source", "")).lower()
-            
-            # Verificar si el documento es del modelo correcto
-            is_correct_model = any(
-                variant in doc_id or variant in model_meta or variant in source_meta
-                for variant in model_variants
-            )
-            
-            # Aplicar boost al score
-            original_score = hit.get("score", 0)
-            if is_correct_model:
-                hit["score"] = original_score * model_boost
-                hit["model_boosted"] = True
-                print(f"  ✅ Boost aplicado a: {hit.get('doc_id')[:60]} (score: {original_score:.3f} → {hit['score']:.3f})")
-            
-            reranked_hits.append(hit)
+        # Verificar si el documento es del modelo correcto
+        is_correct_model = any(
+            variant in doc_id or variant in model_meta or variant in source_meta
+            for variant in model_variants
+        )
         
-        # Reordenar por score (ahora con boost)
-        hits = sorted(reranked_hits, key=lambda x: x.get("score", 0), reverse=True)
-        print(f"🔄 Top 3 después de reranking:")
-        for i, hit in enumerate(hits[:3], 1):
-            boosted = "⭐" if hit.get("model_boosted") else "  "
-            print(f"  {boosted}{i}. {hit.get('doc_id')[:60]} (score: {hit.get('score', 0):.3f})")
+        # Aplicar boost al score
+        original_score = hit.get("score", 0)
+        if is_correct_model:
+            hit["score"] = original_score * model_boost
+            hit["model_boosted"] = True
+            print(f"  ✅ Boost aplicado a: {hit.get('doc_id')[:60]} (score: {original_score:.3f} → {hit['score']:.3f})")
         
-        # Limitar a top_k original después de reranking
-        hits = hits[:top_k]
+        reranked_hits.append(hit)
     
-    context = build_context_from_hits(hits)
-    num_hits = len(hits)
-    context_length = len(context)
-    low_evidence = num_hits == 0 or (num_hits < 2 and context_length < 200)
-    
-    # 2. FALLBACK: Si no hay suficiente contexto, usar heurística mínima
-    if low_evidence:
-        failure_context = _analyze_failure_context(hits, descripcion)
-        fallback_predictions = infer_from_hits(hits, descripcion)
-        
-        return {
-            "fallas_probables": fallback_predictions,
-            "feedback_coherencia": "Análisis heurístico debido a evidencia limitada en KB. Se recomienda actualizar KB con más documentación.",
-            "fuentes": [h.get("doc_id") for h in hits],
-            "signals": {
-                "kb_hits": num_hits,
-                "context_length": context_length,
-                "low_evidence": True,
-                "fallback_used": True,
-                "llm_used": False
-            },
-            "quality_metrics": {
-                "context_relevance": 0.0,
-                "source_diversity": 0.0,
-                "prediction_confidence": 0.3
-            }
-        }
+    # Reordenar por score (ahora con boost)
+    hits = sorted(reranked_hits, key=lambda x: x.get("score", 0), reverse=True)
+    print(f"🔄 Top 3 después de reranking:")
+    for i, hit in enumerate(hits[:3], 1):
+        boosted = "⭐" if hit.get("model_boosted") else "  "
+        print(f"  {boosted}{i}. {hit.get('doc_id')[:60]} (score: {hit.get('score', 0):.3f})")
     
-    # 3. GENERACIÓN: LLM analiza el contenido REAL de los manuales
-    system_prompt = (
-        "Eres un asistente técnico experto que analiza documentación de equipos industriales. "
-        "Tu trabajo es leer el CONTEXTO REAL proporcionado (extractos de manuales) y generar diagnósticos precisos.\n\n"
-        "Responde SOLO con JSON válido (sin markdown ni explicaciones), con esta estructura EXACTA:\n"
-        "{\n"
-        '  "fallas_probables": [\n'
-        "    {\n"
-        '      "falla": "descripción de la falla detectada",\n'
-        '      "confidence": 0.85,\n'
-        '      "rationale": "explicación citando [source:doc_id]",\n'
-        '      "repuestos_sugeridos": ["repuesto1", "repuesto2"],\n'
-        '      "herramientas_sugeridas": ["herramienta1", "herramienta2"],\n'
-        "      \"pasos\": [\n"
-        '        {"orden": 1, "descripcion": "paso", "tipo": "seguridad"},\n'
-        '        {"orden": 2, "descripcion": "paso", "tipo": "diagnostico"},\n'
-        '        {"orden": 3, "descripcion": "paso", "tipo": "reparacion"}\n'
-        "      ]\n"
-        "    }\n"
-        "  ],\n"
-        '  "feedback_coherencia": "evaluación de la coherencia del problema reportado"\n'
-        "}\n\n"
-        "REGLAS CRÍTICAS:\n"
-        "1. USA ÚNICAMENTE información del CONTEXTO proporcionado. NO inventes datos.\n"
-        "2. Cada 'rationale' DEBE citar fuentes específicas como [source:doc_id].\n"
-        "3. Los 'repuestos_sugeridos' y 'herramientas_sugeridas' deben estar mencionados o derivables del contexto.\n"
-        "4. Los 'pasos' DEBEN incluir:\n"
-        "   - INICIO: 3 pasos de seguridad (desconexión eléctrica, EPP, verificación de presión)\n"
-        "   - MEDIO: 3-5 pasos de diagnóstico específicos del problema\n"
-        "   - MEDIO: 2-4 pasos de reparación si aplica\n"
-        "   - FIN: 1 paso de seguridad final (verificación y prueba supervisada)\n"
-        "5. 'confidence' debe estar en [0,1] con 2 decimales.\n"
-        "6. Genera 1-3 fallas probables según la evidencia disponible.\n"
-        "7. Si el contexto es limitado, usa confidencias bajas (0.3-0.5) y sé explícito en el rationale.\n"
-        "8. Responde SOLO el JSON, sin explicaciones adicionales ni markdown."
+    # Limitar a top_k original después de reranking
+    return hits[:top_k]
+
+
+def _prepare_context(hits: List[Dict[str, Any]]) -> Tuple[str, int, bool, Dict[str, Any]]:
+    """Contexto del prompt (ver `services.orch.context_builder`).
+
+    Returns:
+        (context, context_length, low_evidence, context_signals)
+    """
+    context, stats = assemble_context(hits)
+    context_length = len(context)
+    low_evidence = len(hits) == 0 or (len(hits) < 2 and context_length < 200)
+    print(
+        f"🧩 Contexto: {stats['context_tokens']} tokens en {stats['passages']} pasajes "
+        f"({stats['tokens_saved']} ahorrados: {stats['merged']} fusionados, {stats['deduplicated']} duplicados)"
     )
+    context_signals = {
+        "context_tokens": stats["context_tokens"],
+        "tokens_saved": stats["tokens_saved"],
+        "context_assembly": stats,
+    }
+    return context, context_length, low_evidence, context_signals
+
+
+def _low_evidence_response(
+    hits: List[Dict[str, Any]], descripcion: str, context_length: int, context_signals: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """FALLBACK: respuesta heurística cuando no hay suficiente contexto."""
+    failure_context = _analyze_failure_context(hits, descripcion)
+    fallback_predictions = infer_from_hits(hits, descripcion)
     
-    equipment_info = f"Marca: {brand or 'N/A'}, Modelo: {model or 'N/A'}"
-    if equipo.get("categoria"):
+    return {
+        "fallas_probables": fallback_predictions,
+        "feedback_coherencia": "Análisis heurístico debido a evidencia limitada en KB. Se recomienda actualizar KB con más documentación.",
+        "fuentes": [h.get("doc_id") for h in hits],
+        "signals": {
+            "kb_hits": len(hits),
+            "context_length": context_length,
+            "low_evidence": True,
+            "fallback_used": True,
+            "llm_used": False,
+            **(context_signals or {}),
+        },
+        "quality_metrics": {
+            "context_relevance": 0.0,
+            "source_diversity": 0.0,
+            "prediction_confidence": 0.3
+        }
+    }
+
+
+def _build_user_prompt(
+    context: str, query: Dict[str, Any], equipo: Dict[str, Any], descripcion: str
+) -> str:
+    equipment_info = f"Marca: {query['brand'] or 'N/A'}, Modelo: {query['model'] or 'N/A'}"
+    if (equipo or {}).get("categoria"):
         equipment_info += f", Categoría: {equipo['categoria']}"
     
-    user_prompt = (
+    return (
         f"CONTEXTO TÉCNICO (extractos de manuales reales):\n"
         f"{context}\n\n"
         f"EQUIPO: {equipment_info}\n"
@@ -289,36 +342,53 @@ def predict_with_llm(mcp_url: str, descripcion: str, equipo: Dict[str, Any], top
         f"Analiza el contexto y genera diagnóstico basado ÚNICAMENTE en la información proporcionada."
     )
 
-    # 4. INVOCACIÓN del LLM
-    try:
-        llm = LLMClient()
-        raw = llm.complete_json(system_prompt, user_prompt)
-        data = _parse_json_safely(raw)
-    except Exception as e:
-        print(f"Error en LLM: {e}")
-        # Fallback si LLM falla
-        fallback_predictions = infer_from_hits(hits, descripcion)
-        return {
-            "fallas_probables": fallback_predictions,
-            "feedback_coherencia": f"Error en LLM: {str(e)}. Usando análisis heurístico.",
-            "fuentes": [h.get("doc_id") for h in hits],
-            "signals": {
-                "kb_hits": num_hits,
-                "context_length": context_length,
-                "low_evidence": False,
-                "fallback_used": True,
-                "llm_used": False,
-                "llm_error": str(e)
-            }
+
+def _llm_error_response(
+    hits: List[Dict[str, Any]],
+    descripcion: str,
+    context_length: int,
+    error: Exception,
+    context_signals: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    # Fallback si LLM falla
+    print(f"Error en LLM: {error}")
+    fallback_predictions = infer_from_hits(hits, descripcion)
+    return {
+        "fallas_probables": fallback_predictions,
+        "feedback_coherencia": f"Error en LLM: {str(error)}. Usando análisis heurístico.",
+        "fuentes": [h.get("doc_id") for h in hits],
+        "signals": {
+            "kb_hits": len(hits),
+            "context_length": context_length,
+            "low_evidence": False,
+            "fallback_used": True,
+            "llm_used": False,
+            "llm_error": str(error),
+            **(context_signals or {}),
         }
-    
-    # 5. VALIDACIÓN Y ENRIQUECIMIENTO
+    }
+
+
+def _has_source_citation(failure: Dict[str, Any]) -> bool:
+    return "[source:" in str(failure.get("rationale", ""))
+
+
+def _finalize_prediction(
+    data: Dict[str, Any],
+    hits: List[Dict[str, Any]],
+    descripcion: str,
+    context_length: int,
+    low_evidence: bool,
+    context_signals: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """VALIDACIÓN, enriquecimiento y señales de calidad de la respuesta del LLM."""
+    num_hits = len(hits)
     validated_failures = []
     for failure in data.get("fallas_probables", []):
         rationale = failure.get("rationale", "")
         
         # Validar que cite fuentes del contexto real
-        if "[source:" in rationale:
+        if _has_source_citation(failure):
             validated_failures.append(failure)
         elif low_evidence:
             # Permitir sin fuentes si evidencia es baja, pero ajustar confidence
@@ -333,7 +403,7 @@ def predict_with_llm(mcp_url: str, descripcion: str, equipo: Dict[str, Any], top
     
     data["fallas_probables"] = validated_failures
     
-    # 6. METADATA y señales de calidad
+    # METADATA y señales de calidad
     fuentes = [h.get("doc_id") for h in hits]
     data["fuentes"] = fuentes
     
@@ -343,7 +413,8 @@ def predict_with_llm(mcp_url: str, descripcion: str, equipo: Dict[str, Any], top
         "low_evidence": low_evidence,
         "fallback_used": False,
         "llm_used": True,
-        "validation_passed": len(validated_failures) > 0
+        "validation_passed": len(validated_failures) > 0,
+        **(context_signals or {}),
     }
     
     # Métricas de calidad
@@ -354,7 +425,161 @@ def predict_with_llm(mcp_url: str, descripcion: str, equipo: Dict[str, Any], top
         "prediction_confidence": round(avg_confidence, 2)
     }
     
-    # Agregar hits para que el endpoint pueda construir contextos
-    data["_raw_hits"] = hits
-    
     return data
+
+
+def predict_with_llm(
+    mcp_url: str,
+    descripcion: str,
+    equipo: Dict[str, Any],
+    top_k: int = 5,
+    transport: Any = None,
+) -> Dict[str, Any]:
+    """Genera predicción usando LLM con contexto de KB.
+    
+    Este es el FLUJO PRINCIPAL del sistema:
+    1. Recupera contexto relevante de KB usando embeddings semánticos
+    2. Construye prompt enriquecido con ese contexto
+    3. El LLM lee el contenido REAL de los manuales y genera respuesta
+    4. NO usa diccionarios estáticos - todo viene del contenido
+    
+    Versión bloqueante; la API usa `apredict_with_llm`.
+    
+    Args:
+        mcp_url: URL del servicio MCP con KB
+        descripcion: Descripción del problema reportado
+        equipo: Información del equipo (marca, modelo, etc)
+        top_k: Número de documentos a recuperar de KB
+        transport: Transporte a la KB (default: `get_kb_transport(mcp_url)`,
+            HTTP o in-process según KB_TRANSPORT)
+        
+    Returns:
+        Diccionario con predicción estructurada basada en contenido real
+    """
+    transport = transport or get_kb_transport(mcp_url)
+    stats = new_retrieval_stats()
+    query = _build_search_query(descripcion, equipo)
+    print(f"🎯 Modelo detectado: {query['model_normalized'] or 'N/A'}, boost={1.5 if query['model_normalized'] else 1.0}x")
+    hits = _retrieve_hits(transport, query["query_enriched"], top_k, stats)
+    hits = _apply_model_boost(hits, query["model_normalized"], top_k)
+    
+    context, context_length, low_evidence, context_signals = _prepare_context(hits)
+    if low_evidence:
+        return attach_retrieval(_low_evidence_response(hits, descripcion, context_length, context_signals), hits, stats)
+    
+    # GENERACIÓN: LLM analiza el contenido REAL de los manuales
+    user_prompt = _build_user_prompt(context, query, equipo, descripcion)
+    try:
+        raw = get_llm_client("diagnosis").complete_json(_DIAGNOSIS_SYSTEM_PROMPT, user_prompt)
+        data = _parse_json_safely(raw)
+    except Exception as e:
+        return attach_retrieval(_llm_error_response(hits, descripcion, context_length, e, context_signals), hits, stats)
+    
+    data = _finalize_prediction(data, hits, descripcion, context_length, low_evidence, context_signals)
+    return attach_retrieval(data, hits, stats)
+
+
+async def aretrieve_for_prediction(
+    mcp_url: str,
+    descripcion: str,
+    equipo: Dict[str, Any],
+    top_k: int = 5,
+    transport: Any = None,
+) -> Dict[str, Any]:
+    """Etapa de recuperación de `apredict_with_llm`: búsqueda híbrida + boost de modelo.
+
+    Returns:
+        Dict con "query" (ver `_build_search_query`), "hits" y "stats"
+        (contadores de `new_retrieval_stats`)
+    """
+    transport = transport or get_kb_transport(mcp_url)
+    stats = new_retrieval_stats()
+    query = _build_search_query(descripcion, equipo)
+    print(f"🎯 Modelo detectado: {query['model_normalized'] or 'N/A'}, boost={1.5 if query['model_normalized'] else 1.0}x")
+    hits = await _aretrieve_hits(transport, query["query_enriched"], top_k, stats)
+    hits = _apply_model_boost(hits, query["model_normalized"], top_k)
+    return {"query": query, "hits": hits, "stats": stats}
+
+
+async def agenerate_prediction(
+    descripcion: str,
+    equipo: Dict[str, Any],
+    query: Dict[str, Any],
+    hits: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Etapa de generación de `apredict_with_llm`: diagnóstico del LLM sobre `hits`.
+
+    El contexto se arma antes del primer `await`, así que otras etapas
+    concurrentes pueden anotar los mismos hits sin afectar el prompt.
+    """
+    context, context_length, low_evidence, context_signals = _prepare_context(hits)
+    if low_evidence:
+        return _low_evidence_response(hits, descripcion, context_length, context_signals)
+    
+    user_prompt = _build_user_prompt(context, query, equipo, descripcion)
+    try:
+        raw = await get_llm_client("diagnosis").acomplete_json(
+            _DIAGNOSIS_SYSTEM_PROMPT, user_prompt, timeout=stage_timeout("llm_generate")
+        )
+        data = _parse_json_safely(raw)
+    except Exception as e:
+        return _llm_error_response(hits, descripcion, context_length, e, context_signals)
+    
+    return _finalize_prediction(data, hits, descripcion, context_length, low_evidence, context_signals)
+
+
+async def astream_prediction(
+    descripcion: str,
+    equipo: Dict[str, Any],
+    query: Dict[str, Any],
+    hits: List[Dict[str, Any]],
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Variante en streaming de `agenerate_prediction`.
+
+    Emite ("falla", item) por cada elemento de `fallas_probables` que el LLM
+    termina de escribir y que cita fuentes (los que `_finalize_prediction`
+    conservaría), y al final ("prediction", data) con la respuesta validada
+    completa, que es la autoritativa (incluye el fallback heurístico si el
+    LLM falla o no cita fuentes).
+    """
+    context, context_length, low_evidence, context_signals = _prepare_context(hits)
+    if low_evidence:
+        yield "prediction", _low_evidence_response(hits, descripcion, context_length, context_signals)
+        return
+    
+    user_prompt = _build_user_prompt(context, query, equipo, descripcion)
+    parser = JSONArrayItemStream("fallas_probables")
+    chunks: List[str] = []
+    try:
+        async for chunk in get_llm_client("diagnosis").astream_json(
+            _DIAGNOSIS_SYSTEM_PROMPT, user_prompt, timeout=stage_timeout("llm_generate")
+        ):
+            chunks.append(chunk)
+            for failure in parser.feed(chunk):
+                if _has_source_citation(failure):
+                    yield "falla", failure
+        data = _parse_json_safely("".join(chunks))
+    except Exception as e:
+        yield "prediction", _llm_error_response(hits, descripcion, context_length, e, context_signals)
+        return
+    
+    yield "prediction", _finalize_prediction(data, hits, descripcion, context_length, low_evidence, context_signals)
+
+
+async def apredict_with_llm(
+    mcp_url: str,
+    descripcion: str,
+    equipo: Dict[str, Any],
+    top_k: int = 5,
+    transport: Any = None,
+) -> Dict[str, Any]:
+    """Versión asíncrona de `predict_with_llm`.
+    
+    Usa los pools HTTP compartidos (`services.orch.http_pool`) para el MCP y
+    el LLM, con timeouts por etapa, de modo que una llamada lenta al LLM no
+    retiene un thread del servidor. Mismo resultado que la versión bloqueante.
+    """
+    retrieval = await aretrieve_for_prediction(mcp_url, descripcion, equipo, top_k, transport)
+    hits = retrieval["hits"]
+    data = await agenerate_prediction(descripcion, equipo, retrieval["query"], hits)
+    return attach_retrieval(data, hits, retrieval["stats"])
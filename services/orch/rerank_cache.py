@@ -0,0 +1,172 @@
+"""Cache de resultados del re-ranker entre requests.
+
+Reportes de falla repetidos recuperan los mismos hits, y volver a re-rankearlos
+cuesta otra llamada al LLM (`RERANKER=llm`) o un forward del cross-encoder.
+La clave del cache es:
+
+- el re-ranker y su modelo,
+- la query normalizada (minúsculas, espacios colapsados), marca, modelo y top_k,
+- un hash independiente del orden de los candidatos: `doc_id` + huella del
+  texto que ve el re-ranker (`context` o `snippet`), así que un chunk
+  re-ingestado con otro contenido nunca reutiliza un score viejo.
+
+Las entradas expiran con `RERANK_CACHE_TTL` y el cache se vacía completo
+cuando cambia la generación de la KB. Esa generación llega junto con los hits
+de la búsqueda (`kb_generation`), sin otra llamada al MCP; si no se conoce
+(MCP viejo, búsqueda fallida) se re-rankea sin cache. Solo se guardan
+rankings con scores: los fallbacks (LLM caído, modelo sin cargar) no se
+cachean.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import os
+import threading
+
+from services.kb.lru_cache import LRUCache
+
+
+_SCORE_FIELDS = ("llm_relevance_score", "llm_confidence", "llm_explanation")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def candidates_fingerprint(candidates: List[Dict[str, Any]]) -> str:
+    """Hash del conjunto de candidatos (doc_id + huella de contenido), sin importar el orden."""
+    pairs = sorted(
+        (
+            str(c.get("doc_id", "")),
+            hashlib.sha1((c.get("context") or c.get("snippet", "")).encode("utf-8")).hexdigest(),
+        )
+        for c in candidates
+    )
+    digest = hashlib.sha256()
+    for doc_id, content_hash in pairs:
+        digest.update(f"{doc_id}\x00{content_hash}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RerankCache:
+    """LRU con TTL de rankings, invalidado por generación de la KB."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600) -> None:
+        self._cache = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds, name="rerank")
+        self._lock = threading.Lock()
+        self._generation: Any = None
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._cache.enabled
+
+    def _check_generation(self, generation: Any) -> None:
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    if self._generation is not None:
+                        self.invalidations += 1
+                        print(f"♻️  Cache de re-ranking invalidado (generación KB {self._generation} → {generation})")
+                    self._cache.clear()
+                    self._generation = generation
+
+    @staticmethod
+    def make_key(
+        reranker: Any,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        marca: Optional[str],
+        modelo: Optional[str],
+        top_k: int,
+    ) -> Tuple[Any, ...]:
+        return (
+            reranker.name,
+            getattr(reranker, "model_id", ""),
+            _normalize(query),
+            _normalize(marca),
+            _normalize(modelo),
+            top_k,
+            candidates_fingerprint(candidates),
+        )
+
+    def get(self, key: Tuple[Any, ...], candidates: List[Dict[str, Any]], generation: Any) -> Optional[List[Dict[str, Any]]]:
+        """Reconstruye el ranking guardado sobre los candidatos de este request."""
+        self._check_generation(generation)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        by_id = {c.get("doc_id"): c for c in candidates}
+        ranked: List[Dict[str, Any]] = []
+        for doc_id, fields in entry:
+            candidate = by_id.get(doc_id)
+            if candidate is None:
+                return None
+            candidate.update(fields)
+            ranked.append(candidate)
+        return ranked
+
+    def put(self, key: Tuple[Any, ...], ranked: List[Dict[str, Any]], generation: Any) -> bool:
+        """Guarda el orden y los scores; ignora resultados sin scores (fallbacks)."""
+        if not ranked or any("llm_relevance_score" not in c for c in ranked):
+            return False
+        # La KB cambió mientras se re-rankeaba: no guardar
+        if generation != self._generation:
+            return False
+        entry = tuple(
+            (c.get("doc_id"), {field: c[field] for field in _SCORE_FIELDS if field in c}) for c in ranked
+        )
+        self._cache.put(key, entry)
+        return True
+
+    async def arerank(
+        self,
+        reranker: Any,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        generation: Any = None,
+        marca: Optional[str] = None,
+        modelo: Optional[str] = None,
+        top_k: int = 8,
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """`reranker.arerank` con cache.
+
+        Args:
+            generation: Generación de la KB informada con los candidatos
+                (`stats["kb_generation"]`); None deshabilita el cache
+
+        Returns:
+            (hits re-rankeados, hit del cache)
+        """
+        if not self.enabled or not candidates or reranker.name == "none" or generation is None:
+            return await reranker.arerank(query, candidates, marca=marca, modelo=modelo, top_k=top_k), False
+
+        key = self.make_key(reranker, query, candidates, marca, modelo, top_k)
+        cached = self.get(key, candidates, generation)
+        if cached is not None:
+            print(f"⚡ Re-ranking desde cache ({len(cached)} hits)")
+            return cached, True
+        ranked = await reranker.arerank(query, candidates, marca=marca, modelo=modelo, top_k=top_k)
+        self.put(key, ranked, generation)
+        return ranked, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "kb_generation": self._generation, "invalidations": self.invalidations}
+
+
+_rerank_cache: Optional[RerankCache] = None
+_rerank_cache_lock = threading.Lock()
+
+
+def get_rerank_cache() -> RerankCache:
+    """Cache del proceso configurado por env (RERANK_CACHE_SIZE=0 lo deshabilita)."""
+    global _rerank_cache
+    with _rerank_cache_lock:
+        if _rerank_cache is None:
+            _rerank_cache = RerankCache(
+                max_entries=int(os.getenv("RERANK_CACHE_SIZE", "1000")),
+                ttl_seconds=float(os.getenv("RERANK_CACHE_TTL", "3600")),
+            )
+        return _rerank_cache
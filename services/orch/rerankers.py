@@ -0,0 +1,168 @@
+"""Re-rankers intercambiables para ordenar los hits de `contextos`.
+
+Se elige con `RERANKER`:
+
+- `cross-encoder` (default): cross-encoder local en CPU
+  (`services.orch.cross_encoder`), por lotes, decenas de ms por request.
+- `llm`: el LLM Re-Ranker (`services.orch.llm_reranker`), una llamada de
+  chat completion por request; queda como modo opt-in.
+- `none`: conserva el orden de la búsqueda.
+
+Todos exponen `rerank` / `arerank` con la firma de `rerank_with_llm` y
+anotan los mismos campos (`llm_relevance_score` 0-100, `llm_confidence`,
+`llm_explanation`), así que `contextos` no cambia de forma. El pipeline los
+llama a través de `services.orch.rerank_cache` (clave: re-ranker + `model_id`,
+query y candidatos).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+import threading
+import time
+
+from services.llm.client import get_llm_client
+from services.orch.llm_reranker import arerank_with_llm, rerank_with_llm
+
+
+RERANKERS = ("cross-encoder", "llm", "none")
+
+_rerankers: Dict[str, Any] = {}
+_rerankers_lock = threading.Lock()
+
+
+def _confidence_label(score: int) -> str:
+    if score >= 70:
+        return "Alta"
+    if score >= 40:
+        return "Media"
+    return "Baja"
+
+
+class CrossEncoderReranker:
+    """Re-ranking local con un cross-encoder (query, documento) por lotes."""
+
+    name = "cross-encoder"
+
+    def __init__(self) -> None:
+        self._model: Any = None
+        self._load_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self.batch_size = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+        self.max_chars = int(os.getenv("RERANK_MAX_CHARS", "2000"))
+        # Identifica los scores en el cache de re-ranking
+        self.model_id = "{}@{}".format(
+            os.getenv("RERANK_CROSS_ENCODER_MODEL", "default"),
+            os.getenv("RERANK_CROSS_ENCODER_BACKEND", "torch"),
+        )
+
+    def _get_model(self) -> Any:
+        if self._model is None and self._load_error is None:
+            with self._lock:
+                if self._model is None and self._load_error is None:
+                    from services.orch.cross_encoder import create_cross_encoder
+
+                    t0 = time.perf_counter()
+                    try:
+                        self._model = create_cross_encoder()
+                        print(f"✅ Cross-encoder {self._model.model_id} ({self._model.name}) cargado en {time.perf_counter() - t0:.1f}s")
+                    except Exception as e:
+                        # No reintentar en cada request (descarga/export fallidos)
+                        self._load_error = str(e)
+                        print(f"❌ No se pudo cargar el cross-encoder, se mantiene el orden de búsqueda: {e}")
+        return self._model
+
+    def warmup(self) -> None:
+        """Carga el modelo en segundo plano para que el primer request no la pague."""
+        threading.Thread(target=self._get_model, name="cross-encoder-warmup", daemon=True).start()
+
+    def rerank(
+        self,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        marca: str | None = None,
+        modelo: str | None = None,
+        top_k: int = 8,
+    ) -> List[Dict[str, Any]]:
+        if not candidates:
+            return []
+        model = self._get_model()
+        if model is None:
+            return candidates[:top_k]
+
+        full_query = " ".join(part for part in (marca, modelo, query) if part)
+        pairs = [
+            (full_query, (c.get("context") or c.get("snippet", ""))[: self.max_chars])
+            for c in candidates
+        ]
+        t0 = time.perf_counter()
+        try:
+            probabilities = model.predict(pairs, batch_size=self.batch_size)
+        except Exception as e:
+            print(f"❌ Error en cross-encoder: {e}")
+            return candidates[:top_k]
+
+        for candidate, probability in zip(candidates, probabilities):
+            score = int(round(float(probability) * 100))
+            candidate["llm_relevance_score"] = score
+            candidate["llm_confidence"] = _confidence_label(score)
+            candidate["llm_explanation"] = f"Relevancia estimada por cross-encoder: {score}%"
+        ranked = sorted(candidates, key=lambda c: c.get("llm_relevance_score", 0), reverse=True)
+        print(f"⚡ Cross-encoder: {len(pairs)} candidatos en {(time.perf_counter() - t0) * 1000:.0f} ms")
+        return ranked[:top_k]
+
+    async def arerank(self, query: str, candidates: List[Dict[str, Any]], **kwargs: Any) -> List[Dict[str, Any]]:
+        # Inferencia CPU bloqueante: fuera del event loop
+        return await asyncio.to_thread(self.rerank, query, candidates, **kwargs)
+
+
+class LLMReranker:
+    """LLM Re-Ranker (una llamada de chat completion por request)."""
+
+    name = "llm"
+
+    @property
+    def model_id(self) -> str:
+        return get_llm_client("rerank").model
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]], **kwargs: Any) -> List[Dict[str, Any]]:
+        return rerank_with_llm(query=query, candidates=candidates, **kwargs)
+
+    async def arerank(self, query: str, candidates: List[Dict[str, Any]], **kwargs: Any) -> List[Dict[str, Any]]:
+        return await arerank_with_llm(query=query, candidates=candidates, **kwargs)
+
+
+class NoReranker:
+    """Sin re-ranking: conserva el orden de la búsqueda."""
+
+    name = "none"
+    model_id = "none"
+
+    def rerank(
+        self, query: str, candidates: List[Dict[str, Any]], top_k: int = 8, **kwargs: Any
+    ) -> List[Dict[str, Any]]:
+        return candidates[:top_k]
+
+    async def arerank(
+        self, query: str, candidates: List[Dict[str, Any]], top_k: int = 8, **kwargs: Any
+    ) -> List[Dict[str, Any]]:
+        return candidates[:top_k]
+
+
+def get_reranker(name: str | None = None) -> Any:
+    """Re-ranker configurado (default: env RERANKER o "cross-encoder"); uno por proceso."""
+    name = (name or os.getenv("RERANKER", "cross-encoder")).lower()
+    if name in ("cross_encoder", "crossencoder", "local"):
+        name = "cross-encoder"
+    if name not in RERANKERS:
+        raise ValueError(f"RERANKER inválido: {name} (opciones: {', '.join(RERANKERS)})")
+    with _rerankers_lock:
+        if name not in _rerankers:
+            _rerankers[name] = {
+                "cross-encoder": CrossEncoderReranker,
+                "llm": LLMReranker,
+                "none": NoReranker,
+            }[name]()
+        return _rerankers[name]
@@ -18,7 +18,7 @@ from collections import Counter, defaultdict
 from dataclasses import dataclass
 from datetime import datetime
 
-from services.llm.client import LLMClient
+from services.llm.client import LLMClient, get_llm_client
 
 
 @dataclass
@@ -36,7 +36,7 @@ class TaxonomyAutoLearner:
     """Auto-aprendizaje inteligente de taxonomía con máxima extracción de valor."""
     
     def __init__(self, llm_client: Optional[LLMClient] = None):
-        self.llm = llm_client or LLMClient(agent="taxonomy")
+        self.llm = llm_client or get_llm_client("taxonomy")
         self.confidence_threshold = 0.7
         self.min_frequency = 2
         self.sensitive_patterns = self._load_sensitive_patterns()